@@ -0,0 +1,160 @@
+"""
+Checks and times the persistent FSM storage on both backends: SQLite in a temporary
+directory, and the Redis backend against a minimal in-process server speaking the
+Redis protocol (or a real server, if FSM_BENCH_REDIS_URL is set).
+
+    python benchmarks/bench_fsm_storage.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from utils.fsm_storage import PersistentStorage, RedisStateBackend, SqliteStateBackend
+
+
+class Flow(StatesGroup):
+    step = State()
+
+
+class RespStandIn:
+    """Just enough of the Redis protocol for RedisStateBackend: GET, SET [PX|EX], PTTL, DEL."""
+
+    def __init__(self):
+        self.values = {}  # key -> (value, expires_at or None)
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _live(self, key):
+        entry = self.values.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return entry
+
+    @staticmethod
+    async def _read_command(reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    async def _serve(self, reader, writer):
+        while (args := await self._read_command(reader)) is not None:
+            name, args = args[0].upper(), args[1:]
+            if name == b'GET':
+                entry = self._live(args[0])
+                writer.write(self._bulk(entry[0] if entry else None))
+            elif name == b'SET':
+                expires_at = None
+                if len(args) >= 4:
+                    unit = 1000 if args[2].upper() == b'PX' else 1
+                    expires_at = time.monotonic() + int(args[3]) / unit
+                self.values[args[0]] = (args[1], expires_at)
+                writer.write(b"+OK\r\n")
+            elif name == b'PTTL':
+                entry = self._live(args[0])
+                ttl = -2 if not entry else -1 if entry[1] is None else int((entry[1] - time.monotonic()) * 1000)
+                writer.write(b":%d\r\n" % ttl)
+            elif name == b'DEL':
+                writer.write(b":%d\r\n" % sum(self.values.pop(key, None) is not None for key in args))
+            else:  # PING, CLIENT SETINFO, SELECT, ...
+                writer.write(b"+OK\r\n")
+            await writer.drain()
+        writer.close()
+
+
+def key_for(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def check(make_backend, label: str):
+    storage = PersistentStorage(make_backend(), ttl=60, cache_size=1000)
+    key = key_for(42)
+    await storage.set_state(key, Flow.step)
+    await storage.update_data(key, {'deposit_amount': 5.0, 'product_list': ['a.session', 'b.session']})
+
+    # Survives a restart: a fresh storage (empty cache) over the same backend
+    await storage.backend.close()
+    storage = PersistentStorage(make_backend(), ttl=60, cache_size=1000)
+    assert await storage.get_state(key) == Flow.step.state, label
+    assert (await storage.get_data(key))['deposit_amount'] == 5.0, label
+
+    # Clearing deletes the record; short TTLs expire
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+    assert await storage.backend.load(storage.key_builder.build(key)) is None, label
+    short = PersistentStorage(storage.backend, ttl=0.2, cache_size=0)
+    await short.set_state(key, Flow.step)
+    await asyncio.sleep(0.3)
+    assert await short.get_state(key) is None, label
+
+    # The front cache stays bounded however many users pass through
+    bounded = PersistentStorage(storage.backend, ttl=60, cache_size=1000)
+    for user_id in range(5000):
+        await bounded.get_state(key_for(user_id))
+    assert bounded.stats().size == 1000, label
+    return storage
+
+
+async def timed(label: str, coro_factory, number: int) -> None:
+    started = time.perf_counter()
+    for i in range(number):
+        await coro_factory(i)
+    print(f"  {label:<34}{(time.perf_counter() - started) / number * 1e6:>10.1f} us")
+
+
+async def bench(storage: PersistentStorage, label: str, number: int = 2000):
+    print(label)
+    hot = key_for(7)
+    await storage.set_state(hot, Flow.step)
+    await timed("get_state (cached)", lambda i: storage.get_state(hot), number)
+    uncached = PersistentStorage(storage.backend, ttl=60, cache_size=0)
+    await timed("get_state (backend read)", lambda i: uncached.get_state(hot), number)
+    await timed("update_data (write-through)", lambda i: storage.update_data(hot, {'quantity': i}), number)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fsm_state.db')
+        sqlite = await check(lambda: SqliteStateBackend(path), 'sqlite')
+        await bench(sqlite, 'SQLite backend')
+        await sqlite.close()
+
+    stand_in = None
+    url = os.environ.get('FSM_BENCH_REDIS_URL')
+    if not url:
+        stand_in = RespStandIn()
+        url = await stand_in.start()
+    redis = await check(lambda: RedisStateBackend(url), 'redis')
+    await bench(redis, f"Redis backend ({'stand-in' if stand_in else url})")
+    await redis.close()
+    if stand_in:
+        await stand_in.stop()
+    print("All checks passed.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""
+Cost per Translator.get_string lookup: the previous implementation (fallback + format()
+on every call) against the compiled catalog.
+
+    python benchmarks/bench_localization.py
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.localization import LOCALES_DIR, Translator
+
+
+class LegacyTranslator:
+    """The implementation before the compiled catalog, kept here for comparison."""
+
+    def __init__(self, locales_dir: str):
+        self.locales = {}
+        for filename in os.listdir(locales_dir):
+            if filename.endswith(".json"):
+                with open(os.path.join(locales_dir, filename), "r", encoding="utf-8") as f:
+                    self.locales[filename.split(".")[0]] = json.load(f)
+
+    def get_string(self, key: str, lang: str, **kwargs) -> str:
+        lang = lang if lang in self.locales else "en"
+        base_string = self.locales.get(lang, {}).get(key)
+        if not base_string:
+            base_string = self.locales.get("en", {}).get(key, f"_{key}_")
+        return base_string.format(**kwargs)
+
+
+CASES = [
+    ("constant", "btn_check_stock", "ru", {}),
+    ("constant, en fallback", "btn_check_stock", "xx", {}),
+    ("template", "support_message", "en", {"support_contact": "@support"}),
+    ("missing key", "no_such_key", "en", {}),
+]
+
+
+def bench(translator, key, lang, kwargs, number):
+    get = translator.get_string
+    return min(timeit.repeat(lambda: get(key, lang, **kwargs), number=number, repeat=5)) / number * 1e9
+
+
+def main(number: int = 200_000):
+    legacy, compiled = LegacyTranslator(LOCALES_DIR), Translator(LOCALES_DIR)
+    print(f"{'case':<24}{'legacy ns':>12}{'compiled ns':>14}{'speedup':>10}")
+    for name, key, lang, kwargs in CASES:
+        assert legacy.get_string(key, lang, **kwargs) == compiled.get_string(key, lang, **kwargs), name
+        before = bench(legacy, key, lang, kwargs, number)
+        after = bench(compiled, key, lang, kwargs, number)
+        print(f"{name:<24}{before:>12.0f}{after:>14.0f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
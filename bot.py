@@ -4,19 +4,30 @@ from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand, BotCommandScopeChat, BotCommandScopeDefault, User as AiogramUser
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from sqlalchemy.exc import IntegrityError
-
-# --- Switch to Memory storage for Replit compatibility ---
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config_data.config import config
-from database.engine import async_engine, async_session_factory, DbSessionMiddleware
-from database.models import Base, User
+from database.engine import async_engine, async_session_factory, dialect_insert, DbSessionMiddleware, LazySession
+from database.models import User
+from database.schema import check_schema, SchemaOutdatedError
+from database.stats import stats_recorder
 from middlewares.channel_subscription import ChannelSubscriptionMiddleware
 from middlewares.ban_middleware import BanMiddleware
-from handlers import admin_handlers
+from middlewares.callback_codec import CallbackCodecMiddleware
+from handlers import admin_handlers, channel_members
 from handlers.user_handlers import start, main_menu, purchase, common_handlers
 from utils.currency_converter import currency_converter
+from utils.stock_index import stock_index
+from utils.reservations import reservations
+from utils.bundle_packer import bundle_packer
+from utils.sold_mover import sold_mover
+from utils.stock_drift import stock_drift_checker
+from utils.purchase_scheduler import purchase_scheduler
+from utils.user_cache import user_cache
+from utils.ban_list import ban_list
+from utils.profile_refresher import profile_refresher
+from utils.localization import translator
+from utils.fsm_storage import fsm_storage
+from utils.stock_snapshots import stock_snapshots
 
 # This new format creates clean, aligned columns for better readability.
 log_format = '[%(asctime)s] [%(levelname)-8s] [%(name)-24s]  %(message)s'
@@ -26,12 +37,20 @@ logger = logging.getLogger(__name__)
 
 class UserMiddleware(DbSessionMiddleware):
     async def __call__(self, handler, event, data):
-        async with self.session_pool() as session:
+        async with LazySession(self.session_pool) as session:
             data["session"] = session
 
             from_user: AiogramUser | None = data.get("event_from_user")
 
-            if not from_user:
+            # Channel join/leave events are not interactions with the bot
+            if not from_user or event.chat_member:
+                return await handler(event, data)
+
+            db_user = user_cache.get(from_user.id)
+            if db_user is not None:
+                session.add(db_user)  # Attached without a SELECT once the session is first used
+                profile_refresher.note(db_user, from_user.username, from_user.first_name)
+                data["user"] = db_user
                 return await handler(event, data)
 
             db_user = await session.get(User, from_user.id)
@@ -41,23 +60,28 @@ class UserMiddleware(DbSessionMiddleware):
                 if user_lang not in ['en', 'ru', 'zh']:
                     user_lang = 'en'
 
-                new_user = User(
-                    user_id=from_user.id,
-                    username=from_user.username,
-                    first_name=from_user.first_name,
-                    language_code=user_lang
-                )
-                session.add(new_user)
-                try:
-                    await session.commit()
-                    await session.refresh(new_user)
-                    db_user = new_user
+                # One statement, no failed transaction when the same user races itself
+                db_user = (await session.scalars(
+                    dialect_insert(User)
+                    .values(
+                        user_id=from_user.id,
+                        username=from_user.username,
+                        first_name=from_user.first_name,
+                        language_code=user_lang
+                    )
+                    .on_conflict_do_nothing(index_elements=[User.user_id])
+                    .returning(User)
+                )).one_or_none()
+                await session.commit()
+                if db_user:
+                    stats_recorder.record_new_user()
                     logger.info(f"New user created: {db_user.user_id} (@{db_user.username})")
-                except IntegrityError:
-                    logger.warning(f"Race condition on user creation for ID {from_user.id}. Fetching existing user.")
-                    await session.rollback()
+                else:
                     db_user = await session.get(User, from_user.id)
 
+            if db_user:
+                user_cache.put(db_user)
+                profile_refresher.note(db_user, from_user.username, from_user.first_name)
             data["user"] = db_user
 
             return await handler(event, data)
@@ -83,26 +107,43 @@ async def on_startup(bot: Bot):
     await set_bot_commands(bot)
     logger.info("Scoped bot commands have been set.")
     currency_converter.start_background_update()
+    async with async_session_factory() as session:
+        await ban_list.load(session)
+    await stock_index.start()
+    reservations.start()
+    await bundle_packer.start()
+    sold_mover.start()
+    stock_drift_checker.start()
+    profile_refresher.start()
+    stats_recorder.start()
+    translator.start()
+    fsm_storage.start()
+    stock_snapshots.start()
 
 async def main():
     logger.info("Starting bot...")
 
-    # --- Use Memory storage for Replit compatibility ---
-    storage = MemoryStorage()
-
-    dp = Dispatcher(storage=storage)
+    # Persistent, TTL-bounded FSM storage (see FSM_STORAGE); closed by the dispatcher on shutdown
+    dp = Dispatcher(storage=fsm_storage)
 
     dp.startup.register(on_startup)
 
-    async with async_engine.begin() as conn: await conn.run_sync(Base.metadata.create_all)
+    # The schema is owned by the migrations in migrations/ (`alembic upgrade head`)
+    try:
+        await check_schema(async_engine)
+    except SchemaOutdatedError as e:
+        logger.critical(str(e))
+        return
 
     # --- MIDDLEWARE ORDER IS CRITICAL ---
-    dp.update.middleware(UserMiddleware(session_pool=async_session_factory))
     dp.update.middleware(BanMiddleware())
-    dp.update.middleware(ChannelSubscriptionMiddleware(required_channels=config.required_channels, admin_ids=config.admin_ids))
+    dp.update.middleware(UserMiddleware(session_pool=async_session_factory))
+    dp.update.middleware(ChannelSubscriptionMiddleware(required_channels=config.required_channels, admin_ids=config.admin_ids, fail_open=config.subscription_fail_open))
+    dp.callback_query.outer_middleware(CallbackCodecMiddleware())
 
     # Include routers (admin handlers first for priority)
     dp.include_router(admin_handlers.router)
+    dp.include_router(channel_members.router)
     dp.include_router(start.router)
     dp.include_router(main_menu.router)
     dp.include_router(purchase.router)
@@ -113,10 +154,23 @@ async def main():
 
     try:
         await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        # chat_member updates are only delivered when requested explicitly
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         await bot.session.close()
         currency_converter.stop_background_update()
+        stock_index.stop()
+        reservations.stop()
+        bundle_packer.stop()
+        sold_mover.stop()
+        stock_drift_checker.stop()
+        purchase_scheduler.stop()
+        profile_refresher.stop()
+        stats_recorder.stop()
+        translator.stop()
+        stock_snapshots.stop()
+        await profile_refresher.flush()
+        await stats_recorder.flush()
 
 if __name__ == '__main__':
     try: asyncio.run(main())
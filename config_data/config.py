@@ -1,3 +1,5 @@
+from functools import cached_property
+
 from pydantic import SecretStr, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -6,21 +8,63 @@ class Settings(BaseSettings):
     admin_ids_str: str = Field(..., alias='ADMIN_IDS')
     required_channels_str: str = Field(..., alias='REQUIRED_CHANNELS')
     db_url: str = Field(..., alias='DB_URL')
+    # Connection pool (server databases only); sized for concurrent queries, not concurrent updates
+    db_pool_size: int = Field(5, alias='DB_POOL_SIZE')
+    db_max_overflow: int = Field(5, alias='DB_MAX_OVERFLOW')
+    db_pool_timeout: float = Field(30.0, alias='DB_POOL_TIMEOUT')
+    db_pool_recycle: int = Field(1800, alias='DB_POOL_RECYCLE')
+    db_pool_pre_ping: bool = Field(True, alias='DB_POOL_PRE_PING')
+    # asyncpg prepared statement cache per connection; set to 0 behind pgbouncer in transaction mode
+    db_statement_cache_size: int = Field(100, alias='DB_STATEMENT_CACHE_SIZE')
+    # SQLite, applied to every new connection
+    sqlite_synchronous: str = Field('NORMAL', alias='SQLITE_SYNCHRONOUS')
+    sqlite_busy_timeout_ms: int = Field(5000, alias='SQLITE_BUSY_TIMEOUT_MS')
+    sqlite_cache_size_kib: int = Field(65536, alias='SQLITE_CACHE_SIZE_KIB')
+    sqlite_mmap_size: int = Field(268435456, alias='SQLITE_MMAP_SIZE')
     admin_channel_id: int = Field(..., alias='ADMIN_CHANNEL_ID')
     support_contact: str = Field("@YourSupportUsername", alias='SUPPORT_CONTACT')
     api_id: int = Field(..., alias='API_ID')
     api_hash: str = Field(..., alias='API_HASH')
     # --- ADD THIS LINE ---
     crypto_bot_token: SecretStr = Field(..., alias='CRYPTO_BOT_TOKEN')
+    # Where session file bodies live: 'database' (session_blobs table) or 'local' (files under BLOB_STORE_DIR)
+    blob_store: str = Field('database', alias='BLOB_STORE')
+    blob_store_dir: str = Field('blob_store', alias='BLOB_STORE_DIR')
+    # Pre-packed delivery bundles for the most ordered (folder, quantity) combinations
+    bundle_packer_enabled: bool = Field(False, alias='BUNDLE_PACKER')
+    bundle_quantities_str: str = Field('1,5,10,50', alias='BUNDLE_QUANTITIES')
+    bundle_hot_skus: int = Field(4, alias='BUNDLE_HOT_SKUS')
+    bundle_pool_size: int = Field(2, alias='BUNDLE_POOL_SIZE')
+    # Purchases waiting per stock folder before new ones are turned away
+    purchase_queue_limit: int = Field(50, alias='PURCHASE_QUEUE_LIMIT')
+    # In-process cache of user rows used by the user middleware
+    user_cache_size: int = Field(10000, alias='USER_CACHE_SIZE')
+    user_cache_ttl: float = Field(60.0, alias='USER_CACHE_TTL')
+    # Channel membership checks: cache lifetimes and what to do when Telegram errors
+    subscription_positive_ttl: float = Field(600.0, alias='SUBSCRIPTION_POSITIVE_TTL')
+    subscription_negative_ttl: float = Field(30.0, alias='SUBSCRIPTION_NEGATIVE_TTL')
+    subscription_cache_size: int = Field(50000, alias='SUBSCRIPTION_CACHE_SIZE')
+    subscription_fail_open: bool = Field(True, alias='SUBSCRIPTION_FAIL_OPEN')
+    # FSM (conversation) state: 'sqlite' (file at FSM_STORAGE_PATH) or 'redis' (FSM_REDIS_URL); idle states expire after FSM_TTL seconds
+    fsm_storage: str = Field('sqlite', alias='FSM_STORAGE')
+    fsm_storage_path: str = Field('fsm_state.db', alias='FSM_STORAGE_PATH')
+    fsm_redis_url: str = Field('redis://localhost:6379/0', alias='FSM_REDIS_URL')
+    fsm_ttl: float = Field(86400.0, alias='FSM_TTL')
+    fsm_cache_size: int = Field(10000, alias='FSM_CACHE_SIZE')
 
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
     
-    @property
-    def admin_ids(self) -> list[int]:
-        return [int(admin_id.strip()) for admin_id in self.admin_ids_str.split(',')]
+    # Parsed once; these are checked on every update
+    @cached_property
+    def admin_ids(self) -> frozenset[int]:
+        return frozenset(int(admin_id.strip()) for admin_id in self.admin_ids_str.split(','))
     
+    @cached_property
+    def required_channels(self) -> tuple[str, ...]:
+        return tuple(channel.strip() for channel in self.required_channels_str.split(','))
+
     @property
-    def required_channels(self) -> list[str]:
-        return [channel.strip() for channel in self.required_channels_str.split(',')]
+    def bundle_quantities(self) -> list[int]:
+        return [int(qty.strip()) for qty in self.bundle_quantities_str.split(',') if qty.strip()]
 
 config = Settings()
\ No newline at end of file
@@ -0,0 +1,50 @@
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database.models import User
+
+# Every balance change is one conditional UPDATE ... RETURNING, so concurrent changes to
+# the same user are serialised by the database instead of overwriting each other as a
+# load-modify-store in Python would. Amounts stay Decimal end to end. None of these
+# commit: the change belongs to the caller's transaction (a claim, a deposit approval).
+
+
+def _as_decimal(amount) -> Decimal:
+    return amount if isinstance(amount, Decimal) else Decimal(str(amount))
+
+
+async def _apply(session: AsyncSession, stmt, user_id: int) -> Optional[Decimal]:
+    new_balance = (await session.execute(
+        stmt.returning(User.balance).execution_options(synchronize_session=False)
+    )).scalar_one_or_none()
+    if new_balance is None:
+        return None
+    new_balance = _as_decimal(new_balance)
+    # Keep a loaded User (e.g. the one the middleware attached) in step without a reload
+    user = session.identity_map.get(session.identity_key(User, user_id))
+    if user is not None:
+        set_committed_value(user, 'balance', new_balance)
+    return new_balance
+
+
+async def credit(session: AsyncSession, user_id: int, amount) -> Optional[Decimal]:
+    """Adds `amount` to the user's balance. Returns the new balance, or None if there is no such user."""
+    amount = _as_decimal(amount)
+    return await _apply(session, update(User).where(User.user_id == user_id).values(balance=User.balance + amount), user_id)
+
+
+async def debit(session: AsyncSession, user_id: int, amount) -> Optional[Decimal]:
+    """
+    Subtracts `amount` if the balance covers it. Returns the new balance, or None if the
+    balance is too low (or there is no such user), in which case nothing changed.
+    """
+    amount = _as_decimal(amount)
+    return await _apply(
+        session,
+        update(User).where(User.user_id == user_id, User.balance >= amount).values(balance=User.balance - amount),
+        user_id,
+    )
@@ -1,13 +1,155 @@
-from typing import Callable, Awaitable, Dict, Any
+from dataclasses import dataclass
+from typing import Callable, Awaitable, Dict, Any, List
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
 from config_data.config import config
 
-async_engine = create_async_engine(config.db_url)
+def _engine_options(url: str) -> Dict[str, Any]:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite':
+        return {}
+    # Sessions only check out a connection once a handler really queries, so the pool is
+    # sized for concurrent queries, not concurrent updates.
+    options = {
+        'pool_size': config.db_pool_size,
+        'max_overflow': config.db_max_overflow,
+        'pool_timeout': config.db_pool_timeout,
+        'pool_recycle': config.db_pool_recycle,
+        'pool_pre_ping': config.db_pool_pre_ping,
+    }
+    if parsed.get_driver_name() == 'asyncpg':
+        # SQLAlchemy's prepared statement cache and asyncpg's own; 0 disables both (needed behind pgbouncer)
+        options['connect_args'] = {
+            'prepared_statement_cache_size': config.db_statement_cache_size,
+            'statement_cache_size': config.db_statement_cache_size,
+        }
+    return options
+
+def _sqlite_pragmas() -> List[str]:
+    return [
+        "PRAGMA journal_mode=WAL",  # Readers no longer block on the writer (and vice versa)
+        f"PRAGMA synchronous={config.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={config.sqlite_busy_timeout_ms}",
+        f"PRAGMA cache_size=-{config.sqlite_cache_size_kib}",  # Negative means KiB, not pages
+        f"PRAGMA mmap_size={config.sqlite_mmap_size}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+def create_engine_for(url: str) -> AsyncEngine:
+    """Async engine tuned for the backend in `url`: pool settings for servers, per-connection pragmas for SQLite."""
+    engine = create_async_engine(url, **_engine_options(url))
+    if engine.dialect.name == 'sqlite':
+        pragmas = _sqlite_pragmas()
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+    return engine
+
+async_engine = create_engine_for(config.db_url)
 async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
 
+def dialect_insert(entity):
+    """INSERT construct for the active backend, exposing on_conflict_do_nothing/do_update."""
+    if async_engine.dialect.name == 'postgresql':
+        return postgresql.insert(entity)
+    return sqlite.insert(entity)
+
+@dataclass
+class SessionStats:
+    updates: int = 0
+    touched: int = 0
+
+    @property
+    def touched_ratio(self) -> float:
+        return self.touched / self.updates if self.updates else 0.0
+
+session_stats = SessionStats()
+
+class LazySession:
+    """
+    Stands in for the AsyncSession injected as `session`. The real session is created
+    on the first call that needs it and closed when the handler returns, so updates
+    that never query (dropped by a middleware, static screens) cost no session at all.
+
+    add()/add_all() of persistent objects (e.g. a cached user) are deferred until the
+    session is created; commit()/rollback()/close() without one are no-ops unless a
+    deferred object is new or has changes to flush.
+    """
+    __slots__ = ('_factory', '_session', '_pending')
+
+    def __init__(self, factory: async_sessionmaker):
+        self._factory = factory
+        self._session: AsyncSession | None = None
+        self._pending: List[Any] = []
+        session_stats.updates += 1
+
+    async def __aenter__(self) -> "LazySession":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def materialized(self) -> bool:
+        return self._session is not None
+
+    def _real(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._factory()
+            session_stats.touched += 1
+            for instance in self._pending:
+                self._session.add(instance)
+            self._pending.clear()
+        return self._session
+
+    def add(self, instance: Any, _warn: bool = True):
+        if self._session is None:
+            self._pending.append(instance)
+        else:
+            self._session.add(instance, _warn=_warn)
+
+    def add_all(self, instances):
+        for instance in instances:
+            self.add(instance)
+
+    def _has_pending_writes(self) -> bool:
+        for instance in self._pending:
+            state = inspect(instance)
+            if state.key is None or state.modified:
+                return True
+        return False
+
+    async def commit(self):
+        if self._session is None and not self._has_pending_writes():
+            return
+        await self._real().commit()
+
+    async def rollback(self):
+        if self._session is None:
+            return
+        await self._session.rollback()
+
+    async def close(self):
+        self._pending.clear()
+        if self._session is not None:
+            await self._session.close()
+
+    def __getattr__(self, name: str):
+        return getattr(self._real(), name)
+
 class DbSessionMiddleware(BaseMiddleware):
     def __init__(self, session_pool: async_sessionmaker): super().__init__(); self.session_pool = session_pool
     async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
-        async with self.session_pool() as session: data["session"] = session; return await handler(event, data)
\ No newline at end of file
+        async with LazySession(self.session_pool) as session:
+            data["session"] = session
+            return await handler(event, data)
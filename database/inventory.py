@@ -0,0 +1,144 @@
+from collections import Counter
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Iterable, List, Optional
+
+from sqlalchemy import select, insert, update, func, and_, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.balance import debit
+from database.models import Account, SoldFileMove, SyncManifest
+from database.stock_counters import adjust_stock_counts
+from database.stats import stats_recorder
+
+
+class PurchaseError(Exception):
+    """Base class for purchase failures that should be reported back to the buyer."""
+
+
+class InsufficientBalance(PurchaseError):
+    pass
+
+
+class OutOfStock(PurchaseError):
+    pass
+
+
+@dataclass(frozen=True)
+class ClaimedAccount:
+    id: int
+    phone_number: str
+    session_hash: str
+
+    @property
+    def file_name(self) -> str:
+        return f"{self.phone_number}.session"
+
+
+def _free_accounts(country_id: int, quantity: int, folder_name: Optional[str] = None):
+    """
+    Subquery picking `quantity` unsold, unbundled accounts of a country. With folder_name,
+    only accounts whose file the sync manifest places in that folder are picked: a country
+    can span several folders, and the sold file must be moved out of the one it is in.
+
+    On Postgres the rows are locked with FOR UPDATE SKIP LOCKED, so concurrent callers
+    lock disjoint rows without waiting on each other. SQLite ignores the locking clause;
+    there the enclosing UPDATE takes the database write lock, which serialises claims
+    (single writer) and re-evaluates this subquery under that lock.
+    """
+    stmt = select(Account.id).where(Account.country_id == country_id, Account.is_sold == False, Account.bundle_id.is_(None))
+    if folder_name is not None:
+        stmt = stmt.where(exists().where(SyncManifest.folder == folder_name, SyncManifest.file_name == Account.phone_number + '.session'))
+    return (
+        stmt
+        .order_by(Account.id)
+        .limit(quantity)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+
+
+async def _claim(session: AsyncSession, buyer_id: int, quantity: int, total_cost: Decimal, criterion, folder_name: Optional[str]) -> tuple[List[ClaimedAccount], Decimal]:
+    try:
+        new_balance = await debit(session, buyer_id, total_cost)
+        if new_balance is None:
+            raise InsufficientBalance()
+
+        rows = (await session.execute(
+            update(Account)
+            .where(criterion)
+            .values(is_sold=True, buyer_id=buyer_id, sold_date=func.now(), bundle_id=None)
+            .returning(Account.id, Account.phone_number, Account.session_hash, Account.country_id)
+            .execution_options(synchronize_session=False)
+        )).all()
+        if len(rows) != quantity:
+            raise OutOfStock()
+
+        sold = Counter(r.country_id for r in rows)
+        await adjust_stock_counts(session, {country_id: -n for country_id, n in sold.items()})
+
+        if folder_name is not None:
+            # Journal the file moves in the same transaction, so a crash can never leave
+            # a sold account's file behind in stock without a record of it
+            await session.execute(
+                insert(SoldFileMove),
+                [{'folder': folder_name, 'file_name': f"{r.phone_number}.session"} for r in rows],
+            )
+
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+
+    stats_recorder.record_sale(sold, total_cost)
+    claimed = [ClaimedAccount(id=r.id, phone_number=r.phone_number, session_hash=r.session_hash) for r in rows]
+    return claimed, new_balance
+
+
+async def claim_accounts(session: AsyncSession, country_id: int, buyer_id: int, quantity: int, total_cost: Decimal, folder_name: Optional[str] = None) -> tuple[List[ClaimedAccount], Decimal]:
+    """
+    Atomically debits the buyer and marks `quantity` free accounts of a country as sold
+    to them, in one transaction. If folder_name is given, only accounts in that folder are
+    claimed and the moves of their files into its sold folder are journaled in the same
+    transaction (see utils.sold_mover).
+    Returns the claimed accounts and the new balance.
+    Raises InsufficientBalance or OutOfStock after rolling the transaction back.
+    """
+    return await _claim(session, buyer_id, quantity, total_cost, Account.id.in_(_free_accounts(country_id, quantity, folder_name)), folder_name)
+
+
+async def claim_bundle(session: AsyncSession, bundle_id: str, buyer_id: int, quantity: int, total_cost: Decimal, folder_name: Optional[str] = None) -> tuple[List[ClaimedAccount], Decimal]:
+    """Like claim_accounts, but sells exactly the accounts reserved for a pre-packed bundle."""
+    return await _claim(session, buyer_id, quantity, total_cost, and_(Account.bundle_id == bundle_id, Account.is_sold == False), folder_name)
+
+
+async def reserve_bundle(session: AsyncSession, country_id: int, folder_name: str, bundle_id: str, quantity: int) -> List[ClaimedAccount]:
+    """Reserves `quantity` free accounts of a folder for a bundle. Returns [] if there are not enough."""
+    try:
+        rows = (await session.execute(
+            update(Account)
+            .where(Account.id.in_(_free_accounts(country_id, quantity, folder_name)))
+            .values(bundle_id=bundle_id)
+            .returning(Account.id, Account.phone_number, Account.session_hash)
+            .execution_options(synchronize_session=False)
+        )).all()
+        if len(rows) != quantity:
+            await session.rollback()
+            return []
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    return [ClaimedAccount(id=r.id, phone_number=r.phone_number, session_hash=r.session_hash) for r in rows]
+
+
+async def release_bundles(session: AsyncSession, bundle_ids: Iterable[str] = None):
+    """Returns bundle-reserved accounts to free stock (all bundles if bundle_ids is None)."""
+    stmt = update(Account).where(Account.bundle_id.is_not(None), Account.is_sold == False)
+    if bundle_ids is not None:
+        bundle_ids = list(bundle_ids)
+        if not bundle_ids:
+            return
+        stmt = stmt.where(Account.bundle_id.in_(bundle_ids))
+    await session.execute(stmt.values(bundle_id=None).execution_options(synchronize_session=False))
+    await session.commit()
@@ -1,5 +1,5 @@
 import datetime
-from sqlalchemy import (BigInteger, String, Numeric, DateTime, ForeignKey, Integer, Text, Boolean, func, LargeBinary, DECIMAL)
+from sqlalchemy import (BigInteger, String, Numeric, DateTime, ForeignKey, Integer, Text, Boolean, func, LargeBinary, DECIMAL, Index)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from typing import List, Optional
 
@@ -8,10 +8,10 @@ class Base(DeclarativeBase): pass
 class User(Base):
     __tablename__ = 'users'
     user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
-    username: Mapped[str] = mapped_column(String(32), nullable=True)
+    username: Mapped[str] = mapped_column(String(32), nullable=True, index=True)  # Admin lookup by @username
     first_name: Mapped[str] = mapped_column(String(64))
     balance: Mapped[float] = mapped_column(Numeric(10, 2), default=0.00)
-    registration_date: Mapped[datetime.datetime] = mapped_column(DateTime, default=func.now())
+    registration_date: Mapped[datetime.datetime] = mapped_column(DateTime, default=func.now(), index=True)  # New-user stats scan a range
     language_code: Mapped[str] = mapped_column(String(10), default='en')
     currency: Mapped[str] = mapped_column(String(5), default='USD')
     is_banned: Mapped[bool] = mapped_column(Boolean, default=False, index=True)
@@ -25,26 +25,40 @@ class Country(Base):
     code: Mapped[str] = mapped_column(String(10))
     flag_emoji: Mapped[str] = mapped_column(String(5))
     price_per_account: Mapped[float] = mapped_column(Numeric(10, 2))
-    stock_count: Mapped[int] = mapped_column(Integer, default=0)
+    stock_count: Mapped[int] = mapped_column(Integer, default=0, index=True)  # Unsold accounts; kept in step by every inventory write
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     accounts: Mapped[list["Account"]] = relationship(back_populates="country")
 
 class Account(Base):
     __tablename__ = 'accounts'
+    __table_args__ = (
+        Index('ix_accounts_country_id_is_sold', 'country_id', 'is_sold'),  # Stock counts, claims and sync per country
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     country_id: Mapped[int] = mapped_column(ForeignKey('countries.id'))
     phone_number: Mapped[str] = mapped_column(String(30), unique=True)
-    session_file: Mapped[bytes] = mapped_column(LargeBinary)
+    session_hash: Mapped[str] = mapped_column(String(64), index=True)  # Key into the session blob store
     tdata_path: Mapped[str] = mapped_column(Text, nullable=True)
     is_sold: Mapped[bool] = mapped_column(Boolean, default=False, index=True)
     added_date: Mapped[datetime.datetime] = mapped_column(DateTime, default=func.now())
-    buyer_id: Mapped[int] = mapped_column(ForeignKey('users.user_id'), nullable=True)
+    buyer_id: Mapped[int] = mapped_column(ForeignKey('users.user_id'), nullable=True, index=True)
     sold_date: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=True)
+    bundle_id: Mapped[str] = mapped_column(String(32), nullable=True, index=True)  # Set while reserved for a pre-packed bundle
     country: Mapped["Country"] = relationship(back_populates="accounts")
     buyer: Mapped["User"] = relationship()
 
+class SessionBlob(Base):
+    """Content-addressed session file bodies, kept off the hot accounts table."""
+    __tablename__ = 'session_blobs'
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+
 class Deposit(Base):
     __tablename__ = 'deposits'
+    __table_args__ = (
+        Index('ix_deposits_user_id_status', 'user_id', 'status'),
+        Index('ix_deposits_status_amount', 'status', 'amount'),  # Covering: income totals by status are read from the index alone
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.user_id'))
     amount: Mapped[float] = mapped_column(Numeric(10, 2))
@@ -65,4 +79,45 @@ class Withdrawal(Base):
     address: Mapped[str] = mapped_column(Text)
     status: Mapped[str] = mapped_column(String(20), default='pending', index=True) # e.g., pending, completed, rejected
     timestamp: Mapped[datetime.datetime] = mapped_column(DateTime, default=func.now())
-    user: Mapped["User"] = relationship()
\ No newline at end of file
+    user: Mapped["User"] = relationship()
+
+# --- Folder sync manifest (lets admin sync skip files that have not changed) ---
+class SyncFolder(Base):
+    __tablename__ = 'sync_folders'
+    folder: Mapped[str] = mapped_column(String(255), primary_key=True)
+    country_id: Mapped[int] = mapped_column(Integer, index=True)
+    mtime_ns: Mapped[int] = mapped_column(BigInteger)
+
+class SyncManifest(Base):
+    __tablename__ = 'sync_manifest'
+    folder: Mapped[str] = mapped_column(String(255), primary_key=True)
+    file_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    country_id: Mapped[int] = mapped_column(Integer, index=True)
+    size: Mapped[int] = mapped_column(BigInteger)
+    mtime_ns: Mapped[int] = mapped_column(BigInteger)
+    content_hash: Mapped[str] = mapped_column(String(64))
+
+# --- Write-ahead journal of sold files still to be moved into <folder>/sold ---
+class SoldFileMove(Base):
+    __tablename__ = 'sold_file_moves'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    folder: Mapped[str] = mapped_column(String(255))
+    file_name: Mapped[str] = mapped_column(String(255))
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=func.now())
+
+# --- Statistics rollups, updated in the same transaction as the events they count ---
+class StatsRollup(Base):
+    __tablename__ = 'stats_rollups'
+    period: Mapped[str] = mapped_column(String(10), primary_key=True)  # 'YYYY-MM-DD' (UTC) or 'all'
+    new_users: Mapped[int] = mapped_column(Integer, default=0)
+    deposits_approved: Mapped[int] = mapped_column(Integer, default=0)
+    approved_income: Mapped[float] = mapped_column(Numeric(14, 2), default=0)
+    accounts_sold: Mapped[int] = mapped_column(Integer, default=0)
+    sales_revenue: Mapped[float] = mapped_column(Numeric(14, 2), default=0)
+
+class CountrySalesRollup(Base):
+    __tablename__ = 'country_sales_rollups'
+    period: Mapped[str] = mapped_column(String(10), primary_key=True)  # 'YYYY-MM-DD' (UTC) or 'all'
+    country_id: Mapped[int] = mapped_column(Integer, primary_key=True)  # No foreign key: history outlives deleted countries
+    accounts_sold: Mapped[int] = mapped_column(Integer, default=0)
+    sales_revenue: Mapped[float] = mapped_column(Numeric(14, 2), default=0)
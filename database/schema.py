@@ -0,0 +1,53 @@
+import os
+from typing import Optional, Set
+
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alembic.ini')
+
+
+class SchemaOutdatedError(RuntimeError):
+    """The database is not at the latest migration; the bot must not run against it."""
+
+
+def _head_revisions() -> Set[str]:
+    return set(ScriptDirectory.from_config(Config(ALEMBIC_INI)).get_heads())
+
+
+def _legacy_revision(conn: Connection) -> Optional[str]:
+    """For a database made by create_all before migrations existed: the revision it matches."""
+    inspector = inspect(conn)
+    if not inspector.has_table('accounts'):
+        return None
+    columns = {column['name'] for column in inspector.get_columns('accounts')}
+    return '0001_initial' if 'session_file' in columns else '0002_inventory_schema'
+
+
+def _check(conn: Connection):
+    current = set(MigrationContext.configure(conn).get_current_heads())
+    heads = _head_revisions()
+    if current == heads:
+        return
+    if current:
+        raise SchemaOutdatedError(
+            f"Database schema is at {', '.join(sorted(current))}, expected {', '.join(sorted(heads))}. "
+            f"Run `alembic upgrade head` before starting the bot."
+        )
+    legacy = _legacy_revision(conn)
+    if legacy:
+        raise SchemaOutdatedError(
+            "Database was created without migrations. Mark its current schema and upgrade it with "
+            f"`alembic stamp {legacy} && alembic upgrade head`, then start the bot."
+        )
+    raise SchemaOutdatedError("Database is empty. Create the schema with `alembic upgrade head`, then start the bot.")
+
+
+async def check_schema(engine: AsyncEngine):
+    """Raises SchemaOutdatedError unless the database is at the latest migration head."""
+    async with engine.connect() as conn:
+        await conn.run_sync(_check)
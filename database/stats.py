@@ -0,0 +1,290 @@
+"""
+Per-day statistics rollups.
+
+Every event the admin statistics count is added to two rows: the UTC day it happened
+on ('YYYY-MM-DD') and the running total ('all'). Events are queued in memory by
+stats_recorder once their own transaction has committed, so a rolled-back purchase or
+approval never counts, and are added to the rollups in one transaction per interval.
+No purchase, registration or approval waits on the shared rollup rows, and the
+statistics screens read a handful of rows instead of aggregating whole tables.
+
+Events still queued when the process dies are lost. Existing data (or drifted rollups)
+is recomputed from the source tables with
+
+    python -m database.stats backfill
+
+which should run while the bot is stopped.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy import select, delete, insert, func, cast, String
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.engine import async_session_factory, dialect_insert
+from database.models import Account, Country, CountrySalesRollup, Deposit, StatsRollup, User
+
+logger = logging.getLogger(__name__)
+
+ALL = 'all'
+CENT = Decimal('0.01')
+FLUSH_INTERVAL = 10  # Seconds between rollup writes.
+
+STATS_FIELDS = ('new_users', 'deposits_approved', 'approved_income', 'accounts_sold', 'sales_revenue')
+COUNTRY_FIELDS = ('accounts_sold', 'sales_revenue')
+
+
+def day(when: datetime.date = None) -> str:
+    """The rollup period of a date; today (UTC) by default."""
+    return (when or datetime.datetime.now(datetime.timezone.utc).date()).isoformat()
+
+
+async def _bump(session: AsyncSession, model, rows: List[dict], fields: Tuple[str, ...]):
+    """Adds each row's `fields` to the row of `model` with the same primary key, creating it as needed."""
+    stmt = dialect_insert(model).values(rows)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[column.name for column in model.__table__.primary_key],
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in fields},
+    ))
+
+
+# --- Recording ---
+class StatsRecorder:
+    """
+    Collects counted events in memory and adds them to the rollups in one transaction
+    per interval. Call the record_* methods only after the event's transaction has
+    committed.
+    """
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        self.interval = interval
+        self._stats: Dict[str, Counter] = defaultdict(Counter)
+        self._countries: Dict[Tuple[str, int], Counter] = defaultdict(Counter)
+        self._task: Optional[asyncio.Task] = None
+
+    def _add(self, counters: Counter, values: Mapping[str, object]):
+        for name, value in values.items():
+            counters[name] += value
+
+    def _add_stats(self, values: Mapping[str, object]):
+        for period in (day(), ALL):
+            self._add(self._stats[period], values)
+
+    def record_new_user(self):
+        self._add_stats({'new_users': 1})
+
+    def record_deposit_approved(self, amount: Decimal):
+        self._add_stats({'deposits_approved': 1, 'approved_income': Decimal(str(amount))})
+
+    def record_sale(self, sold: Mapping[int, int], revenue: Decimal):
+        """Records one purchase: {country_id: accounts sold} and what the buyer paid for all of them."""
+        total = sum(sold.values())
+        if not total:
+            return
+        revenue = Decimal(str(revenue))
+        self._add_stats({'accounts_sold': total, 'sales_revenue': revenue})
+        # Split the price across countries by share of accounts; the last one takes the rounding remainder
+        remaining = revenue
+        for i, (country_id, n) in enumerate(sold.items()):
+            share = remaining if i == len(sold) - 1 else (revenue * n / total).quantize(CENT)
+            remaining -= share
+            for period in (day(), ALL):
+                self._add(self._countries[(period, country_id)], {'accounts_sold': n, 'sales_revenue': share})
+
+    async def flush(self) -> int:
+        """Writes the queued events. Returns the number of rollup rows touched."""
+        if not self._stats and not self._countries:
+            return 0
+        stats, self._stats = self._stats, defaultdict(Counter)
+        countries, self._countries = self._countries, defaultdict(Counter)
+        try:
+            async with async_session_factory() as session:
+                # Sorted, so concurrent writers lock the shared rows in the same order
+                if stats:
+                    await _bump(session, StatsRollup, [
+                        {'period': period, **{name: counters[name] for name in STATS_FIELDS}}
+                        for period, counters in sorted(stats.items())
+                    ], STATS_FIELDS)
+                if countries:
+                    await _bump(session, CountrySalesRollup, [
+                        {'period': period, 'country_id': country_id, **{name: counters[name] for name in COUNTRY_FIELDS}}
+                        for (period, country_id), counters in sorted(countries.items())
+                    ], COUNTRY_FIELDS)
+                await session.commit()
+        except Exception:
+            # Put the batch back with whatever was recorded meanwhile; retry next time
+            for key, counters in stats.items():
+                self._add(self._stats[key], counters)
+            for key, counters in countries.items():
+                self._add(self._countries[key], counters)
+            raise
+        return len(stats) + len(countries)
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Statistics flush failed: {e}")
+
+
+# --- Reading ---
+@dataclass(frozen=True)
+class StatsSummary:
+    total_users: int
+    new_users_today: int
+    approved_income: Decimal
+    accounts_sold: int
+    accounts_in_stock: int
+
+
+@dataclass(frozen=True)
+class CountrySales:
+    name: str
+    accounts_sold: int
+    sales_revenue: Decimal
+
+
+@dataclass(frozen=True)
+class DailyStats:
+    period: str
+    new_users: int
+    deposits_approved: int
+    approved_income: Decimal
+    accounts_sold: int
+    sales_revenue: Decimal
+    countries: Tuple[CountrySales, ...]
+
+
+async def load_summary(session: AsyncSession) -> StatsSummary:
+    rows = {r.period: r for r in (await session.execute(select(StatsRollup).where(StatsRollup.period.in_([ALL, day()])))).scalars()}
+    total, today = rows.get(ALL), rows.get(day())
+    in_stock = await session.scalar(select(func.coalesce(func.sum(Country.stock_count), 0)))
+    return StatsSummary(
+        total_users=total.new_users if total else 0,
+        new_users_today=today.new_users if today else 0,
+        approved_income=Decimal(str(total.approved_income)) if total else Decimal(0),
+        accounts_sold=total.accounts_sold if total else 0,
+        accounts_in_stock=in_stock,
+    )
+
+
+async def load_daily(session: AsyncSession, days: int) -> List[DailyStats]:
+    """The last `days` days, newest first, with each day's sales by country (best sellers first)."""
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    periods = [day(today - datetime.timedelta(days=i)) for i in range(days)]
+    rollups = {r.period: r for r in (await session.execute(select(StatsRollup).where(StatsRollup.period.in_(periods)))).scalars()}
+    by_country: Dict[str, List[CountrySales]] = defaultdict(list)
+    country_rows = await session.execute(
+        select(CountrySalesRollup, Country.name)
+        .outerjoin(Country, Country.id == CountrySalesRollup.country_id)
+        .where(CountrySalesRollup.period.in_(periods))
+        .order_by(CountrySalesRollup.accounts_sold.desc())
+    )
+    for rollup, name in country_rows:
+        by_country[rollup.period].append(CountrySales(name or f"#{rollup.country_id}", rollup.accounts_sold, Decimal(str(rollup.sales_revenue))))
+    result = []
+    for period in periods:
+        r = rollups.get(period)
+        result.append(DailyStats(
+            period=period,
+            new_users=r.new_users if r else 0,
+            deposits_approved=r.deposits_approved if r else 0,
+            approved_income=Decimal(str(r.approved_income)) if r else Decimal(0),
+            accounts_sold=r.accounts_sold if r else 0,
+            sales_revenue=Decimal(str(r.sales_revenue)) if r else Decimal(0),
+            countries=tuple(by_country[period]),
+        ))
+    return result
+
+
+# --- Backfill ---
+def _period_of(column):
+    return cast(func.date(column), String(10))
+
+
+def _rebuild(conn: Connection) -> int:
+    """
+    Recomputes every rollup from users, approved deposits and sold accounts. Deposits
+    count on the day they were made and sales at each country's current price, since
+    approval times and sale prices were never stored. Returns the number of rows written.
+    """
+    stats: Dict[str, dict] = defaultdict(lambda: {'new_users': 0, 'deposits_approved': 0, 'approved_income': Decimal(0), 'accounts_sold': 0, 'sales_revenue': Decimal(0)})
+    countries: Dict[Tuple[str, int], dict] = defaultdict(lambda: {'accounts_sold': 0, 'sales_revenue': Decimal(0)})
+
+    def add(row: dict, values: Mapping[str, object]):
+        for name, value in values.items():
+            row[name] += value
+
+    period = _period_of(User.registration_date)
+    for p, n in conn.execute(select(period, func.count()).group_by(period)):
+        for key in (p, ALL):
+            add(stats[key], {'new_users': n})
+
+    period = _period_of(Deposit.timestamp)
+    for p, n, amount in conn.execute(select(period, func.count(), func.sum(Deposit.amount)).where(Deposit.status == 'approved').group_by(period)):
+        for key in (p, ALL):
+            add(stats[key], {'deposits_approved': n, 'approved_income': Decimal(str(amount or 0))})
+
+    period = _period_of(func.coalesce(Account.sold_date, Account.added_date))
+    sales = conn.execute(
+        select(period, Account.country_id, func.count(), Country.price_per_account)
+        .join(Country, Country.id == Account.country_id)
+        .where(Account.is_sold == True)
+        .group_by(period, Account.country_id, Country.price_per_account)
+    )
+    for p, country_id, n, price in sales:
+        values = {'accounts_sold': n, 'sales_revenue': Decimal(str(price)) * n}
+        for key in (p, ALL):
+            add(stats[key], values)
+            add(countries[(key, country_id)], values)
+
+    conn.execute(delete(StatsRollup))
+    conn.execute(delete(CountrySalesRollup))
+    if stats:
+        conn.execute(insert(StatsRollup), [{'period': p, **values} for p, values in stats.items()])
+    if countries:
+        conn.execute(insert(CountrySalesRollup), [{'period': p, 'country_id': c, **values} for (p, c), values in countries.items()])
+    return len(stats) + len(countries)
+
+
+async def rebuild_stats(session: AsyncSession) -> int:
+    """Replaces all rollups with ones recomputed from the source tables. Does not commit."""
+    return await session.run_sync(lambda sync_session: _rebuild(sync_session.connection()))
+
+
+# Global instance
+stats_recorder = StatsRecorder()
+
+
+async def _main():
+    from database.engine import async_engine
+
+    parser = argparse.ArgumentParser(prog='python -m database.stats')
+    parser.add_argument('command', choices=['backfill'])
+    parser.parse_args()
+    async with async_session_factory() as session:
+        written = await rebuild_stats(session)
+        await session.commit()
+    await async_engine.dispose()
+    print(f"Statistics rebuilt: {written} rollup row(s) written.")
+
+
+if __name__ == '__main__':
+    asyncio.run(_main())
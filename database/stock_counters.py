@@ -0,0 +1,48 @@
+from typing import List, Mapping
+
+from sqlalchemy import select, update, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Account, Country
+
+# Country.stock_count is the number of unsold accounts of the country (bundle-reserved
+# ones included: they are still for sale). It is adjusted in the same transaction as
+# every statement that inserts, sells or deletes unsold accounts; in-memory buyer holds
+# never touch it and are subtracted at read time instead.
+
+
+async def adjust_stock_counts(session: AsyncSession, deltas: Mapping[int, int]):
+    """Applies {country_id: delta} to Country.stock_count. Does not commit."""
+    for country_id, delta in deltas.items():
+        if delta:
+            await session.execute(
+                update(Country)
+                .where(Country.id == country_id)
+                .values(stock_count=Country.stock_count + delta)
+                .execution_options(synchronize_session=False)
+            )
+
+
+def _unsold_count():
+    return (
+        select(func.count(Account.id))
+        .where(and_(Account.country_id == Country.id, Account.is_sold == False))
+        .scalar_subquery()
+    )
+
+
+async def repair_stock_counts(session: AsyncSession) -> List[int]:
+    """
+    Recomputes every drifted counter in one UPDATE ... RETURNING, so it cannot race a
+    concurrent claim the way a separate read-then-write would. Returns the ids of the
+    countries that were repaired. Does not commit.
+    """
+    unsold = _unsold_count()
+    result = await session.execute(
+        update(Country)
+        .where(Country.stock_count != unsold)
+        .values(stock_count=unsold)
+        .returning(Country.id)
+        .execution_options(synchronize_session=False)
+    )
+    return list(result.scalars().all())
@@ -1,5 +1,4 @@
 import io
-import os
 import shutil
 import zipfile
 import asyncio
@@ -12,8 +11,10 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery, Document
 from aiogram.enums import ContentType
-from sqlalchemy import select, func, delete
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import select, func, delete, update
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.ext.asyncio import AsyncSession
 from decimal import Decimal
 
@@ -21,7 +22,19 @@ from config_data.config import config
 from database.models import *
 from keyboards.admin_keyboards import *
 from utils.states import AdminStates
-from utils.stock_manager import get_country_name, ACCOUNTS_DIR
+from utils.stock_manager import ACCOUNTS_DIR
+from utils.account_sync import sync_accounts, forget_country
+from utils.bundle_packer import bundle_packer
+from utils.purchase_scheduler import purchase_scheduler
+from utils.user_cache import user_cache
+from utils.ban_list import ban_list
+from database.engine import session_stats
+from database.balance import credit, debit
+from database.stats import stats_recorder, load_summary, load_daily
+from utils.membership_cache import membership_cache
+from keyboards.cache import keyboard_cache
+from utils.fsm_storage import fsm_storage
+from utils.stock_snapshots import stock_snapshots
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -50,27 +63,90 @@ async def admin_panel_callback(cb: CallbackQuery, state: FSMContext):
 # --- Bot Statistics ---
 @router.callback_query(F.data == "admin_stats", admin_id_filter)
 async def admin_stats_callback(cb: CallbackQuery, session: AsyncSession):
-    total_users = await session.scalar(select(func.count(User.user_id)))
-    today = datetime.datetime.now(datetime.timezone.utc).date()
-    new_users_today = await session.scalar(select(func.count(User.user_id)).where(func.date(User.registration_date) == today))
-    
-    total_income_result = await session.execute(select(func.sum(Deposit.amount)).where(Deposit.status == 'approved'))
-    total_income = total_income_result.scalar_one_or_none() or 0.0
-    
-    sold_accounts = await session.scalar(select(func.count(Account.id)).where(Account.is_sold == True))
-    total_accounts = await session.scalar(select(func.count(Account.id)))
-    
+    # Read from the rollups (database.stats) rather than aggregating the tables
+    await stats_recorder.flush()
+    stats = await load_summary(session)
     stats_text = (
         "<b>📊 Bot Statistics</b>\n\n"
-        f"👥 <b>Total Users:</b> <code>{total_users}</code>\n"
-        f"✨ <b>New Users Today:</b> <code>{new_users_today}</code>\n"
+        f"👥 <b>Total Users:</b> <code>{stats.total_users}</code>\n"
+        f"✨ <b>New Users Today:</b> <code>{stats.new_users_today}</code>\n"
         f"---"
-        f"💰 <b>Total Approved Income:</b> <code>${float(total_income):.2f}</code>\n"
+        f"💰 <b>Total Approved Income:</b> <code>${float(stats.approved_income):.2f}</code>\n"
         f"---"
-        f"🛒 <b>Accounts Sold:</b> <code>{sold_accounts}</code>\n"
-        f"📦 <b>Total Accounts in DB:</b> <code>{total_accounts}</code>"
+        f"🛒 <b>Accounts Sold:</b> <code>{stats.accounts_sold}</code>\n"
+        f"📦 <b>Accounts in Stock:</b> <code>{stats.accounts_in_stock}</code>"
     )
-    await cb.message.edit_text(stats_text)
+    await cb.message.edit_text(stats_text, reply_markup=build_stats_keyboard())
+    await cb.answer()
+
+@router.callback_query(F.data == "admin_stats_daily", admin_id_filter)
+async def admin_stats_daily_callback(cb: CallbackQuery, session: AsyncSession):
+    await stats_recorder.flush()
+    lines = ["<b>📅 Last 7 Days</b> (UTC)"]
+    for d in await load_daily(session, days=7):
+        lines.append(
+            f"\n<b>{d.period}</b>\n"
+            f"  👥 {d.new_users} new | 💰 ${float(d.approved_income):.2f} from {d.deposits_approved} deposit(s)\n"
+            f"  🛒 {d.accounts_sold} sold for ${float(d.sales_revenue):.2f}"
+        )
+        lines.extend(f"    - {c.name}: {c.accounts_sold} (${float(c.sales_revenue):.2f})" for c in d.countries[:5])
+    await cb.message.edit_text("\n".join(lines), reply_markup=build_stats_daily_keyboard())
+    await cb.answer()
+
+# --- Runtime Metrics ---
+def _purchase_queue_lines() -> list[str]:
+    lanes = purchase_scheduler.snapshot()
+    if not lanes:
+        return ["  - No purchases yet."]
+    return [
+        f"  - <code>{lane.key}</code>: depth {lane.depth}{' (busy)' if lane.active else ''} | "
+        f"done {lane.metrics.completed} | failed {lane.metrics.failed} | rejected {lane.metrics.rejected} | "
+        f"wait avg {lane.metrics.avg_wait * 1000:.0f}ms max {lane.metrics.max_wait * 1000:.0f}ms | peak depth {lane.metrics.max_depth}"
+        for lane in lanes[:15]
+    ]
+
+@router.callback_query(F.data == "admin_runtime_metrics", admin_id_filter)
+async def admin_runtime_metrics_callback(cb: CallbackQuery):
+    lines = ["<b>📈 Runtime Metrics</b>", "", "<b>🛒 Purchase queues</b> (per folder)"]
+    lines.extend(_purchase_queue_lines())
+    cache = user_cache.stats()
+    lines += [
+        "", "<b>👤 User cache</b>",
+        f"  - Entries: {cache.size} / {user_cache.max_size} (TTL {user_cache.ttl:.0f}s)",
+        f"  - Hit ratio: {cache.hit_ratio:.1%} ({cache.hits} hits, {cache.misses} misses)",
+        f"  - Evictions: {cache.evictions} | Expired: {cache.expirations} | Invalidated: {cache.invalidations}",
+    ]
+    lines += [
+        "", "<b>🗄 Database sessions</b>",
+        f"  - Updates that touched the DB: {session_stats.touched} / {session_stats.updates} ({session_stats.touched_ratio:.1%})",
+    ]
+    membership = membership_cache.stats()
+    lines += [
+        "", "<b>📣 Channel membership cache</b>",
+        f"  - Entries: {membership.size} | Hit ratio: {membership.hit_ratio:.1%} ({membership.hits} hits, {membership.misses} misses)",
+        f"  - API errors: {membership.api_errors} (failing {'open' if config.subscription_fail_open else 'closed'})",
+    ]
+    keyboards = keyboard_cache.stats()
+    lines += [
+        "", "<b>⌨️ Keyboard cache</b>",
+        f"  - Markups: {keyboards.size} | Hit ratio: {keyboards.hit_ratio:.1%} ({keyboards.hits} hits, {keyboards.misses} misses)",
+        f"  - Cleared on locale reload: {keyboards.clears} time(s)",
+    ]
+    fsm = fsm_storage.stats()
+    lines += [
+        "", f"<b>💬 FSM state</b> ({config.fsm_storage}, idle TTL {fsm_storage.ttl:.0f}s)",
+        f"  - Cached keys: {fsm.size} / {fsm_storage.cache_size} | Hit ratio: {fsm.hit_ratio:.1%} ({fsm.hits} hits, {fsm.misses} misses)",
+        f"  - Writes: {fsm.writes} | Failed: {fsm.write_errors}",
+    ]
+    snapshots = stock_snapshots.stats()
+    lines += [
+        "", "<b>🗂 Stock snapshots</b>",
+        f"  - Live: {snapshots.snapshots} ({snapshots.products} product names) | Users on them: {snapshots.leases}",
+    ]
+    try:
+        await cb.message.edit_text("\n".join(lines), reply_markup=build_runtime_metrics_keyboard())
+    except TelegramBadRequest:
+        pass  # Unchanged since the last refresh
     await cb.answer()
 
 # --- View Deposits ---
@@ -133,6 +209,8 @@ async def admin_ban_user_callback(cb: CallbackQuery, session: AsyncSession):
         
     user_to_ban.is_banned = True
     await session.commit()
+    user_cache.put(user_to_ban)
+    ban_list.ban(user_id)
     
     await cb.answer(f"User {user_to_ban.first_name} has been banned.", show_alert=True)
     
@@ -159,6 +237,8 @@ async def admin_unban_user_callback(cb: CallbackQuery, session: AsyncSession):
         
     user_to_unban.is_banned = False
     await session.commit()
+    user_cache.put(user_to_unban)
+    ban_list.unban(user_id)
     
     await cb.answer(f"User {user_to_unban.first_name} has been unbanned.", show_alert=True)
     
@@ -197,18 +277,20 @@ async def admin_process_adjust_balance(message: Message, state: FSMContext, sess
     user = await session.get(User, data['managed_user_id'])
     
     if data['balance_action'] == 'add':
-        user.balance += amount
+        new_balance = await credit(session, user.user_id, amount)
         feedback = f"✅ Successfully added ${amount:.2f} to the balance of {user.first_name}."
     else: # remove
-        if amount > user.balance:
-            await message.answer(f"❌ Cannot remove ${amount:.2f}. User's balance is only ${user.balance:.2f}.")
+        new_balance = await debit(session, user.user_id, amount)
+        if new_balance is None:
+            balance = await session.scalar(select(User.balance).where(User.user_id == user.user_id))
+            await message.answer(f"❌ Cannot remove ${amount:.2f}. User's balance is only ${balance:.2f}.")
             return
-        user.balance -= amount
         feedback = f"✅ Successfully removed ${amount:.2f} from the balance of {user.first_name}."
     
     await session.commit()
+    user_cache.put(user)
     await state.clear()
-    await message.answer(f"{feedback}\n\nNew Balance: <code>${user.balance:.2f}</code>")
+    await message.answer(f"{feedback}\n\nNew Balance: <code>${new_balance:.2f}</code>")
     await message.answer("👤 <b>User Management</b>", reply_markup=build_user_management_keyboard())
 
 # --- Messaging (BROADCAST) - ADVANCED ---
@@ -467,14 +549,16 @@ async def admin_delete_country_select_callback(cb: CallbackQuery, session: Async
 @router.callback_query(F.data.startswith("admin_delete_country_confirm_"), admin_id_filter)
 async def admin_delete_country_confirm_callback(cb: CallbackQuery, session: AsyncSession):
     country_id = int(cb.data.split('_')[-1])
-    country = await session.get(Country, country_id, options=[selectinload(Country.accounts)])
+    country = await session.get(Country, country_id)
     if not country:
         await cb.answer("Country not found, cannot delete.", show_alert=True)
         await cb.message.edit_text("🌍 <b>Country Management</b>", reply_markup=build_country_management_keyboard())
         return
     country_name = country.name
     country_flag = country.flag_emoji
+    await bundle_packer.invalidate_country(country_id, country_name)
     await session.execute(delete(Account).where(Account.country_id == country_id))
+    await forget_country(session, country_id)
     await session.delete(country)
     await session.commit()
     await cb.message.edit_text(
@@ -518,57 +602,21 @@ async def add_country_price_received(m: Message, state: FSMContext, session: Asy
         
 @router.callback_query(F.data == "admin_sync_from_folders", admin_id_filter)
 async def admin_sync_from_folders_callback(cb: CallbackQuery, session: AsyncSession):
-    await cb.message.edit_text("⏳ Starting full synchronization... This may take a moment.")
+    await cb.message.edit_text("⏳ Starting synchronization... This may take a moment.")
     await cb.answer()
 
-    def sync_logic(all_countries, all_db_phones):
-        countries_map_sync = {c.name: c for c in all_countries}
-        disk_phones_sync = set()
-        accounts_to_add_sync = []
-        unmatched_folders_sync = set()
-        added_count_sync = 0
-        if not os.path.isdir(ACCOUNTS_DIR):
-            os.makedirs(ACCOUNTS_DIR)
-            return None, "created_dir", None, None
-        for folder_name in os.listdir(ACCOUNTS_DIR):
-            if folder_name.lower() == 'sold': continue
-            folder_path = os.path.join(ACCOUNTS_DIR, folder_name)
-            if not os.path.isdir(folder_path): continue
-            country_name = get_country_name(folder_name)
-            if country_name not in countries_map_sync:
-                unmatched_folders_sync.add(folder_name)
-                continue
-            country = countries_map_sync[country_name]
-            for file_name in os.listdir(folder_path):
-                if file_name.lower() == 'sold' or not file_name.lower().endswith('.session'):
-                    continue
-                phone_number = os.path.splitext(file_name)[0]
-                disk_phones_sync.add(phone_number)
-                if phone_number not in all_db_phones:
-                    file_path = os.path.join(folder_path, file_name)
-                    try:
-                        with open(file_path, 'rb') as f:
-                            session_data = f.read()
-                        accounts_to_add_sync.append({
-                            'country_id': country.id,
-                            'phone_number': phone_number,
-                            'session_file': session_data
-                        })
-                        added_count_sync += 1
-                    except Exception as e:
-                        logger.error(f"Error reading file {file_path}: {e}")
-        return disk_phones_sync, accounts_to_add_sync, unmatched_folders_sync, added_count_sync
-
-    all_countries_res = await session.execute(select(Country))
-    all_countries = all_countries_res.scalars().all()
-    all_db_phones_res = await session.execute(select(Account.phone_number))
-    all_db_phones = {phone[0] for phone in all_db_phones_res.fetchall()}
-
-    disk_phones, accounts_to_add_data, unmatched_folders, added_count = await asyncio.to_thread(
-        sync_logic, all_countries, all_db_phones
-    )
+    async def report_progress(text: str):
+        try:
+            await cb.message.edit_text(text)
+        except TelegramBadRequest:
+            pass
+
+    report = await sync_accounts(session, report_progress)
+    # Bundled archives of resynced folders may hold stale or removed sessions
+    await bundle_packer.invalidate_folders(report.changed_folders)
+    bundle_packer.notify_stock_changed()
 
-    if disk_phones is None and accounts_to_add_data == "created_dir":
+    if report.created_dir:
         await cb.message.edit_text(
             f"⚠️ Warning: Directory `{ACCOUNTS_DIR}` not found. I've created it. "
             "Please add account folders and files, then sync again.",
@@ -576,31 +624,17 @@ async def admin_sync_from_folders_callback(cb: CallbackQuery, session: AsyncSess
         )
         return
 
-    if accounts_to_add_data:
-        new_accounts = [Account(**data) for data in accounts_to_add_data]
-        session.add_all(new_accounts)
-
-    db_unsold_phones_res = await session.execute(select(Account.phone_number).where(Account.is_sold == False))
-    db_unsold_phones = {phone[0] for phone in db_unsold_phones_res.fetchall()}
-    
-    phones_to_delete = db_unsold_phones - disk_phones
-    deleted_count = len(phones_to_delete)
-    if phones_to_delete:
-        await session.execute(delete(Account).where(Account.phone_number.in_(phones_to_delete)))
-
-    await session.commit()
-
-    for country in all_countries:
-        count_res = await session.execute(select(func.count(Account.id)).where(Account.country_id == country.id, Account.is_sold == False))
-        country.stock_count = count_res.scalar_one()
-    
-    await session.commit()
-
-    report_lines = [f"✅ <b>Synchronization Complete!</b>", f"  - New Accounts Added: {added_count}", f"  - Stale Accounts Removed: {deleted_count}"]
-    if unmatched_folders:
+    report_lines = [
+        f"✅ <b>Synchronization Complete!</b>",
+        f"  - New Accounts Added: {report.added}",
+        f"  - Changed Accounts Updated: {report.updated}",
+        f"  - Stale Accounts Removed: {report.removed}",
+        f"  - Folders Rescanned: {len(report.changed_folders)} (unchanged: {report.folders_skipped})",
+    ]
+    if report.unmatched_folders:
         report_lines.append("\n⚠️ <b>Unmatched Folders:</b>")
         report_lines.append("These folders do not have a matching country in the database. Please add them via 'Country Management'.")
-        report_lines.extend([f"  - <code>{f}</code>" for f in unmatched_folders])
+        report_lines.extend([f"  - <code>{f}</code>" for f in report.unmatched_folders])
     
     await cb.message.edit_text("\n".join(report_lines), reply_markup=build_account_management_keyboard())
 
@@ -614,19 +648,33 @@ async def channel_deposit_callbacks(cb: CallbackQuery, session: AsyncSession, bo
         await cb.answer("❌ Already processed.", True)
         return
 
+    # Conditional on the status, so two admins tapping at once cannot both settle (and credit) it
+    new_status = 'approved' if is_approve else 'rejected'
+    settled = await session.scalar(
+        update(Deposit).where(Deposit.id == dep.id, Deposit.status == 'pending').values(status=new_status)
+        .returning(Deposit.id).execution_options(synchronize_session=False)
+    )
+    if settled is None:
+        await cb.answer("❌ Already processed.", True)
+        return
+    set_committed_value(dep, 'status', new_status)
+
     user = await session.get(User, dep.user_id)
     feedback, failed = "", False
     if is_approve:
-        user.balance = Decimal(str(float(user.balance or 0.0) + float(dep.amount)))
-        dep.status, status, icon = 'approved', "APPROVED", "✅"
+        await credit(session, user.user_id, dep.amount)
+        status, icon = "APPROVED", "✅"
         notify_text = f"🎉 <b>Deposit Approved!</b>\n<b>${float(dep.amount):.2f}</b> added to your balance."
         feedback = f"Deposit #{dep.id} approved."
     else:
-        dep.status, status, icon = 'rejected', "REJECTED", "❌"
+        status, icon = "REJECTED", "❌"
         notify_text = "❗️ <b>Deposit Rejected</b>"
         feedback = f"Deposit #{dep.id} rejected."
     
     await session.commit()
+    if is_approve:
+        stats_recorder.record_deposit_approved(dep.amount)
+    user_cache.put(user)
     
     try:
         await bot.send_message(user.user_id, notify_text)
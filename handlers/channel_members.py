@@ -0,0 +1,20 @@
+from aiogram import Router
+from aiogram.types import ChatMemberUpdated
+
+from config_data.config import config
+from utils.membership_cache import membership_cache, channel_key, MEMBER_STATUSES
+
+router = Router()
+
+_required = {channel_key(channel): channel for channel in config.required_channels}
+
+@router.chat_member()
+async def required_channel_member_updated(event: ChatMemberUpdated):
+    """Keeps the membership cache current when someone joins or leaves a required channel."""
+    candidates = [str(event.chat.id)]
+    if event.chat.username:
+        candidates.append(f"@{event.chat.username}")
+    for candidate in candidates:
+        channel = _required.get(channel_key(candidate))
+        if channel:
+            membership_cache.set(event.new_chat_member.user.id, channel, event.new_chat_member.status in MEMBER_STATUSES)
@@ -7,6 +7,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from keyboards.user_keyboards import build_main_menu_keyboard
 from database.models import User
 from utils.localization import translator
+from utils.reservations import reservations
+from utils.stock_snapshots import stock_snapshots
 
 router = Router()
 
@@ -22,6 +24,8 @@ async def cmd_cancel(event: Message | CallbackQuery, state: FSMContext, session:
         message_to_send = translator.get_string("cancel_success", lang)
     
     await state.clear()
+    reservations.release(user.user_id)
+    stock_snapshots.release(user.user_id)
     
     message_to_use = event if isinstance(event, Message) else event.message
     
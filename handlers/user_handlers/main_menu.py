@@ -1,64 +1,73 @@
 import logging
-import os
 from aiogram import Router, F, Bot
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, update
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from decimal import Decimal
 
 from config_data.config import config
 from database.models import *
+from database.balance import credit
+from database.stats import stats_recorder
 from keyboards.user_keyboards import *
 from keyboards.purchase_keyboards import *
 from keyboards.admin_keyboards import build_deposit_management_keyboard
+from keyboards.callbacks import *
 from utils.payment_texts import *
 from utils.payment_texts import get_deposit_instructions
 from utils.states import DepositStates, BrowsingStates, WithdrawalStates
 from utils.crypto_bot_api import CryptoBotAPI
 from utils.localization import translator
 from utils.currency_converter import currency_converter
-from utils.stock_manager import ACCOUNTS_DIR, get_live_stock
+from utils.stock_index import stock_index, FolderStock
+from utils.stock_snapshots import stock_snapshots
+from utils.reservations import reservations
+from utils.user_cache import user_cache
+from utils.callback_codec import CallbackTable
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 router.callback_query.filter(F.message.chat.type == "private")
+callbacks = CallbackTable(router)
 
 # --- Enhanced Stock Management ---
-def get_folder_structure():
-    """Get hierarchical folder structure with stock counts"""
-    if not os.path.exists(ACCOUNTS_DIR):
-        os.makedirs(ACCOUNTS_DIR)
-        return {}
-
-    folder_info = {}
-    try:
-        for folder_name in os.listdir(ACCOUNTS_DIR):
-            folder_path = os.path.join(ACCOUNTS_DIR, folder_name)
-            if os.path.isdir(folder_path):
-                session_files = [f for f in os.listdir(folder_path) 
-                               if f.endswith('.session') and not f.startswith('sold')]
-                if session_files:
-                    folder_info[folder_name] = len(session_files)
-    except Exception as e:
-        logger.error(f"Error scanning folders: {e}")
+async def get_folder_structure(session: AsyncSession):
+    """
+    Get folder stock counts from the countries' stock counters (one indexed read), net of
+    active holds. A country whose stock is split over several folders falls back to the
+    per-folder counts of the stock index.
+    """
+    rows = (await session.execute(select(Country.name, Country.stock_count).where(Country.stock_count > 0))).all()
+    counts = {}
+    for country_name, stock in rows:
+        folder_names = stock_index.folders_for_country(country_name)
+        if len(folder_names) == 1:
+            counts[folder_names[0]] = stock
+        else:
+            for folder_name in folder_names:
+                counts[folder_name] = stock_index.count(folder_name)
+    return reservations.available_counts(dict(sorted(counts.items())))
+
+async def show_products(cb: CallbackQuery, state: FSMContext, user: User, folder: FolderStock):
+    """Shows a folder's product list, pinning its current snapshot so later indexes refer to this list."""
+    snapshot_id = stock_snapshots.pin(user.user_id, folder)
+    await state.set_state(BrowsingStates.viewing_products)
+    await state.update_data(current_folder=folder.name, snapshot_id=snapshot_id)
 
-    return folder_info
+    # Extract country info for pricing (default $1.50)
+    price_per_item = 1.5
 
-def get_products_in_folder(folder_name: str):
-    """Get list of available products in a specific folder"""
-    folder_path = os.path.join(ACCOUNTS_DIR, folder_name)
-    if not os.path.exists(folder_path):
-        return []
+    display_name = folder.name.replace('+', '').replace('_', ' ').title()
+    text = (f"📱 <b>{display_name}</b>\n\n"
+            f"The following is a list of products:\n\n"
+            f"Select a product to configure your purchase:")
 
-    try:
-        return [f for f in os.listdir(folder_path) 
-                if f.endswith('.session') and not f.startswith('sold')]
-    except Exception:
-        return []
+    await cb.message.edit_text(text, reply_markup=build_products_keyboard(folder.name, folder.products, price_per_item))
 
 # --- Handler Functions ---
 async def add_funds_handler(message: Message, user: User, state: FSMContext, **kwargs):
@@ -78,7 +87,7 @@ async def add_funds_handler(message: Message, user: User, state: FSMContext, **k
 async def check_stock_handler(message: Message, session: AsyncSession, user: User, state: FSMContext, **kwargs):
     logger.info(f"User {user.user_id} (@{user.username}) -> Browse Products")
 
-    folder_info = get_folder_structure()
+    folder_info = await get_folder_structure(session)
 
     if not folder_info:
         return await message.answer("📦 <b>No products available</b>\n\nOur store is currently restocking. Please check back later!")
@@ -127,83 +136,97 @@ async def settings_handler(message: Message, user: User, **kwargs):
     await message.answer(text, reply_markup=build_settings_keyboard(user.language_code))
 
 # --- Central Text Router ---
+MAIN_MENU_BUTTONS = {
+    "btn_check_stock": check_stock_handler,
+    "btn_add_funds": add_funds_handler,
+    "btn_my_account": my_account_handler,
+    "btn_help_faq": help_handler,
+    "btn_contact_support": support_handler,
+    "btn_settings": settings_handler,
+}
+
+_button_dispatch = (0, {})  # (translator generation, {label: handler})
+
+def get_button_dispatch() -> dict:
+    """Maps every main menu button label, in every loaded language, to its handler.
+    Rebuilt only when the locales were (re)loaded."""
+    global _button_dispatch
+    generation, table = _button_dispatch
+    if generation != translator.generation:
+        table = {}
+        for key, handler_func in MAIN_MENU_BUTTONS.items():
+            for label in translator.get_all_translations(key).values():
+                table.setdefault(label, handler_func)
+        _button_dispatch = (translator.generation, table)
+    return table
+
 @router.message(F.text)
 async def main_menu_text_router(message: Message, session: AsyncSession, user: User, state: FSMContext, bot: Bot):
-    lang = user.language_code
-    text = message.text
-
-    button_to_handler_map = {
-        translator.get_string("btn_check_stock", lang): check_stock_handler,
-        translator.get_string("btn_add_funds", lang): add_funds_handler,
-        translator.get_string("btn_my_account", lang): my_account_handler,
-        translator.get_string("btn_help_faq", lang): help_handler,
-        translator.get_string("btn_contact_support", lang): support_handler,
-        translator.get_string("btn_settings", lang): settings_handler,
-    }
-
-    handler_func = button_to_handler_map.get(text)
+    # Matches labels of any language, so a keyboard left over from before a language change still works
+    handler_func = get_button_dispatch().get(message.text)
 
     if handler_func:
         # Silent cancel - clear any existing state when user clicks main menu buttons
         current_state = await state.get_state()
         if current_state is not None:
             await state.clear()
+            reservations.release(user.user_id)
+            stock_snapshots.release(user.user_id)
             logger.info(f"User {user.user_id} silently cancelled state {current_state}")
 
         await handler_func(message=message, session=session, user=user, state=state, bot=bot)
     else:
-        logger.warning(f"User {user.user_id} sent unhandled text: '{text}'")
+        logger.warning(f"User {user.user_id} sent unhandled text: '{message.text}'")
 
 # --- Browse Products Callbacks ---
-@router.callback_query(F.data.startswith("browse_category_"))
-async def browse_category_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    folder_name = cb.data.replace("browse_category_", "")
-    products = get_products_in_folder(folder_name)
+@callbacks(BROWSE_CATEGORY)
+async def browse_category_handler(cb: CallbackQuery, state: FSMContext, user: User, folder_name: str):
+    folder = stock_index.get(folder_name)
 
-    if not products:
+    if not folder or not folder.products:
         await cb.answer("❌ No products available in this category", show_alert=True)
         return
 
-    await state.set_state(BrowsingStates.viewing_products)
-    await state.update_data(current_folder=folder_name, product_list=products)
-
-    # Extract country info for pricing (default $1.50)
-    price_per_item = 1.5
-
-    display_name = folder_name.replace('+', '').replace('_', ' ').title()
-    text = (f"📱 <b>{display_name}</b>\n\n"
-            f"The following is a list of products:\n\n"
-            f"Select a product to configure your purchase:")
-
-    await cb.message.edit_text(text, reply_markup=build_products_keyboard(folder_name, products, price_per_item))
+    await show_products(cb, state, user, folder)
     await cb.answer()
 
-@router.callback_query(F.data.startswith("select_product_"))
-async def select_product_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    parts = cb.data.replace("select_product_", "").split("_")
-    folder_name = parts[0]
-    product_idx = int(parts[1])
-
+@callbacks(SELECT_PRODUCT)
+async def select_product_handler(cb: CallbackQuery, state: FSMContext, user: User, folder_name: str, product_idx: int):
     data = await state.get_data()
-    product_list = data.get('product_list', [])
-    
-    if product_idx >= len(product_list):
+    snapshot = stock_snapshots.get(user.user_id, data.get('snapshot_id'))
+
+    if snapshot is None or snapshot.name != folder_name:
+        # Lease gone (expired, or the bot restarted): show the current list instead
+        folder = stock_index.get(folder_name)
+        if not folder or not folder.products:
+            await cb.answer("❌ No products available in this category", show_alert=True)
+            return
+        await show_products(cb, state, user, folder)
+        await cb.answer("🔄 The product list has changed. Please choose again.", show_alert=True)
+        return
+
+    if product_idx >= snapshot.count:
         await cb.answer("❌ Product not found", show_alert=True)
         return
 
-    product_name = product_list[product_idx]
+    product_name = snapshot.products[product_idx]
+
+    # Hold one unit while the user picks a quantity
+    stock = stock_index.count(folder_name)
+    max_stock = reservations.available(folder_name, stock, user.user_id)
+    if not reservations.hold(user.user_id, folder_name, 1, stock):
+        await cb.answer("❌ All remaining stock is currently reserved. Please try again shortly.", show_alert=True)
+        return
 
     await state.set_state(BrowsingStates.configuring_purchase)
     await state.update_data(
         current_folder=folder_name,
         current_product_idx=product_idx,
-        current_product=product_name,
         quantity=1
     )
 
     # Get product details
     price_per_item = 1.5
-    max_stock = len(get_products_in_folder(folder_name))
 
     display_name = folder_name.replace('+', '').replace('_', ' ').title()
     clean_product = product_name.replace('.session', '').replace('_', ' ')
@@ -222,15 +245,15 @@ async def select_product_handler(cb: CallbackQuery, state: FSMContext, user: Use
     await cb.answer()
 
 # --- Quantity Management ---
-@router.callback_query(F.data.startswith("qty_plus_"))
-async def quantity_plus_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    parts = cb.data.replace("qty_plus_", "").split("_")
-    folder_name = parts[0]
-    product_idx = int(parts[1])
-    current_qty = int(parts[2])
-
-    max_stock = len(get_products_in_folder(folder_name))
-    new_qty = min(current_qty + 1, max_stock)
+@callbacks(QTY_PLUS)
+async def quantity_plus_handler(cb: CallbackQuery, state: FSMContext, user: User, folder_name: str, product_idx: int, quantity: int):
+    stock = stock_index.count(folder_name)
+    max_stock = reservations.available(folder_name, stock, user.user_id)
+    # hold() caps the quantity at what other users' holds leave; 0 means none is left
+    new_qty = reservations.hold(user.user_id, folder_name, quantity + 1, stock)
+    if not new_qty:
+        await cb.answer("❌ All remaining stock is currently reserved. Please try again shortly.", show_alert=True)
+        return
 
     await state.update_data(quantity=new_qty)
 
@@ -252,20 +275,19 @@ async def quantity_plus_handler(cb: CallbackQuery, state: FSMContext, user: User
     ))
     await cb.answer()
 
-@router.callback_query(F.data.startswith("qty_minus_"))
-async def quantity_minus_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    parts = cb.data.replace("qty_minus_", "").split("_")
-    folder_name = parts[0]
-    product_idx = int(parts[1])
-    current_qty = int(parts[2])
-
-    new_qty = max(current_qty - 1, 1)
+@callbacks(QTY_MINUS)
+async def quantity_minus_handler(cb: CallbackQuery, state: FSMContext, user: User, folder_name: str, product_idx: int, quantity: int):
+    stock = stock_index.count(folder_name)
+    max_stock = reservations.available(folder_name, stock, user.user_id)
+    new_qty = reservations.hold(user.user_id, folder_name, max(quantity - 1, 1), stock)
+    if not new_qty:
+        await cb.answer("❌ All remaining stock is currently reserved. Please try again shortly.", show_alert=True)
+        return
 
     await state.update_data(quantity=new_qty)
 
     price_per_item = 1.5
     total_cost = new_qty * price_per_item
-    max_stock = len(get_products_in_folder(folder_name))
 
     display_name = folder_name.replace('+', '').replace('_', ' ').title()
 
@@ -289,8 +311,10 @@ async def insufficient_balance_handler(cb: CallbackQuery, user: User):
 
 # --- Navigation Callbacks ---
 @router.callback_query(F.data == "back_to_categories")
-async def back_to_categories_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    folder_info = get_folder_structure()
+async def back_to_categories_handler(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user: User):
+    reservations.release(user.user_id)
+    stock_snapshots.release(user.user_id)
+    folder_info = await get_folder_structure(session)
     await state.set_state(BrowsingStates.viewing_categories)
 
     text = (f"🛍️ <b>Product Categories</b>\n\n"
@@ -300,26 +324,22 @@ async def back_to_categories_handler(cb: CallbackQuery, state: FSMContext, user:
     await cb.message.edit_text(text, reply_markup=build_categories_keyboard(folder_info))
     await cb.answer()
 
-@router.callback_query(F.data.startswith("back_to_products_"))
-async def back_to_products_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    folder_name = cb.data.replace("back_to_products_", "")
-    products = get_products_in_folder(folder_name)
-
-    await state.set_state(BrowsingStates.viewing_products)
+@callbacks(BACK_TO_PRODUCTS)
+async def back_to_products_handler(cb: CallbackQuery, state: FSMContext, user: User, folder_name: str):
+    folder = stock_index.get(folder_name)
+    reservations.release(user.user_id)
 
-    display_name = folder_name.replace('+', '').replace('_', ' ').title()
-    text = (f"📱 <b>{display_name}</b>\n\n"
-            f"The following is a list of products:\n\n"
-            f"Select a product to configure your purchase:")
+    if not folder:
+        await cb.answer("❌ No products available in this category", show_alert=True)
+        return
 
-    await cb.message.edit_text(text, reply_markup=build_products_keyboard(folder_name, products, 1.5))
+    await show_products(cb, state, user, folder)
     await cb.answer()
 
 # --- Deposit Amount Handlers ---
-@router.callback_query(F.data.startswith("deposit_plus_"))
-async def deposit_plus_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    current_amount = float(cb.data.replace("deposit_plus_", ""))
-    new_amount = current_amount + 1
+@callbacks(DEPOSIT_PLUS)
+async def deposit_plus_handler(cb: CallbackQuery, state: FSMContext, user: User, amount: float):
+    new_amount = amount + 1
 
     await state.update_data(deposit_amount=new_amount)
 
@@ -333,13 +353,12 @@ async def deposit_plus_handler(cb: CallbackQuery, state: FSMContext, user: User)
     await cb.message.edit_text(text, reply_markup=build_deposit_amount_keyboard(new_amount))
     await cb.answer()
 
-@router.callback_query(F.data.startswith("deposit_minus_"))
-async def deposit_minus_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    current_amount = float(cb.data.replace("deposit_minus_", ""))
-    new_amount = max(current_amount - 1, 1)
+@callbacks(DEPOSIT_MINUS)
+async def deposit_minus_handler(cb: CallbackQuery, state: FSMContext, user: User, amount: float):
+    new_amount = max(amount - 1, 1)
 
     # Only update if amount actually changed to avoid Telegram error
-    if new_amount != current_amount:
+    if new_amount != amount:
         await state.update_data(deposit_amount=new_amount)
 
         text = (f"💰 <b>Top Up Balance</b>\n\n"
@@ -353,9 +372,8 @@ async def deposit_minus_handler(cb: CallbackQuery, state: FSMContext, user: User
 
     await cb.answer()
 
-@router.callback_query(F.data.startswith("deposit_checkout_"))
-async def deposit_checkout_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    amount = float(cb.data.replace("deposit_checkout_", ""))
+@callbacks(DEPOSIT_CHECKOUT)
+async def deposit_checkout_handler(cb: CallbackQuery, state: FSMContext, user: User, amount: float):
     await state.update_data(deposit_amount=amount)
 
     text = (f"💰 <b>Top Up Balance</b>\n\n"
@@ -394,6 +412,7 @@ async def set_language_callback(cb: CallbackQuery, session: AsyncSession, user:
     lang_code = cb.data.split('_')[-1]
     user.language_code = lang_code
     await session.commit()
+    user_cache.put(user)
     logger.info(f"User {user.user_id} (@{user.username}) set language to: {lang_code}")
     await cb.answer(translator.get_string("lang_set", lang_code), show_alert=True)
     text = translator.get_string("settings_title", user.language_code)
@@ -411,6 +430,7 @@ async def set_currency_callback(cb: CallbackQuery, session: AsyncSession, user:
     currency_code = cb.data.split('_')[-1]
     user.currency = currency_code
     await session.commit()
+    user_cache.put(user)
     logger.info(f"User {user.user_id} (@{user.username}) set currency to: {currency_code}")
     await cb.answer(translator.get_string("currency_set", user.language_code, currency=currency_code), show_alert=True)
     text = translator.get_string("settings_title", user.language_code)
@@ -420,6 +440,8 @@ async def set_currency_callback(cb: CallbackQuery, session: AsyncSession, user:
 async def back_to_main_menu_handler(cb: CallbackQuery, user: User, state: FSMContext):
     logger.info(f"User {user.user_id} (@{user.username}) returned to main menu.")
     await state.clear()
+    reservations.release(user.user_id)
+    stock_snapshots.release(user.user_id)
     try: await cb.message.delete()
     except: pass
     await cb.message.answer(translator.get_string("back_to_main", user.language_code), reply_markup=build_main_menu_keyboard(user.language_code))
@@ -453,9 +475,8 @@ async def my_purchased_accounts_handler(cb: CallbackQuery, user: User):
 # --- Deposit Flow (keep existing) ---
 crypto_bot = CryptoBotAPI(token=config.crypto_bot_token.get_secret_value())
 
-@router.callback_query(F.data.startswith("deposit_") & ~F.data.startswith("deposit_done_") & ~F.data.startswith("deposit_plus_") & ~F.data.startswith("deposit_minus_") & ~F.data.startswith("deposit_checkout_"))
-async def select_payment_method_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    method_key = cb.data.split("_", 1)[1]
+@callbacks(DEPOSIT_METHOD)
+async def select_payment_method_handler(cb: CallbackQuery, state: FSMContext, user: User, method_key: str):
     logger.info(f"User {user.user_id} (@{user.username}) selected deposit method: {method_key}")
 
     if method_key == "crypto_bot":
@@ -511,9 +532,8 @@ async def process_crypto_amount(msg: Message, state: FSMContext, session: AsyncS
     await msg.answer(text, reply_markup=build_crypto_bot_invoice_keyboard(pay_url, new_deposit.id))
     await state.clear()
 
-@router.callback_query(F.data.startswith("check_payment_"))
-async def check_crypto_payment_handler(cb: CallbackQuery, session: AsyncSession, bot: Bot):
-    deposit_id = int(cb.data.split('_')[-1])
+@callbacks(CHECK_PAYMENT)
+async def check_crypto_payment_handler(cb: CallbackQuery, session: AsyncSession, bot: Bot, deposit_id: int):
 
     deposit = await session.get(Deposit, deposit_id)
     if not deposit or deposit.status != 'waiting':
@@ -532,10 +552,20 @@ async def check_crypto_payment_handler(cb: CallbackQuery, session: AsyncSession,
     invoice_status = invoices[0].get('status')
 
     if invoice_status == 'paid':
+        # Conditional on the status, so a double tap cannot credit the same invoice twice
+        settled = await session.scalar(
+            update(Deposit).where(Deposit.id == deposit.id, Deposit.status == 'waiting').values(status='approved')
+            .returning(Deposit.id).execution_options(synchronize_session=False)
+        )
+        if settled is None:
+            await cb.message.edit_text("❗️ This payment has already been processed or cancelled.")
+            return
+        set_committed_value(deposit, 'status', 'approved')
         user = await session.get(User, deposit.user_id)
-        user.balance = Decimal(str(user.balance)) + Decimal(str(deposit.amount))
-        deposit.status = 'approved'
+        await credit(session, user.user_id, deposit.amount)
         await session.commit()
+        stats_recorder.record_deposit_approved(deposit.amount)
+        user_cache.put(user)
 
         logger.info(f"CryptoBot payment for deposit #{deposit.id} CONFIRMED. User {user.user_id} balance updated.")
         await cb.message.edit_text(f"✅ <b>Payment Confirmed!</b>\n\n${deposit.amount:.2f} has been added to your balance.")
@@ -558,9 +588,8 @@ async def check_crypto_payment_handler(cb: CallbackQuery, session: AsyncSession,
     else:
         await cb.answer("⏳ Payment not confirmed yet. Please wait a moment and try again.", show_alert=True)
 
-@router.callback_query(F.data.startswith("deposit_done_"))
-async def deposit_done_handler(cb: CallbackQuery, state: FSMContext, user: User):
-    method_key = cb.data.split('_')[-1]
+@callbacks(DEPOSIT_DONE)
+async def deposit_done_handler(cb: CallbackQuery, state: FSMContext, user: User, method_key: str):
     logger.info(f"User {user.user_id} confirmed payment instructions for method {method_key}")
     
     # Now ask for screenshot proof
@@ -626,7 +655,7 @@ async def process_invalid_screenshot_handler(msg: Message, user: User):
     await msg.answer(error_text)
 
 @router.message(WithdrawalStates.waiting_for_amount, F.text)
-async def process_withdrawal_amount(msg: Message, state: FSMContext, user: User):
+async def process_withdrawal_amount(msg: Message, state: FSMContext, session: AsyncSession, user: User):
     try:
         amount = float(msg.text.replace(',', '.').strip())
         if amount < 1.0:
@@ -634,10 +663,12 @@ async def process_withdrawal_amount(msg: Message, state: FSMContext, user: User)
             error_text = translator.get_string("min_withdraw_error", lang)
             await msg.answer(error_text)
             return
-        if amount > float(user.balance):
+        # Read the stored balance; the cached user may lag behind
+        balance = await session.scalar(select(User.balance).where(User.user_id == user.user_id))
+        if amount > float(balance):
             lang = user.language_code
             error_text = translator.get_string("insufficient_balance_withdraw", lang, 
-                                              balance=f"${float(user.balance):.2f}", 
+                                              balance=f"${float(balance):.2f}", 
                                               requested=f"${amount:.2f}")
             await msg.answer(error_text)
             return
@@ -1,32 +1,46 @@
 import datetime
+import html
 import os
-import shutil
-import io
-import zipfile
 import re
 import asyncio
+import logging
 from aiogram import Router, F, Bot
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.types import Message, CallbackQuery
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from decimal import Decimal
 from telethon import TelegramClient, errors
 
 from config_data.config import config
 from database.models import Country, User, Account
 from database.engine import async_session_factory
+from database.inventory import claim_accounts, claim_bundle, InsufficientBalance, OutOfStock
 from keyboards.purchase_keyboards import *
+from keyboards.callbacks import CONFIRM_PURCHASE
 from utils.states import BrowsingStates
-from utils.delivery import create_session_zip_file
+from utils.delivery import build_delivery, display_name
+from utils.blob_store import blob_store, MissingBlobs
 from utils.stock_manager import ACCOUNTS_DIR, get_country_name
+from utils.stock_index import stock_index
+from utils.reservations import reservations
+from utils.stock_snapshots import stock_snapshots
+from utils.bundle_packer import bundle_packer, Bundle
+from utils.sold_mover import sold_mover
+from utils.purchase_scheduler import purchase_scheduler, QueueFull
+from utils.user_cache import user_cache
 from utils.localization import translator
 from utils.currency_converter import currency_converter
+from utils.callback_codec import CallbackTable
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 router.message.filter(F.chat.type == "private")
 router.callback_query.filter(F.message.chat.type == "private")
+callbacks = CallbackTable(router)
 
 TEMP_SESSIONS_DIR = "temp_sessions"
 if not os.path.exists(TEMP_SESSIONS_DIR):
@@ -50,114 +64,175 @@ def parse_phone_from_string(data_string: str) -> str:
 
     return data_string
 
-async def move_sold_file(folder_name: str, product_name: str):
-    """Move sold file to sold folder"""
-    try:
-        folder_path = os.path.join(ACCOUNTS_DIR, folder_name)
-        sold_path = os.path.join(folder_path, "sold")
-
-        if not os.path.exists(sold_path):
-            os.makedirs(sold_path)
-
-        source_file = os.path.join(folder_path, product_name)
-        destination_file = os.path.join(sold_path, product_name)
-
-        if os.path.exists(source_file):
-            await asyncio.to_thread(shutil.move, source_file, destination_file)
-            return True
-        else:
-            print(f"Source file not found: {source_file}")
-            return False
-    except Exception as e:
-        print(f"Error moving file {product_name}: {e}")
-        return False
-
-def get_session_file_content(folder_name: str, product_name: str) -> bytes:
-    """Get session file content"""
+async def _claim_in_own_session(claim, *args):
+    # A failed claim rolls its session back, which expires everything loaded in it; keeping
+    # that off the handler's session leaves the request's User usable in the error paths
+    async with async_session_factory() as session:
+        return await claim(session, *args)
+
+async def claim_order(folder_name: str, country_id: int, buyer_id: int, quantity: int, total_cost: Decimal):
+    """
+    Claims an order from the folder's stock, preferring a pre-packed bundle of the exact
+    quantity. If free rows run short because they are tied up in bundles, the folder's
+    bundles are dissolved and the claim retried once. Each attempt runs in a session of
+    its own. Returns (claimed accounts, new balance, bundle or None).
+    """
+    bundle_packer.record_order(folder_name, quantity)
+    bundle = bundle_packer.take(folder_name, quantity)
+    if bundle:
+        try:
+            claimed, new_balance = await _claim_in_own_session(claim_bundle, bundle.bundle_id, buyer_id, quantity, total_cost, folder_name)
+            return claimed, new_balance, bundle
+        except InsufficientBalance:
+            bundle_packer.put_back(bundle)
+            raise
+        except OutOfStock:
+            # Some of its accounts went away (resync); fall back to a regular claim
+            await bundle_packer.discard([bundle])
+
     try:
-        file_path = os.path.join(ACCOUNTS_DIR, folder_name, product_name)
-        with open(file_path, 'rb') as f:
-            return f.read()
-    except Exception as e:
-        print(f"Error reading session file {product_name}: {e}")
-        return b""
-
-@router.callback_query(F.data.startswith("confirm_purchase_"))
-async def confirm_purchase_handler(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user: User, bot: Bot):
+        claimed, new_balance = await _claim_in_own_session(claim_accounts, country_id, buyer_id, quantity, total_cost, folder_name)
+    except OutOfStock:
+        if not await bundle_packer.invalidate_folders([folder_name]):
+            raise
+        claimed, new_balance = await _claim_in_own_session(claim_accounts, country_id, buyer_id, quantity, total_cost, folder_name)
+    return claimed, new_balance, None
+
+async def send_bundle(bot: Bot, chat_id: int, bundle: Bundle, caption: str):
+    """Sends a pre-packed archive and deletes it."""
     try:
-        parts = cb.data.replace("confirm_purchase_", "").split("_")
-        folder_name = parts[0]
-        product_idx = int(parts[1])
-        quantity = int(parts[2])
+        await bot.send_document(chat_id=chat_id, document=bundle.part.input_file(), caption=caption)
+    finally:
+        bundle.part.cleanup()
 
+@callbacks(CONFIRM_PURCHASE)
+async def confirm_purchase_handler(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user: User, bot: Bot, folder_name: str, product_idx: int, quantity: int):
+    try:
+        user_id = user.user_id  # Read up front: the error paths must not depend on the instance
         data = await state.get_data()
-        product_list = data.get('product_list', [])
-        
-        if product_idx >= len(product_list):
+        snapshot = stock_snapshots.get(user_id, data.get('snapshot_id'))
+
+        if snapshot is None or snapshot.name != folder_name:
+            await cb.answer("❌ This product list has expired. Please open the category again.", show_alert=True)
+            return
+        if product_idx >= snapshot.count:
             await cb.answer("❌ Product not found", show_alert=True)
             return
-
-        product_name = product_list[product_idx]
+        if quantity < 1:
+            await cb.answer("❌ Please choose at least one account.", show_alert=True)
+            return
 
         price_per_item = 1.5
         total_cost = Decimal(str(price_per_item * quantity))
 
-        # Check user balance
-        if Decimal(str(user.balance)) < total_cost:
+        # Quick reject against the stored balance (the cached user may lag); the claim
+        # below re-checks it atomically
+        balance = await session.scalar(select(User.balance).where(User.user_id == user_id))
+        if Decimal(str(balance)) < total_cost:
             await cb.answer("❌ Insufficient balance!", show_alert=True)
             return
 
-        # Get available products
-        folder_path = os.path.join(ACCOUNTS_DIR, folder_name)
-        available_products = [f for f in os.listdir(folder_path) 
-                             if f.endswith('.session') and not f.startswith('sold')]
+        folder = stock_index.get(folder_name)
+        if quantity > reservations.available(folder_name, stock_index.count(folder_name), user_id):
+            await cb.answer("❌ Not enough stock available!", show_alert=True)
+            return
 
-        if len(available_products) < quantity:
+        country = None
+        if folder:
+            country = (await session.execute(select(Country).where(Country.name == folder.country_name))).scalar_one_or_none()
+        if not country:
             await cb.answer("❌ Not enough stock available!", show_alert=True)
             return
 
         # Process purchase
         await cb.message.edit_text("⏳ Processing your purchase...")
 
-        # Deduct balance
-        user.balance = Decimal(str(user.balance)) - total_cost
-        await session.commit()
-
-        # Select products to deliver
-        products_to_deliver = available_products[:quantity]
-
-        # Create ZIP file with products
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for product in products_to_deliver:
-                try:
-                    session_content = get_session_file_content(folder_name, product)
-                    if session_content:
-                        zip_file.writestr(product, session_content)
-                except Exception as e:
-                    print(f"Error adding {product} to ZIP: {e}")
-
-        # Send ZIP file to user
-        zip_buffer.seek(0)
-        display_name = folder_name.replace('+', '').replace('_', ' ').title()
-        input_file = BufferedInputFile(
-            zip_buffer.read(), 
-            filename=f"{display_name}_x{quantity}.zip"
-        )
-
-        await bot.send_document(
-            chat_id=cb.from_user.id,
-            document=input_file,
-            caption=f"✅ <b>Purchase Complete!</b>\n\n"
-                   f"📦 Product: {display_name}\n"
+        # Claim accounts and deduct balance in one transaction
+        # Orders for the same folder are claimed one at a time, in arrival order
+        try:
+            claimed, new_balance, bundle = await purchase_scheduler.run(
+                folder_name, lambda: claim_order(folder_name, country.id, user_id, quantity, total_cost)
+            )
+        except QueueFull:
+            await cb.message.edit_text("⏳ This category is very busy right now. Please try again in a moment.")
+            await cb.answer()
+            return
+        except InsufficientBalance:
+            user_cache.invalidate(user_id)
+            await cb.message.edit_text("❌ Insufficient balance!")
+            await cb.answer()
+            return
+        except OutOfStock:
+            reservations.release(user_id)
+            stock_snapshots.release(user_id)
+            await cb.message.edit_text("❌ Not enough stock available!")
+            await cb.answer()
+            return
+        set_committed_value(user, 'balance', new_balance)
+        user_cache.put(user)
+        reservations.release(user_id)
+        stock_snapshots.release(user_id)
+        products_to_deliver = [acc.file_name for acc in claimed]
+
+        display = display_name(folder_name)
+        caption = (f"✅ <b>Purchase Complete!</b>\n\n"
+                   f"📦 Product: {display}\n"
                    f"📊 Quantity: {quantity}\n"
                    f"💰 Total: ${total_cost}\n\n"
-                   f"Thank you for your purchase!"
-        )
-
-        # Move sold files
-        move_tasks = [move_sold_file(folder_name, product) for product in products_to_deliver]
-        await asyncio.gather(*move_tasks)
+                   f"Thank you for your purchase!")
+
+        undelivered = None  # Why the paid files did not reach the buyer, if they did not
+        try:
+            if bundle:
+                await send_bundle(bot, cb.from_user.id, bundle, caption)
+            else:
+                # Build the archive(s) off the event loop; session bodies are only loaded here
+                try:
+                    blobs = await blob_store.get_all(session, [acc.session_hash for acc in claimed])
+                except MissingBlobs as e:
+                    logger.error(f"Purchase by {user_id} of {folder_name} x{quantity} not delivered (accounts {', '.join(str(acc.id) for acc in claimed)}): {e}")
+                    undelivered = "Session files are missing from the blob store."
+                else:
+                    files = [(acc.file_name, blobs[acc.session_hash]) for acc in claimed]
+
+                    # Send each part as soon as it is ready
+                    async for part in build_delivery(files, f"{display}_x{quantity}"):
+                        part_caption = caption if part.total == 1 else f"{caption}\n\n🗂 Part {part.index}/{part.total} ({part.file_count} accounts)"
+                        try:
+                            await bot.send_document(chat_id=cb.from_user.id, document=part.input_file(), caption=part_caption)
+                        finally:
+                            part.cleanup()
+        except Exception as e:
+            logger.exception(f"Sending purchase by {user_id} of {folder_name} x{quantity} failed")
+            undelivered = f"Sending the files failed: {html.escape(str(e))}"
+        finally:
+            # The accounts are sold whatever happened above. The claim journaled the file
+            # moves; the mover carries them out in its next batch
+            sold_mover.wake()
+            stock_index.discard(folder_name, products_to_deliver)
+            bundle_packer.notify_stock_changed()
+
+        if undelivered:
+            # Paid and sold, but not (fully) delivered: hand it to support
+            account_ids = ", ".join(str(acc.id) for acc in claimed)
+            try:
+                await bot.send_message(
+                    chat_id=config.admin_channel_id,
+                    text=(f"⚠️ <b>Purchase Not Delivered</b>\n\n"
+                          f"👤 User ID: <code>{user_id}</code>\n"
+                          f"📦 {display} x{quantity} (${total_cost})\n"
+                          f"🆔 Accounts: <code>{account_ids}</code>\n"
+                          f"{undelivered}"),
+                )
+            except Exception as e:
+                logger.error(f"Error sending to admin channel: {e}")
+            await cb.message.edit_text(
+                "⚠️ <b>Your purchase went through, but its files could not be delivered.</b>\n\n"
+                "Support has been notified and will send them to you. Please contact support if you have questions."
+            )
+            await state.clear()
+            await cb.answer()
+            return
 
         await cb.message.edit_text(
             f"✅ <b>Purchase Successful!</b>\n\n"
@@ -168,7 +243,7 @@ async def confirm_purchase_handler(cb: CallbackQuery, state: FSMContext, session
         await state.clear()
         await cb.answer()
 
-    except Exception as e:
-        print(f"Error in purchase: {e}")
+    except Exception:
+        logger.exception(f"Error in purchase by {cb.from_user.id}")
         await cb.message.edit_text("❌ An error occurred during purchase. Please contact support.")
         await cb.answer()
\ No newline at end of file
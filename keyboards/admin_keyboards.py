@@ -1,12 +1,35 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 from database.models import Country, User
+from keyboards.cache import cached_keyboard
 
+@cached_keyboard
 def build_admin_panel_keyboard():
     b = InlineKeyboardBuilder()
     b.row(InlineKeyboardButton(text="📊 Bot Statistics", callback_data="admin_stats"), InlineKeyboardButton(text="💰 View Deposits", callback_data="admin_view_deposits"))
     b.row(InlineKeyboardButton(text="👤 User Management", callback_data="admin_user_management"), InlineKeyboardButton(text="🌍 Country Management", callback_data="admin_country_management"))
     b.row(InlineKeyboardButton(text="📦 Account Management", callback_data="admin_account_management"), InlineKeyboardButton(text="💬 Messaging", callback_data="admin_messaging"))
+    b.row(InlineKeyboardButton(text="📈 Runtime Metrics", callback_data="admin_runtime_metrics"))
+    return b.as_markup()
+
+@cached_keyboard
+def build_stats_keyboard():
+    b = InlineKeyboardBuilder()
+    b.row(InlineKeyboardButton(text="📅 Last 7 Days", callback_data="admin_stats_daily"))
+    b.row(InlineKeyboardButton(text="⬅️ Back to Admin Panel", callback_data="admin_panel"))
+    return b.as_markup()
+
+@cached_keyboard
+def build_stats_daily_keyboard():
+    b = InlineKeyboardBuilder()
+    b.row(InlineKeyboardButton(text="⬅️ Back to Statistics", callback_data="admin_stats"))
+    return b.as_markup()
+
+@cached_keyboard
+def build_runtime_metrics_keyboard():
+    b = InlineKeyboardBuilder()
+    b.row(InlineKeyboardButton(text="🔄 Refresh", callback_data="admin_runtime_metrics"))
+    b.row(InlineKeyboardButton(text="⬅️ Back to Admin Panel", callback_data="admin_panel"))
     return b.as_markup()
 
 def build_deposit_management_keyboard(deposit_id: int):
@@ -25,6 +48,7 @@ def build_withdrawal_management_keyboard(withdrawal_id: int):
     )
     return builder.as_markup()
 
+@cached_keyboard
 def build_country_management_keyboard():
     b = InlineKeyboardBuilder()
     b.row(InlineKeyboardButton(text="➕ Add Country", callback_data="admin_add_country"))
@@ -33,6 +57,7 @@ def build_country_management_keyboard():
     b.row(InlineKeyboardButton(text="⬅️ Back to Admin Panel", callback_data="admin_panel"))
     return b.as_markup()
 
+@cached_keyboard
 def build_account_management_keyboard():
     b = InlineKeyboardBuilder()
     b.row(InlineKeyboardButton(text="🔄 Sync Accounts from Folders", callback_data="admin_sync_from_folders"))
@@ -54,6 +79,7 @@ def build_delete_country_confirmation_keyboard(country_id: int):
     )
     return b.as_markup()
 
+@cached_keyboard
 def build_user_management_keyboard():
     b = InlineKeyboardBuilder()
     b.row(InlineKeyboardButton(text="🔍 Find User", callback_data="admin_find_user"))
@@ -77,6 +103,7 @@ def build_user_profile_keyboard(user: User):
     b.row(InlineKeyboardButton(text="⬅️ Back to User Management", callback_data="admin_user_management"))
     return b.as_markup()
 
+@cached_keyboard
 def build_messaging_keyboard():
     b = InlineKeyboardBuilder()
     b.row(InlineKeyboardButton(text="📣 Broadcast to ALL Users", callback_data="admin_broadcast_all"))
@@ -84,6 +111,7 @@ def build_messaging_keyboard():
     b.row(InlineKeyboardButton(text="⬅️ Back to Admin Panel", callback_data="admin_panel"))
     return b.as_markup()
 
+@cached_keyboard
 def build_broadcast_targeting_keyboard():
     b = InlineKeyboardBuilder()
     b.row(InlineKeyboardButton(text="🆔 By User IDs", callback_data="admin_target_by_id"))
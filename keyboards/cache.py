@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, Hashable, Tuple, TypeVar
+
+from utils.localization import translator
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+MAX_ENTRIES = 4096  # Bounds keyboards keyed by user-derived arguments (channels, folders).
+
+
+@dataclass(frozen=True)
+class KeyboardCacheStats:
+    size: int
+    hits: int
+    misses: int
+    clears: int
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class KeyboardCache:
+    """
+    Prebuilt markups and button rows keyed by (builder, arguments). One instance is
+    handed to every caller and sent to any number of chats, so what the cache returns
+    is read-only by contract: aiogram's types are mutable pydantic models and nothing
+    stops an assignment. To change a cached keyboard, build a new one, e.g. with
+    `builder.uncached(...)`. Everything is dropped when the locales reload, since most
+    labels come from the translator.
+    """
+
+    def __init__(self, max_size: int = MAX_ENTRIES):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, Hashable], Any]" = OrderedDict()
+        self._hits = self._misses = self._clears = 0
+
+    def memoize(self, builder: F) -> F:
+        """
+        Decorator for builders whose output depends only on their (hashable) arguments.
+        The decorated builder returns a shared value that must not be mutated;
+        `.uncached` builds a fresh one.
+        """
+        name = f"{builder.__module__}.{builder.__qualname__}"
+
+        @wraps(builder)
+        def cached(*args):
+            key = (name, args)
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return value
+            self._misses += 1
+            value = builder(*args)
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return value
+
+        cached.uncached = builder
+        return cached
+
+    def clear(self):
+        self._entries.clear()
+        self._clears += 1
+
+    def stats(self) -> KeyboardCacheStats:
+        return KeyboardCacheStats(len(self._entries), self._hits, self._misses, self._clears)
+
+
+# Global instance
+keyboard_cache = KeyboardCache()
+translator.add_reload_listener(keyboard_cache.clear)
+cached_keyboard = keyboard_cache.memoize
@@ -0,0 +1,19 @@
+# Encoded callback payloads for buttons that carry folders, indexes or amounts
+from utils.callback_codec import CallbackSpec, Int, Cents, Str, Folder
+
+# --- Catalog and quantity selector ---
+BROWSE_CATEGORY = CallbackSpec('bc', folder_name=Folder())
+SELECT_PRODUCT = CallbackSpec('sp', folder_name=Folder(), product_idx=Int())
+BACK_TO_PRODUCTS = CallbackSpec('bp', folder_name=Folder())
+QTY_PLUS = CallbackSpec('q+', folder_name=Folder(), product_idx=Int(), quantity=Int())
+QTY_MINUS = CallbackSpec('q-', folder_name=Folder(), product_idx=Int(), quantity=Int())
+QTY_MANUAL = CallbackSpec('qm', folder_name=Folder(), product_idx=Int())
+CONFIRM_PURCHASE = CallbackSpec('cp', folder_name=Folder(), product_idx=Int(), quantity=Int())
+
+# --- Deposits ---
+DEPOSIT_PLUS = CallbackSpec('d+', amount=Cents())
+DEPOSIT_MINUS = CallbackSpec('d-', amount=Cents())
+DEPOSIT_CHECKOUT = CallbackSpec('dc', amount=Cents())
+DEPOSIT_METHOD = CallbackSpec('dm', method_key=Str())
+DEPOSIT_DONE = CallbackSpec('dd', method_key=Str())
+CHECK_PAYMENT = CallbackSpec('ck', deposit_id=Int())
@@ -1,10 +1,15 @@
 
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.types import InlineKeyboardButton
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from database.models import Country
-from typing import Dict, List
+from keyboards.cache import cached_keyboard
+from keyboards.callbacks import BROWSE_CATEGORY, SELECT_PRODUCT, BACK_TO_PRODUCTS, QTY_PLUS, QTY_MINUS, QTY_MANUAL, CONFIRM_PURCHASE, DEPOSIT_PLUS, DEPOSIT_MINUS, DEPOSIT_CHECKOUT, DEPOSIT_METHOD
+from typing import Dict, Sequence
 import os
 
+# Shared by many markups; never mutate (see keyboards.cache)
+CANCEL_ROW = (InlineKeyboardButton(text="❌ Cancel", callback_data="global_cancel"),)
+
 def build_categories_keyboard(folders_info: Dict[str, int]):
     """Build keyboard showing product categories with stock counts"""
     builder = InlineKeyboardBuilder()
@@ -15,61 +20,64 @@ def build_categories_keyboard(folders_info: Dict[str, int]):
         if stock_count > 0:
             builder.row(InlineKeyboardButton(
                 text=f"🗂️ {display_name} [stock: {stock_count}]",
-                callback_data=f"browse_category_{folder_name}"
+                callback_data=BROWSE_CATEGORY.pack(folder_name)
             ))
     
     builder.row(InlineKeyboardButton(text="◀️ Back to Main Menu", callback_data="main_menu_start"))
     return builder.as_markup()
 
-def build_products_keyboard(folder_name: str, products: List[str], price_per_item: float = 1.0):
+def build_products_keyboard(folder_name: str, products: Sequence[str], price_per_item: float = 1.0):
     """Build keyboard showing individual products in a category"""
     builder = InlineKeyboardBuilder()
     
     for idx, product in enumerate(products):
         # Clean product name for display
         display_name = product.replace('.session', '').replace('_', ' ')
-        # Use index instead of full product name to avoid callback data length limit
         builder.row(InlineKeyboardButton(
             text=f"📱 {display_name} - ${price_per_item:.2f}",
-            callback_data=f"select_product_{folder_name}_{idx}"
+            callback_data=SELECT_PRODUCT.pack(folder_name, idx)
         ))
     
     builder.row(InlineKeyboardButton(text="◀️ Back to Categories", callback_data="back_to_categories"))
     return builder.as_markup()
 
+@cached_keyboard
+def _navigation_rows(folder_name: str):
+    """The trailing Menu/GoBack and Cancel rows, identical for every quantity of a folder."""
+    return (
+        (
+            InlineKeyboardButton(text="📋 Menu", callback_data="main_menu_start"),
+            InlineKeyboardButton(text="◀️ GoBack", callback_data=BACK_TO_PRODUCTS.pack(folder_name))
+        ),
+        CANCEL_ROW,
+    )
+
 def build_quantity_selector_keyboard(folder_name: str, product_idx: int, current_qty: int, max_stock: int, price_per_item: float, user_balance: float):
     """Build quantity selector with +/- buttons and purchase options"""
-    builder = InlineKeyboardBuilder()
-    
     total_cost = current_qty * price_per_item
     
     # Quantity controls
-    builder.row(
-        InlineKeyboardButton(text="➖", callback_data=f"qty_minus_{folder_name}_{product_idx}_{current_qty}"),
-        InlineKeyboardButton(text=f"Enter Qty: {current_qty}", callback_data=f"qty_manual_{folder_name}_{product_idx}"),
-        InlineKeyboardButton(text="➕", callback_data=f"qty_plus_{folder_name}_{product_idx}_{current_qty}")
-    )
+    rows = [(
+        InlineKeyboardButton(text="➖", callback_data=QTY_MINUS.pack(folder_name, product_idx, current_qty)),
+        InlineKeyboardButton(text=f"Enter Qty: {current_qty}", callback_data=QTY_MANUAL.pack(folder_name, product_idx)),
+        InlineKeyboardButton(text="➕", callback_data=QTY_PLUS.pack(folder_name, product_idx, current_qty))
+    )]
     
     # Balance or Buy button
     if user_balance < total_cost:
-        builder.row(InlineKeyboardButton(
+        rows.append((InlineKeyboardButton(
             text=f"💰 Balance (${user_balance:.2f} < ${total_cost:.2f})",
             callback_data="insufficient_balance"
-        ))
+        ),))
     else:
-        builder.row(InlineKeyboardButton(
+        rows.append((InlineKeyboardButton(
             text=f"🛒 Buy Now (${total_cost:.2f})",
-            callback_data=f"confirm_purchase_{folder_name}_{product_idx}_{current_qty}"
-        ))
-    
-    # Navigation
-    builder.row(
-        InlineKeyboardButton(text="📋 Menu", callback_data="main_menu_start"),
-        InlineKeyboardButton(text="◀️ GoBack", callback_data=f"back_to_products_{folder_name}")
-    )
+            callback_data=CONFIRM_PURCHASE.pack(folder_name, product_idx, current_qty)
+        ),))
     
-    builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data="global_cancel"))
-    return builder.as_markup()
+    # Navigation (prebuilt per folder)
+    rows.extend(_navigation_rows(folder_name))
+    return InlineKeyboardMarkup(inline_keyboard=[list(row) for row in rows])
 
 def build_deposit_amount_keyboard(current_amount: float = 1.0):
     """Build deposit amount selector with +/- buttons"""
@@ -77,20 +85,21 @@ def build_deposit_amount_keyboard(current_amount: float = 1.0):
     
     # Amount controls
     builder.row(
-        InlineKeyboardButton(text="➖", callback_data=f"deposit_minus_{current_amount}"),
-        InlineKeyboardButton(text=f"Enter Qty: {current_amount:.0f}", callback_data="deposit_manual"),
-        InlineKeyboardButton(text="➕", callback_data=f"deposit_plus_{current_amount}")
+        InlineKeyboardButton(text="➖", callback_data=DEPOSIT_MINUS.pack(current_amount)),
+        InlineKeyboardButton(text=f"Enter Qty: {current_amount:.0f}", callback_data=DEPOSIT_METHOD.pack("manual")),
+        InlineKeyboardButton(text="➕", callback_data=DEPOSIT_PLUS.pack(current_amount))
     )
     
     # Checkout button
     builder.row(InlineKeyboardButton(
         text="💳 Checkout",
-        callback_data=f"deposit_checkout_{current_amount}"
+        callback_data=DEPOSIT_CHECKOUT.pack(current_amount)
     ))
     
-    builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data="global_cancel"))
+    builder.row(*CANCEL_ROW)
     return builder.as_markup()
 
+@cached_keyboard
 def build_delivery_method_keyboard():
     builder = InlineKeyboardBuilder()
     builder.row(
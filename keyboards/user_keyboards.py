@@ -1,9 +1,13 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.types import InlineKeyboardButton, KeyboardButton
 
+from keyboards.cache import cached_keyboard
+from keyboards.callbacks import DEPOSIT_METHOD, DEPOSIT_DONE, CHECK_PAYMENT
 from utils.localization import translator
 
+
+@cached_keyboard
 def build_main_menu_keyboard(lang: str):
     b = ReplyKeyboardBuilder()
     b.row(KeyboardButton(text=translator.get_string("btn_check_stock", lang)))
@@ -19,6 +23,7 @@ def build_main_menu_keyboard(lang: str):
     return b.as_markup(resize_keyboard=True)
 
 
+@cached_keyboard
 def build_settings_keyboard(lang: str):
     b = InlineKeyboardBuilder()
 
@@ -39,6 +44,7 @@ def build_settings_keyboard(lang: str):
     b.row(InlineKeyboardButton(text="◀️ Back", callback_data="main_menu_start"))
     return b.as_markup()
 
+@cached_keyboard
 def build_language_selection_keyboard():
     b = InlineKeyboardBuilder()
     b.row(
@@ -49,6 +55,7 @@ def build_language_selection_keyboard():
     b.row(InlineKeyboardButton(text="◀️ Back", callback_data="open_settings"))
     return b.as_markup()
 
+@cached_keyboard
 def build_currency_selection_keyboard():
     b = InlineKeyboardBuilder()
     b.row(
@@ -59,6 +66,7 @@ def build_currency_selection_keyboard():
     b.row(InlineKeyboardButton(text="◀️ Back", callback_data="open_settings"))
     return b.as_markup()
 
+@cached_keyboard
 def build_profile_keyboard():
     b = InlineKeyboardBuilder()
     b.row(
@@ -71,6 +79,10 @@ def build_profile_keyboard():
 
 # --- Other keyboards ---
 def build_subscription_keyboard(channels: List[str]):
+    return _build_subscription_keyboard(tuple(channels))
+
+@cached_keyboard
+def _build_subscription_keyboard(channels: Tuple[str, ...]):
     b = InlineKeyboardBuilder()
     [b.row(InlineKeyboardButton(text=f"🚀 Join {c.lstrip('@')}", url=f"https://t.me/{c.lstrip('@')}")) for c in channels]
     b.row(InlineKeyboardButton(text="🙌 I've Joined", callback_data="check_subscription"))
@@ -80,21 +92,21 @@ def build_payment_methods_keyboard(details: Dict):
     b = InlineKeyboardBuilder()
     methods = list(details.keys())
     for i in range(0, len(methods), 2):
-        row = [InlineKeyboardButton(text=details[methods[i]]['name'], callback_data=f"deposit_{methods[i]}")]
+        row = [InlineKeyboardButton(text=details[methods[i]]['name'], callback_data=DEPOSIT_METHOD.pack(methods[i]))]
         if i + 1 < len(methods):
-            row.append(InlineKeyboardButton(text=details[methods[i+1]]['name'], callback_data=f"deposit_{methods[i+1]}"))
+            row.append(InlineKeyboardButton(text=details[methods[i+1]]['name'], callback_data=DEPOSIT_METHOD.pack(methods[i+1])))
         b.row(*row)
     b.row(InlineKeyboardButton(text="◀️ Back", callback_data="main_menu_start"))
     return b.as_markup()
 
 def build_deposit_confirmation_keyboard(key: str):
     b = InlineKeyboardBuilder()
-    b.row(InlineKeyboardButton(text="✅ Done", callback_data=f"deposit_done_{key}"), InlineKeyboardButton(text="❌ Cancel", callback_data="global_cancel"))
+    b.row(InlineKeyboardButton(text="✅ Done", callback_data=DEPOSIT_DONE.pack(key)), InlineKeyboardButton(text="❌ Cancel", callback_data="global_cancel"))
     return b.as_markup()
 
 def build_crypto_bot_invoice_keyboard(pay_url: str, deposit_id: int):
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="▶️ Pay Now", url=pay_url))
-    builder.row(InlineKeyboardButton(text="✅ I Have Paid", callback_data=f"check_payment_{deposit_id}"))
+    builder.row(InlineKeyboardButton(text="✅ I Have Paid", callback_data=CHECK_PAYMENT.pack(deposit_id)))
     builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data="global_cancel"))
     return builder.as_markup()
\ No newline at end of file
@@ -3,7 +3,7 @@ from aiogram import BaseMiddleware
 from aiogram.types import Update, User as AiogramUser
 
 from config_data.config import config
-from database.models import User
+from utils.ban_list import ban_list
 
 class BanMiddleware(BaseMiddleware):
     async def __call__(
@@ -13,19 +13,19 @@ class BanMiddleware(BaseMiddleware):
         data: Dict[str, Any]
     ) -> Any:
         
-        # We need the user object, which is added by the UserMiddleware
-        # This is why BanMiddleware must run AFTER UserMiddleware
-        db_user: User | None = data.get("user")
+        # Runs FIRST: the sender comes from aiogram's own context middleware and the
+        # ban check is a set lookup, so banned users cost no DB session or API call
+        from_user: AiogramUser | None = data.get("event_from_user")
         
-        # If there's no user object, or if the user is an admin, let them pass
-        if not db_user or db_user.user_id in config.admin_ids:
+        # If there's no sender, or the sender is an admin, let them pass
+        if not from_user or from_user.id in config.admin_ids:
             return await handler(event, data)
         
         # If the user is banned, stop processing
-        if db_user.is_banned:
+        if from_user.id in ban_list:
             # We can optionally send a message, but for simplicity, we'll just ignore them.
             # You could add: await event.answer("You are banned.")
             return
 
         # If not banned, proceed to the next handler
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
@@ -0,0 +1,33 @@
+import logging
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from utils.callback_codec import decode, CallbackError
+
+logger = logging.getLogger(__name__)
+
+class CallbackCodecMiddleware(BaseMiddleware):
+    """
+    Decodes encoded callback data once per callback query and passes the result on as
+    data["callback_spec"] plus one entry per field, for CallbackTable to route. Plain
+    string callbacks pass through untouched. Buttons that no longer decode (usually a
+    folder that was removed since the message was sent) are answered here.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            decoded = decode(event.data)
+        except CallbackError as e:
+            logger.info(f"Stale callback '{event.data}' from {event.from_user.id}: {e}")
+            await event.answer("❌ This menu is out of date. Please open it again.", show_alert=True)
+            return
+        if decoded:
+            spec, values = decoded
+            data["callback_spec"] = spec
+            data.update(values)
+        return await handler(event, data)
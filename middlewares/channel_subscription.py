@@ -1,23 +1,57 @@
-from typing import Callable, Dict, Any, Awaitable, List
+import asyncio
+import logging
+from typing import Callable, Dict, Any, Awaitable, Collection, Sequence
 from aiogram import BaseMiddleware, Bot
 from aiogram.types import Update
 from keyboards.user_keyboards import build_subscription_keyboard
+from utils.membership_cache import membership_cache, MEMBER_STATUSES
+
+logger = logging.getLogger(__name__)
 
 class ChannelSubscriptionMiddleware(BaseMiddleware):
-    def __init__(self, required_channels: List[str], admin_ids: List[int]): super().__init__(); self.required_channels = required_channels; self.admin_ids = admin_ids
+    """
+    Lets a user through only if they are subscribed to every required channel.
+
+    Results are cached per (user, channel) and refreshed by chat_member updates; only
+    the misses are fetched, concurrently. If Telegram errors, the channel counts as
+    joined (fail-open) or not joined (fail-closed), and the result is not cached.
+    """
+    def __init__(self, required_channels: Sequence[str], admin_ids: Collection[int], fail_open: bool = True):
+        super().__init__(); self.required_channels = required_channels; self.admin_ids = admin_ids; self.fail_open = fail_open
+
+    async def _is_member(self, bot: Bot, channel: str, user_id: int) -> bool:
+        try:
+            is_member = (await bot.get_chat_member(chat_id=channel, user_id=user_id)).status in MEMBER_STATUSES
+        except Exception as e:
+            membership_cache.record_api_error()
+            logger.warning(f"Membership check for {user_id} in {channel} failed ({e}); failing {'open' if self.fail_open else 'closed'}.")
+            return self.fail_open
+        membership_cache.set(user_id, channel, is_member)
+        return is_member
+
     async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]], event: Update, data: Dict[str, Any]) -> Any:
         if event.message: user = event.message.from_user
         elif event.callback_query: user = event.callback_query.from_user
         else: return await handler(event, data)
         if not user or user.id in self.admin_ids: return await handler(event, data)
-        bot: Bot = data.get('bot'); unsubscribed = []
+
+        if event.callback_query and event.callback_query.data == "check_subscription":
+            membership_cache.invalidate(user.id, self.required_channels)  # "I've Joined": ask Telegram again
+
+        unsubscribed, misses = [], []
         for channel in self.required_channels:
-            try:
-                if (await bot.get_chat_member(chat_id=channel, user_id=user.id)).status not in ['creator', 'administrator', 'member']: unsubscribed.append(channel)
-            except Exception: unsubscribed.append(channel)
+            cached = membership_cache.get(user.id, channel)
+            if cached is None: misses.append(channel)
+            elif not cached: unsubscribed.append(channel)
+        if misses:
+            bot: Bot = data.get('bot')
+            results = await asyncio.gather(*(self._is_member(bot, channel, user.id) for channel in misses))
+            unsubscribed.extend(channel for channel, is_member in zip(misses, results) if not is_member)
+            unsubscribed.sort(key=self.required_channels.index)
+
         if unsubscribed:
             text = "🚨 <b>Access Denied</b>\n\nTo use this bot, you must join our channels:"; kbd = build_subscription_keyboard(unsubscribed)
             if event.message: await event.message.answer(text, reply_markup=kbd)
             elif event.callback_query: await event.callback_query.answer(); await event.callback_query.message.answer(text, reply_markup=kbd)
             return
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
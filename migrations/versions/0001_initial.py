@@ -0,0 +1,105 @@
+"""Initial schema, as created by Base.metadata.create_all before migrations
+
+Databases created by earlier versions of the bot already have these tables:
+`alembic stamp 0001_initial` marks them as being at this revision.
+
+Revision ID: 0001_initial
+Revises:
+Create Date: 2026-10-17 22:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_initial'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('countries',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('code', sa.String(length=10), nullable=False),
+    sa.Column('flag_emoji', sa.String(length=5), nullable=False),
+    sa.Column('price_per_account', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('stock_count', sa.Integer(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_countries_name'), 'countries', ['name'], unique=True)
+    op.create_table('users',
+    sa.Column('user_id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('username', sa.String(length=32), nullable=True),
+    sa.Column('first_name', sa.String(length=64), nullable=False),
+    sa.Column('balance', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('registration_date', sa.DateTime(), nullable=False),
+    sa.Column('language_code', sa.String(length=10), nullable=False),
+    sa.Column('currency', sa.String(length=5), nullable=False),
+    sa.Column('is_banned', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_users_is_banned'), 'users', ['is_banned'], unique=False)
+    op.create_table('accounts',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('country_id', sa.Integer(), nullable=False),
+    sa.Column('phone_number', sa.String(length=30), nullable=False),
+    sa.Column('session_file', sa.LargeBinary(), nullable=False),
+    sa.Column('tdata_path', sa.Text(), nullable=True),
+    sa.Column('is_sold', sa.Boolean(), nullable=False),
+    sa.Column('added_date', sa.DateTime(), nullable=False),
+    sa.Column('buyer_id', sa.BigInteger(), nullable=True),
+    sa.Column('sold_date', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['buyer_id'], ['users.user_id'], ),
+    sa.ForeignKeyConstraint(['country_id'], ['countries.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('phone_number')
+    )
+    op.create_index(op.f('ix_accounts_is_sold'), 'accounts', ['is_sold'], unique=False)
+    op.create_table('deposits',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('payment_method', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('screenshot_file_id', sa.Text(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('admin_channel_message_id', sa.BigInteger(), nullable=True),
+    sa.Column('invoice_id', sa.BigInteger(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_deposits_invoice_id'), 'deposits', ['invoice_id'], unique=False)
+    op.create_index(op.f('ix_deposits_status'), 'deposits', ['status'], unique=False)
+    op.create_table('withdrawals',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('address', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_withdrawals_status'), 'withdrawals', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_withdrawals_status'), table_name='withdrawals')
+    op.drop_table('withdrawals')
+    op.drop_index(op.f('ix_deposits_status'), table_name='deposits')
+    op.drop_index(op.f('ix_deposits_invoice_id'), table_name='deposits')
+    op.drop_table('deposits')
+    op.drop_index(op.f('ix_accounts_is_sold'), table_name='accounts')
+    op.drop_table('accounts')
+    op.drop_index(op.f('ix_users_is_banned'), table_name='users')
+    op.drop_table('users')
+    op.drop_index(op.f('ix_countries_name'), table_name='countries')
+    op.drop_table('countries')
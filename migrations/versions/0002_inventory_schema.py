@@ -0,0 +1,211 @@
+"""Inventory schema: session blob store, sync manifest, sold-file journal, bundles
+
+Moves accounts.session_file into the configured blob store (BLOB_STORE) keyed by
+its SHA-256, which accounts.session_hash now references. Tables that
+create_all already added on a bot start are left as they are.
+
+Purchases only claim accounts the sync manifest places in the browsed folder, so
+the manifest is filled from the files on disk for every existing account; files
+without an account row are left to the next admin sync to import.
+
+Revision ID: 0002_inventory_schema
+Revises: 0001_initial
+Create Date: 2026-10-17 22:20:00.000000
+
+"""
+import hashlib
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from config_data.config import config
+from utils.blob_store import LocalDiskBlobStore
+from utils.stock_index import is_product_file
+from utils.stock_manager import ACCOUNTS_DIR, get_country_name
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_inventory_schema'
+down_revision: Union[str, Sequence[str], None] = '0001_initial'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 500
+
+accounts = sa.table('accounts', sa.column('id', sa.Integer), sa.column('country_id', sa.Integer), sa.column('phone_number', sa.String), sa.column('session_file', sa.LargeBinary), sa.column('session_hash', sa.String))
+countries = sa.table('countries', sa.column('id', sa.Integer), sa.column('name', sa.String))
+session_blobs = sa.table('session_blobs', sa.column('content_hash', sa.String), sa.column('data', sa.LargeBinary))
+sync_manifest = sa.table(
+    'sync_manifest',
+    sa.column('folder', sa.String), sa.column('file_name', sa.String), sa.column('country_id', sa.Integer),
+    sa.column('size', sa.BigInteger), sa.column('mtime_ns', sa.BigInteger), sa.column('content_hash', sa.String),
+)
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _has_index(table: str, name: str) -> bool:
+    return any(ix['name'] == name for ix in sa.inspect(op.get_bind()).get_indexes(table))
+
+
+def _move_session_files():
+    """Hashes every accounts.session_file into session_hash and stores the body as a blob."""
+    bind = op.get_bind()
+    local = LocalDiskBlobStore(config.blob_store_dir) if config.blob_store == 'local' else None
+    ids = bind.execute(sa.select(accounts.c.id).order_by(accounts.c.id)).scalars().all()
+    for start in range(0, len(ids), BATCH_SIZE):
+        rows = bind.execute(
+            sa.select(accounts.c.id, accounts.c.session_file).where(accounts.c.id.in_(ids[start:start + BATCH_SIZE]))
+        ).all()
+        hashes = {row.id: hashlib.sha256(row.session_file).hexdigest() for row in rows}
+        blobs = {hashes[row.id]: row.session_file for row in rows}
+        if local:
+            local._write_many(blobs)
+        else:
+            stored = set(bind.execute(sa.select(session_blobs.c.content_hash).where(session_blobs.c.content_hash.in_(list(blobs)))).scalars())
+            new_blobs = [{'content_hash': key, 'data': data} for key, data in blobs.items() if key not in stored]
+            if new_blobs:
+                bind.execute(session_blobs.insert(), new_blobs)
+        bind.execute(
+            accounts.update().where(accounts.c.id == sa.bindparam('account_id')).values(session_hash=sa.bindparam('hash')),
+            [{'account_id': account_id, 'hash': key} for account_id, key in hashes.items()],
+        )
+
+
+def _fill_sync_manifest():
+    """
+    Adds a manifest entry for each file in ACCOUNTS_DIR that belongs to an existing
+    account of the folder's country, as a sync would have. sync_folders stays empty, so
+    the next sync still lists every folder and imports the files left out here.
+    """
+    if not os.path.isdir(ACCOUNTS_DIR):
+        return
+    bind = op.get_bind()
+    country_ids = {name: country_id for country_id, name in bind.execute(sa.select(countries.c.id, countries.c.name))}
+    known = {(r.folder, r.file_name) for r in bind.execute(sa.select(sync_manifest.c.folder, sync_manifest.c.file_name))}
+    for folder in sorted(os.listdir(ACCOUNTS_DIR)):
+        folder_path = os.path.join(ACCOUNTS_DIR, folder)
+        country_id = country_ids.get(get_country_name(folder))
+        if country_id is None or folder.lower() == 'sold' or not os.path.isdir(folder_path):
+            continue
+        phones = set(bind.execute(sa.select(accounts.c.phone_number).where(accounts.c.country_id == country_id)).scalars())
+        names = [
+            name for name in sorted(os.listdir(folder_path))
+            if is_product_file(name) and os.path.splitext(name)[0] in phones and (folder, name) not in known
+        ]
+        for start in range(0, len(names), BATCH_SIZE):
+            rows = []
+            for name in names[start:start + BATCH_SIZE]:
+                with open(os.path.join(folder_path, name), 'rb') as f:
+                    st = os.fstat(f.fileno())
+                    data = f.read()
+                rows.append({
+                    'folder': folder, 'file_name': name, 'country_id': country_id,
+                    'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'content_hash': hashlib.sha256(data).hexdigest(),
+                })
+            bind.execute(sync_manifest.insert(), rows)
+
+
+def _restore_session_files():
+    """Inverse of _move_session_files: copies blob bodies back into accounts.session_file."""
+    bind = op.get_bind()
+    local = LocalDiskBlobStore(config.blob_store_dir) if config.blob_store == 'local' else None
+    ids = bind.execute(sa.select(accounts.c.id).order_by(accounts.c.id)).scalars().all()
+    for start in range(0, len(ids), BATCH_SIZE):
+        hashes = dict(bind.execute(
+            sa.select(accounts.c.id, accounts.c.session_hash).where(accounts.c.id.in_(ids[start:start + BATCH_SIZE]))
+        ).all())
+        if local:
+            blobs = local._read_many(hashes.values())
+        else:
+            blobs = dict(bind.execute(
+                sa.select(session_blobs.c.content_hash, session_blobs.c.data).where(session_blobs.c.content_hash.in_(list(hashes.values())))
+            ).all())
+        missing = [account_id for account_id, key in hashes.items() if key not in blobs]
+        if missing:
+            raise RuntimeError(f"Cannot downgrade: no stored session file for account(s) {missing[:10]}")
+        bind.execute(
+            accounts.update().where(accounts.c.id == sa.bindparam('account_id')).values(session_file=sa.bindparam('data')),
+            [{'account_id': account_id, 'data': blobs[key]} for account_id, key in hashes.items()],
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_table('session_blobs'):
+        op.create_table('session_blobs',
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('content_hash')
+        )
+    if not _has_table('sold_file_moves'):
+        op.create_table('sold_file_moves',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('folder', sa.String(length=255), nullable=False),
+        sa.Column('file_name', sa.String(length=255), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_table('sync_folders'):
+        op.create_table('sync_folders',
+        sa.Column('folder', sa.String(length=255), nullable=False),
+        sa.Column('country_id', sa.Integer(), nullable=False),
+        sa.Column('mtime_ns', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('folder')
+        )
+        op.create_index(op.f('ix_sync_folders_country_id'), 'sync_folders', ['country_id'], unique=False)
+    if not _has_table('sync_manifest'):
+        op.create_table('sync_manifest',
+        sa.Column('folder', sa.String(length=255), nullable=False),
+        sa.Column('file_name', sa.String(length=255), nullable=False),
+        sa.Column('country_id', sa.Integer(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('mtime_ns', sa.BigInteger(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.PrimaryKeyConstraint('folder', 'file_name')
+        )
+        op.create_index(op.f('ix_sync_manifest_country_id'), 'sync_manifest', ['country_id'], unique=False)
+
+    # Nullable until every row has a hash, then tightened along with dropping session_file
+    with op.batch_alter_table('accounts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('session_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('bundle_id', sa.String(length=32), nullable=True))
+    _move_session_files()
+    with op.batch_alter_table('accounts', schema=None) as batch_op:
+        batch_op.alter_column('session_hash', existing_type=sa.String(length=64), nullable=False)
+        batch_op.drop_column('session_file')
+        batch_op.create_index(batch_op.f('ix_accounts_bundle_id'), ['bundle_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_accounts_session_hash'), ['session_hash'], unique=False)
+
+    if not _has_index('countries', 'ix_countries_stock_count'):
+        with op.batch_alter_table('countries', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_countries_stock_count'), ['stock_count'], unique=False)
+
+    _fill_sync_manifest()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('countries', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_countries_stock_count'))
+
+    with op.batch_alter_table('accounts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('session_file', sa.LargeBinary(), nullable=True))
+    _restore_session_files()
+    with op.batch_alter_table('accounts', schema=None) as batch_op:
+        batch_op.alter_column('session_file', existing_type=sa.LargeBinary(), nullable=False)
+        batch_op.drop_index(batch_op.f('ix_accounts_session_hash'))
+        batch_op.drop_index(batch_op.f('ix_accounts_bundle_id'))
+        batch_op.drop_column('bundle_id')
+        batch_op.drop_column('session_hash')
+
+    op.drop_index(op.f('ix_sync_manifest_country_id'), table_name='sync_manifest')
+    op.drop_table('sync_manifest')
+    op.drop_index(op.f('ix_sync_folders_country_id'), table_name='sync_folders')
+    op.drop_table('sync_folders')
+    op.drop_table('sold_file_moves')
+    op.drop_table('session_blobs')
@@ -0,0 +1,45 @@
+"""Indexes for the hot queries
+
+- accounts.buyer_id: purchase count on the profile screen
+- accounts (country_id, is_sold): stock counts, claims and folder sync
+- deposits (user_id, status): a user's deposits by status
+- deposits (status, amount): the approved-income total, read from the index alone
+- users.username: admin lookup by @username
+- users.registration_date: new users per day
+
+Revision ID: 0003_hot_query_indexes
+Revises: 0002_inventory_schema
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_hot_query_indexes'
+down_revision: Union[str, Sequence[str], None] = '0002_inventory_schema'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_accounts_buyer_id'), 'accounts', ['buyer_id'], unique=False)
+    op.create_index('ix_accounts_country_id_is_sold', 'accounts', ['country_id', 'is_sold'], unique=False)
+    op.create_index('ix_deposits_user_id_status', 'deposits', ['user_id', 'status'], unique=False)
+    op.create_index('ix_deposits_status_amount', 'deposits', ['status', 'amount'], unique=False)
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=False)
+    op.create_index(op.f('ix_users_registration_date'), 'users', ['registration_date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_registration_date'), table_name='users')
+    op.drop_index(op.f('ix_users_username'), table_name='users')
+    op.drop_index('ix_deposits_status_amount', table_name='deposits')
+    op.drop_index('ix_deposits_user_id_status', table_name='deposits')
+    op.drop_index('ix_accounts_country_id_is_sold', table_name='accounts')
+    op.drop_index(op.f('ix_accounts_buyer_id'), table_name='accounts')
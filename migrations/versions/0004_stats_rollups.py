@@ -0,0 +1,47 @@
+"""Statistics rollups (see database/stats.py)
+
+The tables start empty: fill them from existing data with
+`python -m database.stats backfill` before starting the bot.
+
+Revision ID: 0004_stats_rollups
+Revises: 0003_hot_query_indexes
+Create Date: 2026-10-17 22:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_stats_rollups'
+down_revision: Union[str, Sequence[str], None] = '0003_hot_query_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('country_sales_rollups',
+    sa.Column('period', sa.String(length=10), nullable=False),
+    sa.Column('country_id', sa.Integer(), nullable=False),
+    sa.Column('accounts_sold', sa.Integer(), nullable=False),
+    sa.Column('sales_revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('period', 'country_id')
+    )
+    op.create_table('stats_rollups',
+    sa.Column('period', sa.String(length=10), nullable=False),
+    sa.Column('new_users', sa.Integer(), nullable=False),
+    sa.Column('deposits_approved', sa.Integer(), nullable=False),
+    sa.Column('approved_income', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('accounts_sold', sa.Integer(), nullable=False),
+    sa.Column('sales_revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('period')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('stats_rollups')
+    op.drop_table('country_sales_rollups')
@@ -0,0 +1,69 @@
+"""
+Stock that existed before the inventory schema must stay claimable after
+`alembic upgrade head`: purchases only claim accounts the sync manifest places in
+the browsed folder, so migration 0002 has to fill the manifest from disk.
+"""
+import asyncio
+import os
+import sqlite3
+from decimal import Decimal
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config_data.config import config
+from database.engine import create_engine_for
+from database.inventory import claim_accounts
+from database.models import SoldFileMove, SyncManifest
+from database.schema import ALEMBIC_INI
+from utils.stock_manager import ACCOUNTS_DIR
+
+FOLDER = '+95 Myanmar'
+PHONES = ['959000000001', '959000000002', '959000000003']
+
+
+def _legacy_database(path: str):
+    """A database at 0001_initial with three accounts stored inline, as create_all left them."""
+    with sqlite3.connect(path) as db:
+        db.execute("INSERT INTO countries (id, name, code, flag_emoji, price_per_account, stock_count, is_active) VALUES (1, 'Myanmar', '+95', '🇲🇲', 1.50, 3, 1)")
+        db.execute("INSERT INTO users (user_id, first_name, balance, registration_date, language_code, currency, is_banned) VALUES (42, 'buyer', 10.00, '2026-01-01 00:00:00', 'en', 'USD', 0)")
+        db.executemany(
+            "INSERT INTO accounts (country_id, phone_number, session_file, is_sold, added_date) VALUES (1, ?, ?, 0, '2026-01-01 00:00:00')",
+            [(phone, phone.encode()) for phone in PHONES],
+        )
+
+
+def test_preexisting_stock_is_claimable_after_upgrade(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    folder_path = os.path.join(ACCOUNTS_DIR, FOLDER)
+    os.makedirs(folder_path)
+    for phone in PHONES + ['959000000099']:  # The last file has no account yet
+        with open(os.path.join(folder_path, f"{phone}.session"), 'wb') as f:
+            f.write(phone.encode())
+
+    db_path = str(tmp_path / 'bot.db')
+    monkeypatch.setattr(config, 'db_url', f"sqlite+aiosqlite:///{db_path}")
+    monkeypatch.setattr(config, 'blob_store', 'database')
+    alembic_config = Config(ALEMBIC_INI)
+    command.upgrade(alembic_config, '0001_initial')
+    _legacy_database(db_path)
+    command.upgrade(alembic_config, 'head')
+
+    async def claim():
+        engine = create_engine_for(config.db_url)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                claimed, balance = await claim_accounts(session, 1, 42, 2, Decimal('3.00'), FOLDER)
+                manifest = set((await session.execute(select(SyncManifest.file_name))).scalars())
+                moves = (await session.execute(select(SoldFileMove.folder, SoldFileMove.file_name))).all()
+            return claimed, balance, manifest, moves
+        finally:
+            await engine.dispose()
+
+    claimed, balance, manifest, moves = asyncio.run(claim())
+    assert [a.phone_number for a in claimed] == PHONES[:2]
+    assert balance == Decimal('7.00')
+    assert manifest == {f"{phone}.session" for phone in PHONES}
+    assert sorted(moves) == [(FOLDER, f"{phone}.session") for phone in PHONES[:2]]
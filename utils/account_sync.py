@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.engine import dialect_insert
+from database.stock_counters import adjust_stock_counts
+from database.models import Account, Country, SyncFolder, SyncManifest
+from utils.blob_store import blob_store, content_hash
+from utils.stock_index import is_product_file
+from utils.stock_manager import ACCOUNTS_DIR, get_country_name
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200  # Files read, hashed and inserted per round trip.
+PROGRESS_INTERVAL = 1.5  # Minimum seconds between progress message edits.
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class SyncReport:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    scanned_files: int = 0
+    changed_folders: List[str] = field(default_factory=list)
+    folders_skipped: int = 0
+    unmatched_folders: List[str] = field(default_factory=list)
+    created_dir: bool = False
+
+
+# --- Filesystem helpers (run in a worker thread) ---
+def _list_root(root: str) -> Optional[List[Tuple[str, int]]]:
+    """[(folder_name, mtime_ns)] for every category folder, or None if the root was missing."""
+    if not os.path.isdir(root):
+        os.makedirs(root, exist_ok=True)
+        return None
+    with os.scandir(root) as it:
+        return sorted(
+            (entry.name, entry.stat().st_mtime_ns)
+            for entry in it
+            if entry.is_dir() and entry.name.lower() != 'sold'
+        )
+
+def _list_folder(folder_path: str) -> Dict[str, Tuple[int, int]]:
+    """{file_name: (size, mtime_ns)} for the product files of one folder."""
+    listing = {}
+    try:
+        with os.scandir(folder_path) as it:
+            for entry in it:
+                if is_product_file(entry.name):
+                    st = entry.stat()
+                    listing[entry.name] = (st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return listing
+
+def _read_batch(folder_path: str, names: List[str]) -> List[Tuple[str, int, int, str, bytes]]:
+    """Reads and hashes one batch of files: [(name, size, mtime_ns, sha256, data)]."""
+    result = []
+    for name in names:
+        path = os.path.join(folder_path, name)
+        try:
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except OSError as e:
+            logger.error(f"Error reading file {path}: {e}")
+            continue
+        result.append((name, st.st_size, st.st_mtime_ns, content_hash(data), data))
+    return result
+
+def _phone_from_file(file_name: str) -> str:
+    return os.path.splitext(file_name)[0]
+
+def _chunks(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# --- Sync ---
+class _Progress:
+    def __init__(self, callback: Optional[ProgressCallback]):
+        self.callback = callback
+        self.last = 0.0
+
+    async def report(self, report: SyncReport, folder_name: str):
+        now = time.monotonic()
+        if not self.callback or now - self.last < PROGRESS_INTERVAL:
+            return
+        self.last = now
+        await self.callback(
+            f"⏳ <b>Synchronizing...</b>\n\n"
+            f"  - Folder: <code>{folder_name}</code>\n"
+            f"  - Files checked: {report.scanned_files}\n"
+            f"  - Added: {report.added} | Updated: {report.updated} | Removed: {report.removed}"
+        )
+
+
+async def sync_accounts(session: AsyncSession, progress: Optional[ProgressCallback] = None) -> SyncReport:
+    """
+    Incrementally syncs ACCOUNTS_DIR into the accounts table.
+
+    A manifest of (folder, file, size, mtime, sha256) is kept in the database. Folders
+    whose directory mtime has not moved since the last sync are skipped without being
+    listed; inside changed folders only files whose size/mtime differ from the manifest
+    are read, in bounded batches that are bulk-inserted with ON CONFLICT DO NOTHING.
+    Country stock counters are adjusted in the same transactions as the rows.
+    """
+    report = SyncReport()
+    tracker = _Progress(progress)
+
+    root_listing = await asyncio.to_thread(_list_root, ACCOUNTS_DIR)
+    if root_listing is None:
+        report.created_dir = True
+        return report
+
+    countries = {c.name: c.id for c in (await session.execute(select(Country))).scalars()}
+    known_folders = dict((await session.execute(select(SyncFolder.folder, SyncFolder.mtime_ns))).all())
+
+    for folder_name, mtime_ns in root_listing:
+        last_mtime_ns = known_folders.pop(folder_name, None)
+        country_id = countries.get(get_country_name(folder_name))
+        if country_id is None:
+            report.unmatched_folders.append(folder_name)
+            continue
+        if last_mtime_ns == mtime_ns:
+            report.folders_skipped += 1
+            continue
+        await _sync_folder(session, folder_name, country_id, mtime_ns, report, tracker)
+
+    # Folders that disappeared from disk since the last sync
+    for folder_name in known_folders:
+        await _sync_folder(session, folder_name, None, None, report, tracker)
+
+    await session.commit()
+    return report
+
+
+async def _sync_folder(session: AsyncSession, folder_name: str, country_id: Optional[int], mtime_ns: Optional[int], report: SyncReport, tracker: _Progress):
+    folder_path = os.path.join(ACCOUNTS_DIR, folder_name)
+    report.changed_folders.append(folder_name)
+
+    disk = await asyncio.to_thread(_list_folder, folder_path) if mtime_ns is not None else {}
+    manifest = {
+        name: (size, file_mtime_ns)
+        for name, size, file_mtime_ns in (await session.execute(
+            select(SyncManifest.file_name, SyncManifest.size, SyncManifest.mtime_ns)
+            .where(SyncManifest.folder == folder_name)
+        )).all()
+    }
+    report.scanned_files += len(disk)
+
+    changed = [name for name, stat in disk.items() if manifest.get(name) != stat]
+    removed = [name for name in manifest if name not in disk]
+
+    for batch in _chunks(changed, BATCH_SIZE):
+        entries = await asyncio.to_thread(_read_batch, folder_path, batch)
+        known_hashes = dict((await session.execute(
+            select(SyncManifest.file_name, SyncManifest.content_hash)
+            .where(SyncManifest.folder == folder_name, SyncManifest.file_name.in_([e[0] for e in entries]))
+        )).all()) if entries else {}
+        new_accounts = []
+        blobs = {}
+        for name, size, file_mtime_ns, file_hash, data in entries:
+            previous_hash = known_hashes.get(name)
+            if previous_hash == file_hash:
+                continue
+            blobs[file_hash] = data
+            if previous_hash is None:
+                new_accounts.append({'country_id': country_id, 'phone_number': _phone_from_file(name), 'session_hash': file_hash})
+            else:
+                result = await session.execute(
+                    update(Account)
+                    .where(Account.phone_number == _phone_from_file(name), Account.is_sold == False)
+                    .values(session_hash=file_hash)
+                )
+                report.updated += result.rowcount
+        await blob_store.put_many(session, blobs)
+        if new_accounts:
+            inserted = await session.execute(
+                dialect_insert(Account)
+                .on_conflict_do_nothing(index_elements=[Account.phone_number])
+                .returning(Account.id),
+                new_accounts,
+            )
+            added = len(inserted.all())
+            report.added += added
+            await adjust_stock_counts(session, {country_id: added})
+        if entries:
+            stmt = dialect_insert(SyncManifest)
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[SyncManifest.folder, SyncManifest.file_name],
+                    set_={'country_id': stmt.excluded.country_id, 'size': stmt.excluded.size, 'mtime_ns': stmt.excluded.mtime_ns, 'content_hash': stmt.excluded.content_hash},
+                ),
+                [
+                    {'folder': folder_name, 'file_name': name, 'country_id': country_id, 'size': size, 'mtime_ns': file_mtime_ns, 'content_hash': file_hash}
+                    for name, size, file_mtime_ns, file_hash, _ in entries
+                ],
+            )
+        await session.commit()
+        await tracker.report(report, folder_name)
+
+    for batch in _chunks(removed, BATCH_SIZE):
+        await session.execute(delete(SyncManifest).where(SyncManifest.folder == folder_name, SyncManifest.file_name.in_(batch)))
+        deleted = (await session.execute(
+            delete(Account)
+            .where(Account.phone_number.in_([_phone_from_file(name) for name in batch]), Account.is_sold == False)
+            .returning(Account.country_id)
+        )).scalars().all()
+        report.removed += len(deleted)
+        await adjust_stock_counts(session, {cid: -n for cid, n in Counter(deleted).items()})
+
+    if mtime_ns is None:
+        await session.execute(delete(SyncFolder).where(SyncFolder.folder == folder_name))
+    else:
+        stmt = dialect_insert(SyncFolder).values(folder=folder_name, country_id=country_id, mtime_ns=mtime_ns)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[SyncFolder.folder],
+            set_={'country_id': stmt.excluded.country_id, 'mtime_ns': stmt.excluded.mtime_ns},
+        ))
+    await session.commit()
+    await tracker.report(report, folder_name)
+
+
+async def forget_country(session: AsyncSession, country_id: int):
+    """Drops manifest entries of a deleted country so its folders are re-imported if it is re-added."""
+    await session.execute(delete(SyncManifest).where(SyncManifest.country_id == country_id))
+    await session.execute(delete(SyncFolder).where(SyncFolder.country_id == country_id))
@@ -0,0 +1,40 @@
+import logging
+from typing import FrozenSet
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class BanList:
+    """
+    Ids of banned users, held in memory so banned users can be dropped before any
+    database or Telegram call. Loaded once at startup; the admin ban/unban handlers
+    keep it in step with users.is_banned.
+    """
+
+    def __init__(self):
+        self._banned: FrozenSet[int] = frozenset()
+
+    async def load(self, session: AsyncSession):
+        self._banned = frozenset((await session.execute(select(User.user_id).where(User.is_banned == True))).scalars())
+        logger.info(f"Loaded {len(self._banned)} banned user(s).")
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._banned
+
+    def __len__(self) -> int:
+        return len(self._banned)
+
+    def ban(self, user_id: int):
+        self._banned = self._banned | {user_id}
+
+    def unban(self, user_id: int):
+        self._banned = self._banned - {user_id}
+
+
+# Global instance
+ban_list = BanList()
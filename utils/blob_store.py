@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import os
+import tempfile
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config_data.config import config
+from database.engine import dialect_insert
+from database.models import SessionBlob
+
+
+def content_hash(data: bytes) -> str:
+    """The key a blob is stored under: its SHA-256 hex digest."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class MissingBlobs(Exception):
+    """Some requested blobs are not in the store."""
+
+    def __init__(self, keys: List[str]):
+        super().__init__(f"{len(keys)} blob(s) missing: {', '.join(keys[:5])}{'...' if len(keys) > 5 else ''}")
+        self.keys = keys
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed storage for session file bodies.
+
+    Blobs are keyed by content_hash(), so storing the same file twice is a no-op.
+    Every call takes the caller's session so the database backend can write in the
+    same transaction as the rows that reference the blob; other backends ignore it.
+    """
+
+    @abstractmethod
+    async def put_many(self, session: AsyncSession, blobs: Dict[str, bytes]):
+        """Stores {content_hash: data}. Keys must come from content_hash()."""
+
+    @abstractmethod
+    async def get_many(self, session: AsyncSession, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Returns {content_hash: data} for the keys that exist."""
+
+    async def get_all(self, session: AsyncSession, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Like get_many, but raises MissingBlobs unless every key exists."""
+        keys = list(keys)
+        blobs = await self.get_many(session, keys)
+        missing = sorted(set(keys) - blobs.keys())
+        if missing:
+            raise MissingBlobs(missing)
+        return blobs
+
+
+class DatabaseBlobStore(BlobStore):
+    """Keeps blobs in the session_blobs table."""
+
+    async def put_many(self, session: AsyncSession, blobs: Dict[str, bytes]):
+        if not blobs:
+            return
+        await session.execute(
+            dialect_insert(SessionBlob).on_conflict_do_nothing(index_elements=[SessionBlob.content_hash]),
+            [{'content_hash': key, 'data': data} for key, data in blobs.items()],
+        )
+
+    async def get_many(self, session: AsyncSession, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        rows = await session.execute(select(SessionBlob.content_hash, SessionBlob.data).where(SessionBlob.content_hash.in_(keys)))
+        return dict(rows.all())
+
+
+class LocalDiskBlobStore(BlobStore):
+    """Keeps blobs as files under root/<first two hex chars>/<hash>."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _write_many(self, blobs: Dict[str, bytes]):
+        for key, data in blobs.items():
+            path = self._path(key)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def _read_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        result = {}
+        for key in set(keys):
+            try:
+                with open(self._path(key), 'rb') as f:
+                    result[key] = f.read()
+            except FileNotFoundError:
+                continue
+        return result
+
+    async def put_many(self, session: AsyncSession, blobs: Dict[str, bytes]):
+        if blobs:
+            await asyncio.to_thread(self._write_many, blobs)
+
+    async def get_many(self, session: AsyncSession, keys: Iterable[str]) -> Dict[str, bytes]:
+        return await asyncio.to_thread(self._read_many, list(keys))
+
+
+def create_blob_store(backend: str, directory: str) -> BlobStore:
+    if backend == 'local':
+        return LocalDiskBlobStore(directory)
+    if backend == 'database':
+        return DatabaseBlobStore()
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend!r} (expected 'database' or 'local')")
+
+
+# Global instance
+blob_store = create_blob_store(config.blob_store, config.blob_store_dir)
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from config_data.config import config
+from database.engine import async_session_factory
+from database.inventory import ClaimedAccount, reserve_bundle, release_bundles
+from database.models import Country
+from utils.blob_store import blob_store, MissingBlobs
+from utils.delivery import DeliveryPart, build_delivery, display_name
+from utils.reservations import reservations
+from utils.stock_index import stock_index
+
+logger = logging.getLogger(__name__)
+
+REFILL_INTERVAL = 60  # Seconds between refill passes when nothing wakes the packer earlier.
+
+Sku = Tuple[str, int]  # (folder_name, quantity)
+
+
+@dataclass
+class Bundle:
+    """A ready-to-send archive whose accounts are reserved in the database under bundle_id."""
+    bundle_id: str
+    folder_name: str
+    country_id: int
+    quantity: int
+    accounts: List[ClaimedAccount]
+    part: DeliveryPart
+
+    @property
+    def file_names(self) -> List[str]:
+        return [acc.file_name for acc in self.accounts]
+
+
+class BundlePacker:
+    """
+    Keeps a small pool of pre-built, pre-reserved delivery bundles for the most ordered
+    (folder, quantity) combinations, so a purchase can hand over an archive immediately.
+
+    Bundled accounts are marked with Account.bundle_id, which the regular claim query
+    skips; they only leave the bundle by being sold with it or by the bundle being
+    dissolved. Pools live in memory, so every reservation is released at startup.
+    """
+
+    def __init__(self, enabled: bool, quantities: Iterable[int], hot_skus: int, pool_size: int):
+        self.enabled = enabled
+        self.quantities = frozenset(quantities)
+        self.hot_skus = hot_skus
+        self.pool_size = pool_size
+        self._pools: Dict[Sku, Deque[Bundle]] = {}
+        self._demand: Counter = Counter()
+        self._epochs: Counter = Counter()  # Bumped per folder on invalidation; discards bundles packed across it
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Purchase side ---
+    def record_order(self, folder_name: str, quantity: int):
+        if self.enabled and quantity in self.quantities:
+            self._demand[(folder_name, quantity)] += 1
+            self._wakeup.set()
+
+    def take(self, folder_name: str, quantity: int) -> Optional[Bundle]:
+        pool = self._pools.get((folder_name, quantity))
+        if not pool:
+            return None
+        self._wakeup.set()
+        return pool.popleft()
+
+    def put_back(self, bundle: Bundle):
+        """Returns an untouched bundle to the front of its pool (e.g. the buyer could not pay)."""
+        self._pools.setdefault((bundle.folder_name, bundle.quantity), deque()).appendleft(bundle)
+
+    def notify_stock_changed(self):
+        if self.enabled:
+            self._wakeup.set()
+
+    # --- Invalidation ---
+    async def discard(self, bundles: Iterable[Bundle]):
+        """Drops bundles and returns their accounts to free stock."""
+        bundles = list(bundles)
+        if not bundles:
+            return
+        for bundle in bundles:
+            bundle.part.cleanup()
+        async with async_session_factory() as session:
+            await release_bundles(session, [b.bundle_id for b in bundles])
+
+    async def invalidate_folders(self, folder_names: Iterable[str]) -> int:
+        """Dissolves every bundle of the given folders. Returns how many were dropped."""
+        folder_names = set(folder_names)
+        dropped = []
+        for sku in [sku for sku in self._pools if sku[0] in folder_names]:
+            dropped.extend(self._pools.pop(sku))
+        for folder_name in folder_names:
+            self._epochs[folder_name] += 1
+        await self.discard(dropped)
+        return len(dropped)
+
+    async def invalidate_country(self, country_id: int, country_name: str) -> int:
+        folder_names = {b.folder_name for pool in self._pools.values() for b in pool if b.country_id == country_id}
+        folder_names.update(f.name for f in stock_index.folders() if f.country_name == country_name)
+        return await self.invalidate_folders(folder_names)
+
+    # --- Packing ---
+    def _bundled(self, folder_name: str) -> int:
+        return sum(b.quantity for (name, _), pool in self._pools.items() if name == folder_name for b in pool)
+
+    async def _pack(self, folder_name: str, quantity: int) -> Optional[Bundle]:
+        folder = stock_index.get(folder_name)
+        if not folder:
+            return None
+        # Never bundle units that buyers are holding or that would leave no free stock behind
+        free = folder.count - reservations.held(folder_name) - self._bundled(folder_name)
+        if free < 2 * quantity:
+            return None
+
+        epoch = self._epochs[folder_name]
+        bundle_id = uuid.uuid4().hex
+        async with async_session_factory() as session:
+            country_id = (await session.execute(select(Country.id).where(Country.name == folder.country_name))).scalar_one_or_none()
+            if country_id is None:
+                return None
+            accounts = await reserve_bundle(session, country_id, folder_name, bundle_id, quantity)
+            if not accounts:
+                return None
+            try:
+                blobs = await blob_store.get_all(session, [acc.session_hash for acc in accounts])
+            except MissingBlobs as e:
+                # Never pack an empty session file; leave the accounts to regular claims
+                logger.error(f"Not packing {folder_name} x{quantity}: {e}")
+                await release_bundles(session, [bundle_id])
+                return None
+
+        files = [(acc.file_name, blobs[acc.session_hash]) for acc in accounts]
+        parts = [part async for part in build_delivery(files, f"{display_name(folder_name)}_x{quantity}")]
+        bundle = Bundle(bundle_id, folder_name, country_id, quantity, accounts, parts[0])
+        if len(parts) != 1 or self._epochs[folder_name] != epoch:
+            # Too large for a single archive, or the folder was invalidated while packing
+            for part in parts[1:]:
+                part.cleanup()
+            await self.discard([bundle])
+            return None
+        return bundle
+
+    async def refill(self):
+        hot = [sku for sku, _ in self._demand.most_common(self.hot_skus)]
+        cold = [sku for sku in self._pools if sku not in hot]
+        for sku in cold:
+            await self.discard(self._pools.pop(sku))
+
+        for sku in hot:
+            pool = self._pools.setdefault(sku, deque())
+            while len(pool) < self.pool_size:
+                bundle = await self._pack(*sku)
+                if not bundle:
+                    break
+                # The folder's pool may have been replaced by an invalidation while packing
+                self._pools.setdefault(sku, deque()).append(bundle)
+                pool = self._pools[sku]
+
+    # --- Lifecycle ---
+    async def start(self):
+        # Pools do not survive a restart, so neither may their reservations
+        async with async_session_factory() as session:
+            await release_bundles(session)
+        if self.enabled and (not self._task or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        for pool in self._pools.values():
+            for bundle in pool:
+                bundle.part.cleanup()
+        self._pools.clear()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.refill()
+            except Exception as e:
+                logger.error(f"Bundle refill failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=REFILL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Global instance
+bundle_packer = BundlePacker(
+    enabled=config.bundle_packer_enabled,
+    quantities=config.bundle_quantities,
+    hot_skus=config.bundle_hot_skus,
+    pool_size=config.bundle_pool_size,
+)
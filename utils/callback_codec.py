@@ -0,0 +1,150 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import CallbackQuery
+
+from utils.stock_index import folder_id, stock_index
+
+SEP = ':'
+MAX_CALLBACK_BYTES = 64  # Telegram's limit on callback_data
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+class CallbackError(ValueError):
+    """Raised for payloads that cannot be packed, or no longer decode (e.g. a removed folder)."""
+
+
+def _to_base36(value: int) -> str:
+    if value < 0:
+        raise CallbackError(f"Negative value {value} cannot be packed")
+    out = []
+    while True:
+        value, digit = divmod(value, 36)
+        out.append(_DIGITS[digit])
+        if not value:
+            return ''.join(reversed(out))
+
+
+class Int:
+    """Non-negative integer, packed in base 36."""
+
+    def pack(self, value: int) -> str:
+        return _to_base36(int(value))
+
+    def unpack(self, text: str) -> int:
+        return int(text, 36)
+
+
+class Cents:
+    """Money amount, packed as whole cents in base 36 and unpacked as a float."""
+
+    def pack(self, value: float) -> str:
+        return _to_base36(round(value * 100))
+
+    def unpack(self, text: str) -> float:
+        return int(text, 36) / 100
+
+
+class Str:
+    """Short free-form text (e.g. a payment method key). Only the last field may contain ':'."""
+
+    def pack(self, value: str) -> str:
+        return value
+
+    def unpack(self, text: str) -> str:
+        return text
+
+
+class Folder:
+    """A stock folder, packed as its 8-character id from the stock index instead of its name."""
+
+    def pack(self, value: str) -> str:
+        return folder_id(value)
+
+    def unpack(self, text: str) -> str:
+        name = stock_index.folder_by_id(text)
+        if name is None:
+            raise CallbackError(f"Unknown folder id '{text}'")
+        return name
+
+
+Field = Any  # Int | Cents | Str | Folder
+
+_specs: Dict[str, "CallbackSpec"] = {}
+
+
+class CallbackSpec:
+    """
+    A typed callback payload: 'tag:field:field'. Tags are short and unique, so a button
+    like confirm-purchase takes ~20 bytes whatever the folder is called, and decoding is
+    one dict lookup on the tag instead of trying every known prefix in turn.
+    """
+
+    def __init__(self, tag: str, **fields: Field):
+        if SEP in tag or tag in _specs:
+            raise ValueError(f"Invalid or duplicate callback tag '{tag}'")
+        self.tag = tag
+        self.fields: Tuple[Tuple[str, Field], ...] = tuple(fields.items())
+        _specs[tag] = self
+
+    def pack(self, *values: Any) -> str:
+        if len(values) != len(self.fields):
+            raise CallbackError(f"'{self.tag}' takes {len(self.fields)} value(s), got {len(values)}")
+        data = SEP.join((self.tag, *(field.pack(value) for (_, field), value in zip(self.fields, values))))
+        if len(data.encode()) > MAX_CALLBACK_BYTES:
+            raise CallbackError(f"Callback data '{data}' exceeds {MAX_CALLBACK_BYTES} bytes")
+        return data
+
+    def unpack(self, payload: str) -> Dict[str, Any]:
+        parts = payload.split(SEP, len(self.fields) - 1) if self.fields else []
+        if len(parts) != len(self.fields):
+            raise CallbackError(f"Malformed '{self.tag}' payload '{payload}'")
+        try:
+            return {name: field.unpack(part) for (name, field), part in zip(self.fields, parts)}
+        except ValueError as e:
+            raise CallbackError(str(e)) from e
+
+    def __repr__(self) -> str:
+        return f"CallbackSpec({self.tag!r})"
+
+
+def decode(data: Optional[str]) -> Optional[Tuple[CallbackSpec, Dict[str, Any]]]:
+    """
+    Returns (spec, values) for encoded callbacks and None for plain string callbacks
+    (e.g. 'main_menu_start'), which keep going through the usual F.data filters.
+    """
+    if not data:
+        return None
+    tag, sep, payload = data.partition(SEP)
+    spec = _specs.get(tag)
+    if spec is None or not sep:
+        return None
+    return spec, spec.unpack(payload)
+
+
+class CallbackTable:
+    """
+    Routes encoded callbacks to their handlers with one dict lookup. Registers a single
+    handler on the router, so a router holding any number of these costs one filter
+    check per callback. Handlers receive the decoded fields as keyword arguments,
+    alongside the usual middleware data (state, session, user, ...).
+    """
+
+    def __init__(self, router: Router):
+        self._handlers: Dict[CallbackSpec, HandlerObject] = {}
+        router.callback_query.register(self._dispatch, self._owns)
+
+    def __call__(self, spec: CallbackSpec) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+        def register(handler: Callable[..., Awaitable[Any]]):
+            if spec in self._handlers:
+                raise ValueError(f"{spec!r} already has a handler")
+            self._handlers[spec] = HandlerObject(callback=handler)
+            return handler
+        return register
+
+    def _owns(self, cb: CallbackQuery, callback_spec: Optional[CallbackSpec] = None) -> bool:
+        return callback_spec in self._handlers
+
+    async def _dispatch(self, cb: CallbackQuery, callback_spec: CallbackSpec, **data: Any) -> Any:
+        return await self._handlers[callback_spec].call(cb, callback_spec=callback_spec, **data)
@@ -1,12 +1,121 @@
-import io, zipfile
-from typing import List
-from database.models import Account
-
-def create_session_zip_file(accounts: List[Account]) -> io.BytesIO:
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for acc in accounts:
-            # --- THIS IS THE FIX: The session_file is already bytes, no need to encode. ---
-            zf.writestr(f"{acc.phone_number}.session", acc.session_file)
-    zip_buffer.seek(0)
-    return zip_buffer
\ No newline at end of file
+import asyncio
+import io
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from aiogram.types import BufferedInputFile, FSInputFile, InputFile
+
+# Bots may upload documents up to 50 MB; keep headroom for ZIP metadata and the multipart envelope.
+PART_SIZE_LIMIT = 45 * 1024 * 1024
+# Archives whose raw input is below this are built in memory, larger ones in a temp file.
+SPOOL_THRESHOLD = 8 * 1024 * 1024
+# Session files are small SQLite databases made mostly of zero-filled pages: level 1 already
+# gets almost all of the size reduction of the default level 6 at a fraction of the CPU time.
+COMPRESS_LEVEL = 1
+# Local file header + central directory entry, excluding the file name.
+_ZIP_ENTRY_OVERHEAD = 128
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="delivery")
+
+DeliveryFile = Tuple[str, bytes]  # (file name inside the archive, contents)
+
+
+@dataclass
+class DeliveryPart:
+    index: int
+    total: int
+    filename: str
+    file_count: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+    def input_file(self) -> InputFile:
+        if self.path:
+            return FSInputFile(self.path, filename=self.filename)
+        return BufferedInputFile(self.data, filename=self.filename)
+
+    def cleanup(self):
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self.data = None
+
+
+def display_name(folder_name: str) -> str:
+    """Human-readable product name of a stock folder, used for captions and archive names."""
+    return folder_name.replace('+', '').replace('_', ' ').title()
+
+
+def plan_parts(files: Sequence[DeliveryFile], limit: int = PART_SIZE_LIMIT) -> List[List[DeliveryFile]]:
+    """
+    Splits files into archives that stay under `limit`. Uses the raw size as the bound
+    (deflate never grows a file by more than a few bytes), so no part has to be rebuilt.
+    """
+    parts, current, current_size = [], [], 0
+    for name, data in files:
+        size = len(data) + 2 * len(name.encode()) + _ZIP_ENTRY_OVERHEAD
+        if current and current_size + size > limit:
+            parts.append(current)
+            current, current_size = [], 0
+        current.append((name, data))
+        current_size += size
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _build_part(files: List[DeliveryFile]) -> Tuple[Optional[bytes], Optional[str]]:
+    """Writes one archive. Runs in the delivery worker pool, never on the event loop."""
+    raw_size = sum(len(data) for _, data in files)
+    if raw_size < SPOOL_THRESHOLD:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
+            for name, data in files:
+                zf.writestr(name, data)
+        return buffer.getvalue(), None
+
+    fd, path = tempfile.mkstemp(prefix="delivery_", suffix=".zip")
+    try:
+        with os.fdopen(fd, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
+            for name, data in files:
+                zf.writestr(name, data)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return None, path
+
+
+def _discard_result(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is None:
+        _, path = future.result()
+        if path:
+            os.unlink(path)
+
+
+async def build_delivery(files: Sequence[DeliveryFile], base_name: str) -> AsyncIterator[DeliveryPart]:
+    """
+    Yields the archives for an order in order, each as soon as it is built. All parts
+    are queued on the worker pool up front, so the next part is compressed while the
+    caller uploads the current one. The caller must call part.cleanup() after use.
+    """
+    groups = plan_parts(files)
+    total = len(groups)
+    loop = asyncio.get_running_loop()
+    futures = [loop.run_in_executor(_executor, _build_part, group) for group in groups]
+    consumed = 0
+    try:
+        for index, (group, future) in enumerate(zip(groups, futures), start=1):
+            data, path = await future
+            consumed = index
+            filename = f"{base_name}.zip" if total == 1 else f"{base_name}_part{index}of{total}.zip"
+            yield DeliveryPart(index=index, total=total, filename=filename, file_count=len(group), data=data, path=path)
+    finally:
+        for future in futures[consumed:]:
+            future.add_done_callback(_discard_result)
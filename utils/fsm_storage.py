@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from config_data.config import config
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = 600  # Seconds between sweeps of expired rows (SQLite; Redis expires keys itself).
+
+# (expires_at as a wall-clock timestamp, state, data)
+Record = Tuple[float, Optional[str], Dict[str, Any]]
+
+
+class StateBackend(ABC):
+    """
+    Durable key/value store for serialized FSM records. Keys expire after the TTL given
+    on each save; expired keys must never be returned by load().
+    """
+
+    @abstractmethod
+    async def load(self, key: str) -> Optional[Tuple[str, float]]:
+        """Returns (value, expires_at) or None if the key is missing or expired."""
+
+    @abstractmethod
+    async def save(self, key: str, value: str, ttl: float):
+        """Stores the value under key for ttl seconds, replacing any previous one."""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Removes the key; a missing key is not an error."""
+
+    async def purge_expired(self) -> int:
+        """Drops expired keys, for backends without native expiry. Returns how many."""
+        return 0
+
+    async def close(self):
+        pass
+
+
+class SqliteStateBackend(StateBackend):
+    """
+    One row per key in a standalone SQLite file (WAL mode), kept apart from the main
+    database so FSM writes never wait on its write lock. All calls run on a single
+    worker thread, which also keeps writes for a key in the order they were issued.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fsm-sqlite')
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS fsm_state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_fsm_state_expires_at ON fsm_state (expires_at)")
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _load(self, key: str) -> Optional[Tuple[str, float]]:
+        return self._connection().execute(
+            "SELECT value, expires_at FROM fsm_state WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+
+    def _save(self, key: str, value: str, ttl: float):
+        self._connection().execute(
+            "INSERT INTO fsm_state (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, value, time.time() + ttl),
+        )
+
+    def _delete(self, key: str):
+        self._connection().execute("DELETE FROM fsm_state WHERE key = ?", (key,))
+
+    def _purge(self) -> int:
+        return self._connection().execute("DELETE FROM fsm_state WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def load(self, key: str) -> Optional[Tuple[str, float]]:
+        return await self._run(self._load, key)
+
+    async def save(self, key: str, value: str, ttl: float):
+        await self._run(self._save, key, value, ttl)
+
+    async def delete(self, key: str):
+        await self._run(self._delete, key)
+
+    async def purge_expired(self) -> int:
+        return await self._run(self._purge)
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Keys in any server speaking the Redis protocol, with expiry left to the server
+    (SET ... PX). Requires the redis package (installed with aiogram[redis]).
+    """
+
+    def __init__(self, url: str):
+        from redis.asyncio import Redis
+        self._redis = Redis.from_url(url)
+
+    async def load(self, key: str) -> Optional[Tuple[str, float]]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            value, ttl_ms = await pipe.get(key).pttl(key).execute()
+        if value is None or ttl_ms == -2:
+            return None
+        expires_at = time.time() + ttl_ms / 1000 if ttl_ms >= 0 else float('inf')
+        return value.decode(), expires_at
+
+    async def save(self, key: str, value: str, ttl: float):
+        await self._redis.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str):
+        await self._redis.delete(key)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+@dataclass(frozen=True)
+class FsmStorageStats:
+    size: int
+    hits: int
+    misses: int
+    writes: int
+    write_errors: int
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class PersistentStorage(BaseStorage):
+    """
+    aiogram FSM storage over a StateBackend, with a bounded LRU front cache.
+
+    State and data are kept as one JSON record per key and every write renews its TTL,
+    so a conversation left idle for `ttl` seconds is forgotten. Keys with no state and
+    no data are deleted rather than stored, and lookups that found nothing are cached
+    too, since the FSM middleware reads the state on every update. Writes go to the
+    cache first and then to the backend; if the backend write fails the cache still
+    holds the new value for this process. The cache assumes this process is the only
+    writer; set cache_size to 0 when several bot processes share a Redis backend.
+    """
+
+    def __init__(self, backend: StateBackend, ttl: float, cache_size: int, purge_interval: float = PURGE_INTERVAL):
+        self.backend = backend
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.purge_interval = purge_interval
+        self.key_builder = DefaultKeyBuilder(prefix='fsm', with_bot_id=True, with_destiny=True)
+        self._cache: "OrderedDict[str, Record]" = OrderedDict()
+        self._hits = self._misses = self._writes = self._write_errors = 0
+        self._purge_task: Optional[asyncio.Task] = None
+
+    # --- Records ---
+    async def _read(self, key: StorageKey) -> Tuple[str, Record]:
+        k = self.key_builder.build(key)
+        record = self._cache.get(k)
+        if record is not None:
+            if record[0] > time.time():
+                self._cache.move_to_end(k)
+                self._hits += 1
+                return k, record
+            del self._cache[k]
+        self._misses += 1
+        loaded = await self.backend.load(k)
+        if k in self._cache:
+            # Written by another update while this one was loading; that value is newer
+            return k, self._cache[k]
+        if loaded is None:
+            record = (time.time() + self.ttl, None, {})
+        else:
+            value, expires_at = loaded
+            stored = json.loads(value)
+            record = (expires_at, stored.get('state'), stored.get('data') or {})
+        self._remember(k, record)
+        return k, record
+
+    def _remember(self, k: str, record: Record):
+        if not self.cache_size:
+            return
+        self._cache[k] = record
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _write(self, k: str, state: Optional[str], data: Dict[str, Any]):
+        self._remember(k, (time.time() + self.ttl, state, data))
+        self._writes += 1
+        try:
+            if state is None and not data:
+                await self.backend.delete(k)
+            else:
+                await self.backend.save(k, json.dumps({'state': state, 'data': data}, ensure_ascii=False), self.ttl)
+        except Exception as e:
+            self._write_errors += 1
+            logger.error(f"FSM state write for '{k}' failed: {e}")
+
+    # --- BaseStorage ---
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, (_, _, data) = await self._read(key)
+        await self._write(k, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, (_, state, _) = await self._read(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k, (_, state, _) = await self._read(key)
+        await self._write(k, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, (_, _, data) = await self._read(key)
+        return dict(data)
+
+    async def close(self) -> None:
+        self.stop()
+        await self.backend.close()
+
+    # --- Metrics and lifecycle ---
+    def stats(self) -> FsmStorageStats:
+        return FsmStorageStats(len(self._cache), self._hits, self._misses, self._writes, self._write_errors)
+
+    def start(self):
+        if not self._purge_task or self._purge_task.done():
+            self._purge_task = asyncio.create_task(self._purge_periodically())
+
+    def stop(self):
+        if self._purge_task and not self._purge_task.done():
+            self._purge_task.cancel()
+
+    async def _purge_periodically(self):
+        while True:
+            try:
+                purged = await self.backend.purge_expired()
+                if purged:
+                    logger.info(f"Purged {purged} expired FSM state(s).")
+            except Exception as e:
+                logger.error(f"FSM state purge failed: {e}")
+            await asyncio.sleep(self.purge_interval)
+
+
+def create_fsm_storage(backend: str, path: str, redis_url: str, ttl: float, cache_size: int) -> PersistentStorage:
+    if backend == 'sqlite':
+        return PersistentStorage(SqliteStateBackend(path), ttl, cache_size)
+    if backend == 'redis':
+        return PersistentStorage(RedisStateBackend(redis_url), ttl, cache_size)
+    raise ValueError(f"Unknown FSM_STORAGE backend: {backend!r} (expected 'sqlite' or 'redis')")
+
+
+# Global instance
+fsm_storage = create_fsm_storage(config.fsm_storage, config.fsm_storage_path, config.fsm_redis_url, config.fsm_ttl, config.fsm_cache_size)
@@ -1,29 +1,146 @@
+import asyncio
 import json
+import logging
 import os
-from typing import Dict
+import string
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Resolved from this file, not the working directory
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "locales")
+DEFAULT_LANG = "en"
+RELOAD_INTERVAL = 2  # Seconds between checks of the locale files' mtimes.
+
+_formatter = string.Formatter()
+
+
+class Template:
+    """
+    A string with format fields, parsed once when the catalog is built. Templates whose
+    fields are all plain names ('{name}', no conversion or format spec) are rendered by
+    joining pre-split literals, which skips re-parsing the template on every call;
+    anything else goes through format_map().
+    """
+    __slots__ = ('text', 'fields', 'literals', 'names')
+
+    def __init__(self, text: str, parsed: List[Tuple[str, Optional[str], Optional[str], Optional[str]]]):
+        self.text = text
+        self.fields = frozenset(field.split('.')[0].split('[')[0] for _, field, _, _ in parsed if field is not None)
+        simple = all(field is None or (field.isidentifier() and not spec and not conversion) for _, field, spec, conversion in parsed)
+        self.literals = tuple(literal for literal, _, _, _ in parsed) if simple else None
+        self.names = tuple(field for _, field, _, _ in parsed) if simple else None
+
+    def render(self, kwargs: dict) -> str:
+        if self.literals is None:
+            return self.text.format_map(kwargs)
+        out = []
+        for literal, name in zip(self.literals, self.names):
+            out.append(literal)
+            if name is not None:
+                out.append(str(kwargs[name]))
+        return "".join(out)
+
+
+Entry = Union[str, Template]
+Catalog = Dict[str, Dict[str, Entry]]
+Signature = Tuple[Tuple[str, int, int], ...]
+
+
+def compile_entry(text: str) -> Entry:
+    """Constant strings are stored already formatted ('{{' unescaped); others as Templates."""
+    parsed = list(_formatter.parse(text))
+    if all(field is None for _, field, _, _ in parsed):
+        return "".join(literal for literal, _, _, _ in parsed)
+    return Template(text, parsed)
+
+
+def compile_catalog(raw: Dict[str, Dict[str, str]]) -> Catalog:
+    """Builds {lang: {key: entry}} with the English fallback already applied to every language."""
+    base = raw.get(DEFAULT_LANG, {})
+    catalog = {}
+    for lang, strings in raw.items():
+        merged = dict(base)
+        merged.update({key: value for key, value in strings.items() if value})
+        catalog[lang] = {key: compile_entry(value) for key, value in merged.items()}
+    catalog.setdefault(DEFAULT_LANG, {})
+    return catalog
+
+
+def _signature(locales_dir: str) -> Signature:
+    entries = []
+    for filename in sorted(os.listdir(locales_dir)):
+        if filename.endswith(".json"):
+            st = os.stat(os.path.join(locales_dir, filename))
+            entries.append((filename, st.st_mtime_ns, st.st_size))
+    return tuple(entries)
+
+
+def _read_locales(locales_dir: str) -> Tuple[Dict[str, Dict[str, str]], Signature]:
+    signature = _signature(locales_dir)
+    locales = {}
+    for filename, _, _ in signature:
+        with open(os.path.join(locales_dir, filename), "r", encoding="utf-8") as f:
+            locales[filename.split(".")[0]] = json.load(f)
+    return locales, signature
+
 
 class Translator:
-    def __init__(self, locales_dir: str = "locales"):
-        self.locales = {}
-        for filename in os.listdir(locales_dir):
-            if filename.endswith(".json"):
-                lang_code = filename.split(".")[0]
-                with open(os.path.join(locales_dir, filename), "r", encoding="utf-8") as f:
-                    self.locales[lang_code] = json.load(f)
+    """
+    Serves strings from a catalog compiled at load time: English fallbacks are merged
+    into every language up front, and strings without placeholders are returned as is,
+    without a format() call. The catalog is swapped in one assignment when the JSON
+    files change (see start()), so readers never see a half-loaded state.
+    """
+
+    def __init__(self, locales_dir: str = LOCALES_DIR):
+        self.locales_dir = locales_dir
+        self.locales: Dict[str, Dict[str, str]] = {}
+        self._catalog: Catalog = {DEFAULT_LANG: {}}
+        self._signature: Signature = ()
+        # Bumped on every (re)load so derived tables know when to rebuild
+        self.generation = 0
+        self._listeners: List[Callable[[], None]] = []
+        self._reload_task: Optional[asyncio.Task] = None
+        self.load()
+
+    def load(self):
+        locales, signature = _read_locales(self.locales_dir)
+        self._install(locales, signature)
+
+    def _install(self, locales: Dict[str, Dict[str, str]], signature: Signature):
+        catalog = compile_catalog(locales)
+        self.locales, self._catalog, self._signature = locales, catalog, signature
+        self.generation += 1
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Locale reload listener failed: {e}")
+
+    def add_reload_listener(self, listener: Callable[[], None]):
+        """Registers a callback run after every reload (e.g. to drop cached keyboards)."""
+        self._listeners.append(listener)
 
     def get_string(self, key: str, lang: str, **kwargs) -> str:
         """
         Get a translated string. Falls back to English if the key is not found
-        in the target language.
+        in the target language. Raises KeyError naming the placeholders that were
+        not given a value.
         """
-        lang = lang if lang in self.locales else "en"
-        base_string = self.locales.get(lang, {}).get(key)
-
-        if not base_string:
-            # Fallback to English
-            base_string = self.locales.get("en", {}).get(key, f"_{key}_")
-
-        return base_string.format(**kwargs)
+        strings = self._catalog.get(lang) or self._catalog[DEFAULT_LANG]
+        entry = strings.get(key)
+        if entry is None:
+            return f"_{key}_"
+        if entry.__class__ is str:
+            return entry
+        try:
+            return entry.render(kwargs)
+        except KeyError:
+            missing = sorted(entry.fields - kwargs.keys())
+            if not missing:
+                raise
+            raise KeyError(f"String '{key}' ({lang}) needs placeholder value(s) for: {', '.join(missing)}") from None
 
     def get_all_translations(self, key: str) -> Dict[str, str]:
         """
@@ -32,8 +149,39 @@ class Translator:
         """
         return {
             lang: self.get_string(key, lang)
-            for lang in self.locales
+            for lang in self._catalog
         }
 
+    # --- Hot reload ---
+    async def reload_if_changed(self) -> bool:
+        signature = await asyncio.to_thread(_signature, self.locales_dir)
+        if signature == self._signature:
+            return False
+        try:
+            locales, signature = await asyncio.to_thread(_read_locales, self.locales_dir)
+        except (OSError, ValueError) as e:
+            # Typically a file caught mid-save; keep serving the current catalog
+            logger.error(f"Could not reload locales: {e}")
+            return False
+        self._install(locales, signature)
+        logger.info(f"Locales reloaded: {', '.join(sorted(locales))}.")
+        return True
+
+    def start(self, interval: float = RELOAD_INTERVAL):
+        if not self._reload_task or self._reload_task.done():
+            self._reload_task = asyncio.create_task(self._watch(interval))
+
+    def stop(self):
+        if self._reload_task and not self._reload_task.done():
+            self._reload_task.cancel()
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                logger.error(f"Locale reload check failed: {e}")
+
 # Global instance
-translator = Translator()
\ No newline at end of file
+translator = Translator()
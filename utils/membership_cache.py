@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+from config_data.config import config
+
+MEMBER_STATUSES = frozenset({'creator', 'administrator', 'member'})
+
+
+def channel_key(channel: str) -> str:
+    """Normalises a configured channel ('@Name' or '-100...') for use as a cache key."""
+    return channel.strip().lower()
+
+
+@dataclass(frozen=True)
+class MembershipStats:
+    size: int
+    hits: int
+    misses: int
+    api_errors: int
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class MembershipCache:
+    """
+    Per (user, channel) subscription results with separate TTLs: positive results are
+    kept longer than negative ones, so a user who just joined is let in quickly even if
+    no chat_member update arrives. Bounded as an LRU.
+    """
+
+    def __init__(self, positive_ttl: float, negative_ttl: float, max_size: int):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, bool]]" = OrderedDict()
+        self._hits = self._misses = self._api_errors = 0
+
+    def get(self, user_id: int, channel: str) -> Optional[bool]:
+        key = (user_id, channel_key(channel))
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry[1]
+
+    def set(self, user_id: int, channel: str, is_member: bool):
+        key = (user_id, channel_key(channel))
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, is_member)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int, channels: Iterable[str]):
+        for channel in channels:
+            self._entries.pop((user_id, channel_key(channel)), None)
+
+    def record_api_error(self):
+        self._api_errors += 1
+
+    def stats(self) -> MembershipStats:
+        return MembershipStats(len(self._entries), self._hits, self._misses, self._api_errors)
+
+
+# Global instance
+membership_cache = MembershipCache(
+    positive_ttl=config.subscription_positive_ttl,
+    negative_ttl=config.subscription_negative_ttl,
+    max_size=config.subscription_cache_size,
+)
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import update
+
+from database.engine import async_session_factory
+from database.models import User
+from utils.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 30  # Seconds between batched profile updates.
+
+
+class ProfileRefresher:
+    """
+    Collects username/first_name changes seen on incoming updates and writes them in
+    one bulk UPDATE per interval instead of a transaction per request. Only the latest
+    values per user are kept.
+    """
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending: Dict[int, Tuple[Optional[str], str]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def note(self, user: User, username: Optional[str], first_name: str):
+        """Queues a refresh if the stored profile differs from the one Telegram sent."""
+        if user.username != username or user.first_name != first_name:
+            self._pending[user.user_id] = (username, first_name)
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        try:
+            async with async_session_factory() as session:
+                await session.execute(
+                    update(User),
+                    [{'user_id': user_id, 'username': username, 'first_name': first_name} for user_id, (username, first_name) in batch.items()],
+                )
+                await session.commit()
+        except Exception:
+            # Keep newer values noted meanwhile; retry the rest next time
+            self._pending = {**batch, **self._pending}
+            raise
+        for user_id in batch:
+            user_cache.invalidate(user_id)
+        return len(batch)
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                refreshed = await self.flush()
+                if refreshed:
+                    logger.info(f"Refreshed {refreshed} user profile(s).")
+            except Exception as e:
+                logger.error(f"Profile refresh failed: {e}")
+
+
+# Global instance
+profile_refresher = ProfileRefresher()
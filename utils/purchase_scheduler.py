@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from config_data.config import config
+
+logger = logging.getLogger(__name__)
+
+IDLE_TIMEOUT = 60  # Seconds a lane's worker waits for work before the lane is dropped.
+
+T = TypeVar("T")
+Job = Tuple[Callable[[], Awaitable], asyncio.Future, float]
+
+
+class QueueFull(Exception):
+    """Raised immediately when a key's purchase queue is at its limit."""
+
+
+@dataclass
+class LaneMetrics:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    max_depth: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def avg_wait(self) -> float:
+        started = self.completed + self.failed
+        return self.total_wait / started if started else 0.0
+
+
+@dataclass(frozen=True)
+class LaneSnapshot:
+    key: str
+    depth: int
+    active: bool
+    metrics: LaneMetrics
+
+
+class _Lane:
+    def __init__(self, key: str, max_queue: int):
+        self.key = key
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.active = False
+        self.worker: Optional[asyncio.Task] = None
+
+
+class PurchaseScheduler:
+    """
+    Runs purchase jobs one at a time per key (a stock folder), in arrival order.
+
+    Each key that has work gets its own bounded queue and worker task, so a flash sale
+    on one folder queues up behind itself while other folders keep going in parallel.
+    A full queue rejects at once instead of piling up waiters. Lanes are dropped after
+    IDLE_TIMEOUT without work; their metrics are kept.
+    """
+
+    def __init__(self, max_queue: int, idle_timeout: float = IDLE_TIMEOUT):
+        self.max_queue = max_queue
+        self.idle_timeout = idle_timeout
+        self._lanes: Dict[str, _Lane] = {}
+        self._metrics: Dict[str, LaneMetrics] = {}
+
+    async def run(self, key: str, job: Callable[[], Awaitable[T]]) -> T:
+        """Queues job() on the key's lane and waits for its result. Raises QueueFull."""
+        metrics = self._metrics.setdefault(key, LaneMetrics())
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane(key, self.max_queue)
+            lane.worker = asyncio.create_task(self._work(lane))
+        if lane.queue.full():
+            metrics.rejected += 1
+            raise QueueFull(key)
+
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.put_nowait((job, future, time.monotonic()))
+        metrics.submitted += 1
+        metrics.max_depth = max(metrics.max_depth, lane.queue.qsize())
+        return await future
+
+    async def _work(self, lane: _Lane):
+        metrics = self._metrics[lane.key]
+        while True:
+            try:
+                job, future, queued_at = await asyncio.wait_for(lane.queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # No await between this check and the removal, so run() cannot slip a job in
+                if lane.queue.empty():
+                    del self._lanes[lane.key]
+                    return
+                continue
+            if future.cancelled():
+                continue
+
+            wait = time.monotonic() - queued_at
+            metrics.total_wait += wait
+            metrics.max_wait = max(metrics.max_wait, wait)
+            lane.active = True
+            try:
+                result = await job()
+            except Exception as e:
+                metrics.failed += 1
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                metrics.completed += 1
+                if not future.cancelled():
+                    future.set_result(result)
+            finally:
+                lane.active = False
+
+    def snapshot(self) -> Tuple[LaneSnapshot, ...]:
+        """Current depth and cumulative metrics per key, busiest first."""
+        snapshots = []
+        for key, metrics in self._metrics.items():
+            lane = self._lanes.get(key)
+            snapshots.append(LaneSnapshot(key, lane.queue.qsize() if lane else 0, bool(lane and lane.active), metrics))
+        return tuple(sorted(snapshots, key=lambda s: (-s.depth, -s.metrics.submitted)))
+
+    def stop(self):
+        for lane in list(self._lanes.values()):
+            if lane.worker and not lane.worker.done():
+                lane.worker.cancel()
+        self._lanes.clear()
+
+
+# Global instance
+purchase_scheduler = PurchaseScheduler(max_queue=config.purchase_queue_limit)
@@ -0,0 +1,140 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HOLD_TTL = 300  # Seconds a quantity selection keeps its units reserved without activity.
+
+
+@dataclass(frozen=True)
+class Hold:
+    user_id: int
+    folder_name: str
+    quantity: int
+    expires_at: float
+    seq: int
+
+
+class ReservationManager:
+    """
+    Short-lived, per-user stock holds taken while a buyer is choosing a quantity.
+
+    Each user has at most one hold. Expiry is driven by a min-heap of
+    (expires_at, seq, user_id); refreshing a hold pushes a new entry and the old one
+    is skipped lazily when popped, so the sweeper only ever looks at the entries that
+    are actually due instead of scanning every reservation.
+    """
+
+    def __init__(self, ttl: float = HOLD_TTL):
+        self.ttl = ttl
+        self._holds: Dict[int, Hold] = {}
+        self._held: Dict[str, int] = {}
+        self._heap: List[Tuple[float, int, int]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._sweeper_task: Optional[asyncio.Task] = None
+
+    # --- Queries ---
+    def held(self, folder_name: str) -> int:
+        return self._held.get(folder_name, 0)
+
+    def get(self, user_id: int) -> Optional[Hold]:
+        return self._holds.get(user_id)
+
+    def available(self, folder_name: str, stock: int, user_id: Optional[int] = None) -> int:
+        """Stock left for `user_id` once everyone else's holds are subtracted."""
+        held = self.held(folder_name)
+        own = self._holds.get(user_id)
+        if own and own.folder_name == folder_name:
+            held -= own.quantity
+        return max(stock - held, 0)
+
+    def available_counts(self, counts: Mapping[str, int]) -> Dict[str, int]:
+        """{folder: stock} with all active holds subtracted; sold-out folders are dropped."""
+        result = {}
+        for folder_name, stock in counts.items():
+            left = stock - self._held.get(folder_name, 0)
+            if left > 0:
+                result[folder_name] = left
+        return result
+
+    # --- Mutations ---
+    def hold(self, user_id: int, folder_name: str, quantity: int, stock: int) -> int:
+        """
+        Reserves up to `quantity` units of a folder for a user, replacing any previous
+        hold and restarting its TTL. Returns the quantity actually held.
+        """
+        quantity = min(quantity, self.available(folder_name, stock, user_id))
+        self._drop(user_id)
+        if quantity <= 0:
+            return 0
+        seq = next(self._seq)
+        expires_at = time.monotonic() + self.ttl
+        self._holds[user_id] = Hold(user_id, folder_name, quantity, expires_at, seq)
+        self._held[folder_name] = self._held.get(folder_name, 0) + quantity
+        heapq.heappush(self._heap, (expires_at, seq, user_id))
+        if len(self._heap) > 2 * len(self._holds) + 64:
+            self._compact()
+        self._wakeup.set()
+        return quantity
+
+    def release(self, user_id: int) -> Optional[Hold]:
+        """Releases a user's hold (cancel, purchase, navigation away)."""
+        return self._drop(user_id)
+
+    def _drop(self, user_id: int) -> Optional[Hold]:
+        hold = self._holds.pop(user_id, None)
+        if hold:
+            left = self._held[hold.folder_name] - hold.quantity
+            if left:
+                self._held[hold.folder_name] = left
+            else:
+                del self._held[hold.folder_name]
+        return hold
+
+    def _compact(self):
+        """Drops superseded heap entries once they outnumber the live holds."""
+        self._heap = [(h.expires_at, h.seq, h.user_id) for h in self._holds.values()]
+        heapq.heapify(self._heap)
+
+    def expire_due(self, now: Optional[float] = None) -> int:
+        """Releases every hold whose TTL has passed. Returns how many were released."""
+        now = time.monotonic() if now is None else now
+        released = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, user_id = heapq.heappop(self._heap)
+            hold = self._holds.get(user_id)
+            if hold and hold.seq == seq:
+                self._drop(user_id)
+                released += 1
+        return released
+
+    # --- Sweeper ---
+    def start(self):
+        if not self._sweeper_task or self._sweeper_task.done():
+            self._sweeper_task = asyncio.create_task(self._sweep())
+
+    def stop(self):
+        if self._sweeper_task and not self._sweeper_task.done():
+            self._sweeper_task.cancel()
+
+    async def _sweep(self):
+        while True:
+            self._wakeup.clear()
+            released = self.expire_due()
+            if released:
+                logger.info(f"Released {released} expired stock hold(s).")
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Global instance
+reservations = ReservationManager()
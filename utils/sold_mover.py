@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete
+
+from database.engine import async_session_factory
+from database.models import SoldFileMove
+from utils.stock_index import stock_index
+from utils.stock_manager import ACCOUNTS_DIR
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000  # Journal entries moved per worker pass.
+RETRY_INTERVAL = 30  # Seconds before retrying entries whose move failed.
+
+Move = Tuple[int, str, str]  # (journal id, folder, file name)
+
+
+def _move_batch(root: str, moves: List[Move]) -> Tuple[List[int], int]:
+    """
+    Moves a batch of files into their folder's 'sold' subfolder. Runs in one worker thread.
+
+    Returns the journal ids that are settled and the number of failures. A source file
+    that no longer exists counts as settled: either it was moved before a crash (the
+    journal entry outlived the rename) or it was removed by hand. Either way it is out
+    of stock. The second case is logged, because it also means the wrong file or folder
+    may have been journaled.
+    """
+    settled, failed = [], 0
+    sold_dirs: Dict[str, str] = {}
+    for move_id, folder, file_name in moves:
+        sold_dir = sold_dirs.get(folder)
+        if sold_dir is None:
+            sold_dir = sold_dirs[folder] = os.path.join(root, folder, "sold")
+            try:
+                os.mkdir(sold_dir)
+            except (FileExistsError, FileNotFoundError):
+                pass
+        try:
+            os.replace(os.path.join(root, folder, file_name), os.path.join(sold_dir, file_name))
+        except FileNotFoundError:
+            if not os.path.exists(os.path.join(sold_dir, file_name)):
+                logger.warning(f"Sold file {folder}/{file_name} is missing from stock and was never moved to sold; settling its journal entry.")
+        except OSError as e:
+            logger.error(f"Error moving sold file {folder}/{file_name}: {e}")
+            failed += 1
+            continue
+        settled.append(move_id)
+    return settled, failed
+
+
+class SoldFileMover:
+    """
+    Moves sold session files out of stock, driven by the sold_file_moves journal.
+
+    Purchases write the journal entries in the same transaction that marks the accounts
+    sold; this worker then drains the journal in large batches, each moved by a single
+    thread job and cleared with a single DELETE. Entries left by a crash are simply
+    picked up on the first pass after startup.
+    """
+
+    def __init__(self, root: str = ACCOUNTS_DIR, batch_size: int = BATCH_SIZE):
+        self.root = root
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self):
+        """Signals that new journal entries were committed."""
+        self._wakeup.set()
+
+    async def drain_once(self) -> Tuple[int, int]:
+        """Processes one batch of the journal. Returns (entries settled, entries failed)."""
+        async with async_session_factory() as session:
+            moves = (await session.execute(
+                select(SoldFileMove.id, SoldFileMove.folder, SoldFileMove.file_name)
+                .order_by(SoldFileMove.id)
+                .limit(self.batch_size)
+            )).all()
+            if not moves:
+                return 0, 0
+
+            settled, failed = await asyncio.to_thread(_move_batch, self.root, [tuple(m) for m in moves])
+            if settled:
+                await session.execute(delete(SoldFileMove).where(SoldFileMove.id.in_(settled)))
+                await session.commit()
+
+        by_folder = defaultdict(list)
+        settled_ids = set(settled)
+        for move_id, folder, file_name in moves:
+            if move_id in settled_ids:
+                by_folder[folder].append(file_name)
+        for folder, names in by_folder.items():
+            stock_index.discard(folder, names)
+        return len(settled), failed
+
+    # --- Worker ---
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def _run(self):
+        # The first pass replays whatever a previous run left in the journal
+        while True:
+            self._wakeup.clear()
+            try:
+                settled, failed = await self.drain_once()
+            except Exception as e:
+                logger.error(f"Sold file mover pass failed: {e}")
+                settled, failed = 0, 1
+            if settled and not failed and settled == self.batch_size:
+                continue  # Backlog left; keep draining
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=RETRY_INTERVAL if failed else None)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Global instance
+sold_mover = SoldFileMover()
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from database.engine import async_session_factory
+from database.stock_counters import repair_stock_counts
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 900  # Seconds between drift checks.
+
+
+class StockDriftChecker:
+    """
+    Periodically compares Country.stock_count with the accounts table and repairs any
+    counter that drifted (e.g. rows edited by hand, or a database from before the
+    counters were maintained). Runs once right at startup.
+    """
+
+    def __init__(self, interval: float = CHECK_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self) -> List[int]:
+        async with async_session_factory() as session:
+            repaired = await repair_stock_counts(session)
+            await session.commit()
+        if repaired:
+            logger.warning(f"Repaired drifted stock counters for country id(s): {repaired}")
+        return repaired
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Stock drift check failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# Global instance
+stock_drift_checker = StockDriftChecker()
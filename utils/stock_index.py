@@ -0,0 +1,387 @@
+import asyncio
+import base64
+import ctypes
+import ctypes.util
+import hashlib
+import itertools
+import logging
+import os
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from utils.stock_manager import ACCOUNTS_DIR, get_country_code_str, get_country_name, get_flag_emoji
+
+logger = logging.getLogger(__name__)
+
+RESCAN_INTERVAL = 60  # Safety-net rescan, in seconds. Cheap: unchanged folders are skipped by mtime.
+DEBOUNCE_DELAY = 0.5  # Coalesce bursts of inotify events (e.g. a bulk copy) into one refresh.
+
+# inotify(7) constants
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_product_file(file_name: str) -> bool:
+    """True for files that count as sellable stock inside a category folder."""
+    return file_name.endswith('.session') and not file_name.startswith('sold')
+
+
+def folder_id(folder_name: str) -> str:
+    """Stable 8-character id for a folder name, used in callback data instead of the name."""
+    digest = hashlib.blake2b(folder_name.encode(), digest_size=6).digest()
+    return base64.urlsafe_b64encode(digest).decode()
+
+
+# Seeded from the clock so versions never repeat across restarts
+_versions = itertools.count(time.time_ns() // 1000)
+
+
+@dataclass(frozen=True)
+class FolderStock:
+    """
+    Immutable view of one category folder. Replaced, never mutated, when the folder
+    changes; each replacement gets a new version, which snapshots are keyed by.
+    """
+    name: str
+    country_name: str
+    country_code: str
+    flag: str
+    products: Tuple[str, ...]
+    mtime_ns: int
+    version: int = field(default_factory=lambda: next(_versions), compare=False)
+
+    @property
+    def count(self) -> int:
+        return len(self.products)
+
+
+def scan_folder(root: str, folder_name: str) -> Optional[FolderStock]:
+    """Lists a single category folder. Returns None if it is not a directory."""
+    folder_path = os.path.join(root, folder_name)
+    try:
+        mtime_ns = os.stat(folder_path).st_mtime_ns
+        with os.scandir(folder_path) as it:
+            products = sorted(entry.name for entry in it if is_product_file(entry.name))
+    except (NotADirectoryError, FileNotFoundError):
+        return None
+    code = get_country_code_str(folder_name)
+    return FolderStock(
+        name=folder_name,
+        country_name=get_country_name(folder_name),
+        country_code=code,
+        flag=get_flag_emoji(code),
+        products=tuple(products),
+        mtime_ns=mtime_ns,
+    )
+
+
+def _discard_from(folders: Dict[str, FolderStock], folder_name: str, gone: frozenset):
+    """Replaces a folder in `folders` with a copy that lacks the `gone` products."""
+    folder = folders.get(folder_name)
+    if not folder:
+        return
+    folders[folder_name] = FolderStock(
+        name=folder.name,
+        country_name=folder.country_name,
+        country_code=folder.country_code,
+        flag=folder.flag,
+        products=tuple(p for p in folder.products if p not in gone),
+        mtime_ns=-1,  # Force the next rescan to re-list it in case the move failed.
+    )
+
+
+class StockIndex:
+    """
+    Process-wide, in-memory index of the stock folders under ACCOUNTS_DIR.
+
+    Built once at startup and then kept current by inotify events (Linux) plus a
+    periodic rescan as a fallback. Readers never touch the disk: every lookup is a
+    dict access on an immutable snapshot that writers swap in atomically.
+    """
+
+    def __init__(self, root: str = ACCOUNTS_DIR, rescan_interval: float = RESCAN_INTERVAL):
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self._folders: Dict[str, FolderStock] = {}
+        self._counts: Mapping[str, int] = MappingProxyType({})
+        self._by_country: Mapping[str, Tuple[str, ...]] = MappingProxyType({})
+        self._by_id: Mapping[str, str] = MappingProxyType({})
+        self._scan_lock = asyncio.Lock()  # One scan at a time; discard() never takes it
+        self._recent_discards: List[Tuple[str, frozenset]] = []  # discard() calls made during the running scan
+        self._rescan_task: Optional[asyncio.Task] = None
+        self._watcher: Optional[_InotifyWatcher] = None
+
+    # --- Readers (O(1), no I/O) ---
+    def counts(self) -> Mapping[str, int]:
+        """{folder_name: count} for every folder that has stock, in name order."""
+        return self._counts
+
+    def get(self, folder_name: str) -> Optional[FolderStock]:
+        return self._folders.get(folder_name)
+
+    def products(self, folder_name: str) -> Tuple[str, ...]:
+        folder = self._folders.get(folder_name)
+        return folder.products if folder else ()
+
+    def count(self, folder_name: str) -> int:
+        folder = self._folders.get(folder_name)
+        return folder.count if folder else 0
+
+    def folders(self) -> Tuple[FolderStock, ...]:
+        return tuple(self._folders.values())
+
+    def folders_for_country(self, country_name: str) -> Tuple[str, ...]:
+        """Names of the folders that map to a country, in name order."""
+        return self._by_country.get(country_name, ())
+
+    def folder_by_id(self, fid: str) -> Optional[str]:
+        """Resolves a folder_id() back to the folder name, if the folder still exists."""
+        return self._by_id.get(fid)
+
+    # --- Writers ---
+    # Directory listings run in a worker thread and only return what they found; the
+    # new snapshot is swapped in on the event loop, so discard() never waits for a scan.
+    def _publish(self, folders: Dict[str, FolderStock]):
+        ordered = dict(sorted(folders.items()))
+        self._folders = ordered
+        by_country: Dict[str, Tuple[str, ...]] = {}
+        for name, f in ordered.items():
+            by_country[f.country_name] = by_country.get(f.country_name, ()) + (name,)
+        self._by_country = MappingProxyType(by_country)
+        by_id: Dict[str, str] = {}
+        for name in ordered:
+            fid = folder_id(name)
+            if fid in by_id:
+                logger.error(f"Folder id collision between '{by_id[fid]}' and '{name}'; '{name}' is not addressable.")
+                continue
+            by_id[fid] = name
+        self._by_id = MappingProxyType(by_id)
+        self._counts = MappingProxyType({name: f.count for name, f in ordered.items() if f.count})
+
+    def _scan_all(self, current: Mapping[str, FolderStock]) -> Optional[Dict[str, FolderStock]]:
+        """Lists every folder (blocking). Folders whose mtime is unchanged keep their snapshot."""
+        if not os.path.isdir(self.root):
+            logger.warning(f"Stock directory '{self.root}' not found. Creating it.")
+            os.makedirs(self.root, exist_ok=True)
+        folders = {}
+        try:
+            with os.scandir(self.root) as it:
+                entries = [entry for entry in it if entry.is_dir() and entry.name.lower() != 'sold']
+        except OSError as e:
+            logger.error(f"Error scanning stock directory '{self.root}': {e}")
+            return None
+        for entry in entries:
+            try:
+                previous = current.get(entry.name)
+                if previous and previous.mtime_ns == entry.stat().st_mtime_ns:
+                    folders[entry.name] = previous
+                    continue
+                folder = scan_folder(self.root, entry.name)
+            except OSError as e:
+                logger.error(f"Error scanning folder '{entry.name}': {e}")
+                continue
+            if folder:
+                folders[entry.name] = folder
+        return folders
+
+    def _scan_some(self, folder_names: Iterable[str]) -> Dict[str, Optional[FolderStock]]:
+        """Lists the given folders (blocking); None for those that are gone."""
+        found = {}
+        for name in folder_names:
+            try:
+                found[name] = scan_folder(self.root, name)
+            except OSError as e:
+                logger.error(f"Error scanning folder '{name}': {e}")
+        return found
+
+    async def rescan(self):
+        """Full rescan. Folders whose mtime is unchanged keep their existing snapshot."""
+        async with self._scan_lock:
+            self._recent_discards = []
+            folders = await asyncio.to_thread(self._scan_all, self._folders)
+            if folders is None:
+                return
+            # Sold files can still be on disk when listed; keep them out
+            for folder_name, gone in self._recent_discards:
+                _discard_from(folders, folder_name, gone)
+            self._publish(folders)
+
+    async def refresh_folders(self, folder_names: Iterable[str]):
+        """Re-lists only the given folders (used by the inotify watcher)."""
+        async with self._scan_lock:
+            self._recent_discards = []
+            found = await asyncio.to_thread(self._scan_some, list(folder_names))
+            folders = dict(self._folders)
+            for name, folder in found.items():
+                if folder:
+                    folders[name] = folder
+                else:
+                    folders.pop(name, None)
+            for folder_name, gone in self._recent_discards:
+                if folder_name in found:
+                    _discard_from(folders, folder_name, gone)
+            self._publish(folders)
+
+    def discard(self, folder_name: str, product_names: Iterable[str]):
+        """Drops sold products from the index immediately, ahead of the filesystem event."""
+        gone = frozenset(product_names)
+        if not gone:
+            return
+        if self._scan_lock.locked():
+            self._recent_discards.append((folder_name, gone))
+        if folder_name not in self._folders:
+            return
+        folders = dict(self._folders)
+        _discard_from(folders, folder_name, gone)
+        self._publish(folders)
+
+    # --- Lifecycle ---
+    async def start(self):
+        """Builds the index off the event loop and starts the watchers."""
+        await self.rescan()
+        total = sum(self._counts.values())
+        logger.info(f"Stock index built: {len(self._counts)} folder(s), {total} product(s).")
+        watcher = _InotifyWatcher(self)
+        if watcher.start(asyncio.get_running_loop()):
+            self._watcher = watcher
+            logger.info("Stock index is watching for filesystem changes (inotify).")
+        else:
+            logger.info("inotify unavailable; stock index relies on periodic rescans.")
+        if not self._rescan_task or self._rescan_task.done():
+            self._rescan_task = asyncio.create_task(self._rescan_periodically())
+
+    def stop(self):
+        if self._watcher:
+            self._watcher.close()
+            self._watcher = None
+        if self._rescan_task and not self._rescan_task.done():
+            self._rescan_task.cancel()
+
+    async def _rescan_periodically(self):
+        while True:
+            await asyncio.sleep(self.rescan_interval)
+            try:
+                await self.rescan()
+                if self._watcher:
+                    self._watcher.sync_watches()
+            except Exception as e:
+                logger.error(f"Periodic stock rescan failed: {e}")
+
+
+class _InotifyWatcher:
+    """Minimal ctypes inotify reader hooked into the asyncio loop. Linux only."""
+
+    _ROOT_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    _FOLDER_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF
+
+    def __init__(self, index: StockIndex):
+        self.index = index
+        self._libc = None
+        self._fd = -1
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._root_wd = -1
+        self._wd_to_folder: Dict[int, str] = {}
+        self._dirty: set = set()
+        self._full_rescan = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> bool:
+        if not sys.platform.startswith('linux'):
+            return False
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            return False
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return False
+        if fd < 0:
+            return False
+        self._libc, self._fd, self._loop = libc, fd, loop
+        self._root_wd = self._add_watch(self.index.root, self._ROOT_MASK)
+        if self._root_wd < 0:
+            self.close()
+            return False
+        self.sync_watches()
+        loop.add_reader(fd, self._on_readable)
+        return True
+
+    def close(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        if self._fd >= 0:
+            if self._loop:
+                self._loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watch(self, path: str, mask: int) -> int:
+        return self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+
+    def sync_watches(self):
+        """Adds watches for folders that appeared since the last call."""
+        if self._fd < 0:
+            return
+        watched = set(self._wd_to_folder.values())
+        for folder in self.index.folders():
+            if folder.name not in watched:
+                wd = self._add_watch(os.path.join(self.index.root, folder.name), self._FOLDER_MASK)
+                if wd >= 0:
+                    self._wd_to_folder[wd] = folder.name
+
+    def _on_readable(self):
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size + name_len
+            if mask & IN_Q_OVERFLOW or wd == self._root_wd:
+                self._full_rescan = True
+            elif mask & IN_IGNORED:
+                self._wd_to_folder.pop(wd, None)
+                self._full_rescan = True
+            elif wd in self._wd_to_folder:
+                self._dirty.add(self._wd_to_folder[wd])
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(DEBOUNCE_DELAY, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        if self._flush_task and not self._flush_task.done():
+            # One refresh at a time; the events keep until the running one is done
+            self._flush_handle = self._loop.call_later(DEBOUNCE_DELAY, self._schedule_flush)
+            return
+        self._flush_task = self._loop.create_task(self._flush())
+
+    async def _flush(self):
+        dirty, self._dirty = self._dirty, set()
+        full, self._full_rescan = self._full_rescan, False
+        try:
+            if full:
+                await self.index.rescan()
+                self.sync_watches()
+            elif dirty:
+                await self.index.refresh_folders(dirty)
+        except Exception as e:
+            logger.error(f"Stock index refresh failed: {e}")
+
+
+# Global instance
+stock_index = StockIndex()
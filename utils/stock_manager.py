@@ -1,4 +1,3 @@
-import os
 import re
 
 ACCOUNTS_DIR = "accounts"
@@ -32,25 +31,8 @@ def get_flag_emoji(country_code_str: str) -> str:
 
 def get_live_stock() -> dict:
     """
-    Scans the live filesystem in the /accounts directory and returns a dictionary 
-    of {folder_name: count} for all folders that contain .session files.
+    Returns a dictionary of {folder_name: count} for all folders under /accounts
+    that contain .session files. Served from the in-memory stock index.
     """
-    if not os.path.isdir(ACCOUNTS_DIR):
-        print(f"Warning: Stock directory '{ACCOUNTS_DIR}' not found. Creating it.")
-        os.makedirs(ACCOUNTS_DIR)
-        return {}
-
-    stock = {}
-    try:
-        for entry in os.scandir(ACCOUNTS_DIR):
-            if entry.is_dir():
-                try:
-                    session_files = [f for f in os.listdir(entry.path) if f.endswith('.session')]
-                    if session_files:
-                        stock[entry.name] = len(session_files)
-                except OSError: continue
-    except OSError as e:
-        print(f"Error scanning stock directory '{ACCOUNTS_DIR}': {e}")
-        return {}
-        
-    return stock
\ No newline at end of file
+    from utils.stock_index import stock_index
+    return dict(stock_index.counts())
\ No newline at end of file
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from config_data.config import config
+from utils.stock_index import FolderStock
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL = 300  # Seconds between sweeps of expired leases.
+
+
+@dataclass(frozen=True)
+class SnapshotStats:
+    snapshots: int
+    leases: int
+    products: int
+
+
+class StockSnapshots:
+    """
+    Shared, versioned product lists for the browse and purchase flow.
+
+    Opening a folder pins the stock index's current FolderStock (immutable, one per
+    folder per change) under its version, and the user's FSM data keeps only that
+    snapshot id plus the chosen index. Every user who opened the same folder version
+    shares one tuple of names, and indexes stay valid however the folder changes
+    meanwhile.
+
+    Each user holds one lease, so a snapshot's reference count is the number of users
+    on it. A lease ends when the user opens another folder or leaves the flow, or
+    after `ttl` seconds without use (the FSM state's own lifetime). A snapshot is
+    dropped when its last lease goes. Snapshot ids are not persisted: after a restart
+    they resolve to None, and the user is shown the current list again.
+    """
+
+    def __init__(self, ttl: float, sweep_interval: float = SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._snapshots: Dict[int, FolderStock] = {}
+        self._refs: Dict[int, int] = {}
+        self._leases: Dict[int, Tuple[int, float]] = {}  # user_id -> (snapshot_id, expires_at)
+        self._sweeper_task: Optional[asyncio.Task] = None
+
+    def pin(self, user_id: int, folder: FolderStock) -> int:
+        """Leases `folder` to the user, replacing their previous lease. Returns the snapshot id."""
+        snapshot_id = folder.version
+        lease = self._leases.get(user_id)
+        if lease and lease[0] == snapshot_id:
+            self._leases[user_id] = (snapshot_id, time.monotonic() + self.ttl)
+            return snapshot_id
+        self.release(user_id)
+        self._snapshots.setdefault(snapshot_id, folder)
+        self._refs[snapshot_id] = self._refs.get(snapshot_id, 0) + 1
+        self._leases[user_id] = (snapshot_id, time.monotonic() + self.ttl)
+        return snapshot_id
+
+    def get(self, user_id: int, snapshot_id: Optional[int]) -> Optional[FolderStock]:
+        """The user's leased snapshot, renewing the lease; None if it is not theirs or has gone."""
+        lease = self._leases.get(user_id)
+        if not lease or lease[0] != snapshot_id:
+            return None
+        self._leases[user_id] = (snapshot_id, time.monotonic() + self.ttl)
+        return self._snapshots.get(snapshot_id)
+
+    def release(self, user_id: int):
+        lease = self._leases.pop(user_id, None)
+        if lease:
+            self._unref(lease[0])
+
+    def _unref(self, snapshot_id: int):
+        refs = self._refs.get(snapshot_id, 0) - 1
+        if refs > 0:
+            self._refs[snapshot_id] = refs
+        else:
+            self._refs.pop(snapshot_id, None)
+            self._snapshots.pop(snapshot_id, None)
+
+    def sweep(self) -> int:
+        """Ends expired leases. Returns how many."""
+        now = time.monotonic()
+        expired = [user_id for user_id, (_, expires_at) in self._leases.items() if expires_at <= now]
+        for user_id in expired:
+            self.release(user_id)
+        return len(expired)
+
+    def stats(self) -> SnapshotStats:
+        return SnapshotStats(len(self._snapshots), len(self._leases), sum(s.count for s in self._snapshots.values()))
+
+    # --- Lifecycle ---
+    def start(self):
+        if not self._sweeper_task or self._sweeper_task.done():
+            self._sweeper_task = asyncio.create_task(self._sweep_periodically())
+
+    def stop(self):
+        if self._sweeper_task and not self._sweeper_task.done():
+            self._sweeper_task.cancel()
+
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                expired = self.sweep()
+                if expired:
+                    logger.info(f"Released {expired} expired stock snapshot lease(s); {len(self._snapshots)} snapshot(s) live.")
+            except Exception as e:
+                logger.error(f"Stock snapshot sweep failed: {e}")
+
+
+# Global instance
+stock_snapshots = StockSnapshots(ttl=config.fsm_ttl)
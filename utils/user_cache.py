@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from config_data.config import config
+from database.models import User
+
+_COLUMN_KEYS = tuple(attr.key for attr in inspect(User).column_attrs)
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class UserCache:
+    """
+    Bounded LRU cache of user rows with a TTL, used by UserMiddleware to skip the
+    per-update SELECT.
+
+    Entries are plain column snapshots, never ORM instances, so no object is shared
+    between sessions: get() builds a fresh detached User that the caller attaches to
+    its own session. Code that changes a user must call put() (write-through) or
+    invalidate() after committing; the TTL only bounds staleness from writers outside
+    this process.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._hits = self._misses = self._evictions = self._expirations = self._invalidations = 0
+
+    def get(self, user_id: int) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self._misses += 1
+            return None
+        expires_at, values = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self._expirations += 1
+            self._misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self._hits += 1
+        user = User(**values)
+        make_transient_to_detached(user)  # Persistent identity, no pending changes
+        return user
+
+    def put(self, user: User):
+        """Stores the user's current column values. Partially loaded instances are skipped."""
+        loaded = inspect(user).dict
+        if any(key not in loaded for key in _COLUMN_KEYS):
+            self.invalidate(user.user_id)
+            return
+        self._entries[user.user_id] = (time.monotonic() + self.ttl, {key: loaded[key] for key in _COLUMN_KEYS})
+        self._entries.move_to_end(user.user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def invalidate(self, user_id: int):
+        if self._entries.pop(user_id, None) is not None:
+            self._invalidations += 1
+
+    def stats(self) -> CacheStats:
+        return CacheStats(len(self._entries), self._hits, self._misses, self._evictions, self._expirations, self._invalidations)
+
+
+# Global instance
+user_cache = UserCache(max_size=config.user_cache_size, ttl=config.user_cache_ttl)